@@ -22,7 +22,7 @@ class ApiBookRepository implements BookRepository {
   @override
   Future<Book?> getBookById(String bookId) async {
     try {
-      final response = await _apiService.get('/books/$bookId');
+      final response = await _apiService.get('/books/$bookId?content=1');
       if (response.isSuccess && response.data != null) {
         return Book.fromApiJson(response.data);
       }
@@ -6,7 +6,8 @@ class BookService {
 
   async getAllBooks() {
     try {
-      const response = await fetch(`${this.API_BASE_URL}/books`);
+      // 管理介面需要完整的摘要資料：書籍列表預設不含 summaries，摘要內容分離時需 content=1 才含內容
+      const response = await fetch(`${this.API_BASE_URL}/books/?fields=*&content=1`);
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
@@ -20,7 +21,7 @@ class BookService {
 
   async getBookById(id) {
     try {
-      const response = await fetch(`${this.API_BASE_URL}/books/${id}`);
+      const response = await fetch(`${this.API_BASE_URL}/books/${id}?content=1`);
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional, Any, Dict
-from services.json_storage import storage
+from services.async_storage import async_storage
+from services.query import parse_fields
+from api.caching import make_etag, is_not_modified, not_modified, cached_json, dumps
 
 router = APIRouter(prefix="/books", tags=["books"])
 
+# 批次匯入設定
+BULK_BATCH_SIZE = 500
+MAX_BULK_ERRORS = 100
+# 單行（單本書籍）上限；超過的行記為失敗並略過，不會累積在記憶體中
+MAX_BULK_LINE_BYTES = 16 * 1024 * 1024
+
 class SummaryModel(BaseModel):
     id: Optional[str] = None
     bookId: Optional[str] = None
@@ -39,22 +48,154 @@ class BookUpdateModel(BaseModel):
     isPublished: Optional[bool] = None
 
 @router.get("/", response_model=List[Dict[str, Any]])
-async def get_all_books():
-    """獲取所有書籍"""
+async def get_all_books(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="每頁筆數，未提供時回傳全部"),
+    cursor: Optional[str] = Query(None, description="上一頁回應標頭 X-Next-Cursor 的值"),
+    isPublished: Optional[bool] = None,
+    isCompleted: Optional[bool] = None,
+    fields: Optional[str] = Query(None, description="逗號分隔的欄位；預設不含 summaries，* 代表全部欄位"),
+    content: bool = Query(False, description="1 時摘要含完整內容（啟用摘要內容分離時預設只有存根）"),
+):
+    """獲取書籍列表（支援分頁、篩選與欄位投影）"""
     try:
-        books = storage.get_all_books()
-        return books
+        # 版本號須在讀取資料前取得，確保 ETag 不會比內容新
+        etag = make_etag("books", await async_storage.get_books_version(), str(request.query_params))
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
+        # 以 ETag 快取序列化後的內容，直接回傳位元組（不經 response_model 驗證）
+        headers = {}
+
+        async def load():
+            books, next_cursor = await async_storage.list_books(
+                limit=limit,
+                cursor=cursor,
+                is_published=isPublished,
+                is_completed=isCompleted,
+                fields=parse_fields(fields),
+                with_content=content
+            )
+            if next_cursor:
+                headers["X-Next-Cursor"] = next_cursor
+            return books
+
+        return await cached_json(etag, load, headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取書籍列表失敗: {str(e)}")
 
+@router.get("/export")
+async def export_books():
+    """以 NDJSON 串流匯出所有書籍（含摘要），逐本輸出不會建立完整列表"""
+    def generate():
+        for book in async_storage.sync.iter_books():
+            yield dumps(book) + b"\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="books.ndjson"'}
+    )
+
+@router.post("/bulk")
+async def bulk_import_books(request: Request):
+    """以 NDJSON 串流批次匯入書籍，每行一本，逐行驗證並分批寫入"""
+    created = 0
+    failed = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[Dict[str, Any]] = []
+    line_number = 0
+
+    def reject_line(error: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_BULK_ERRORS:
+            errors.append({"line": line_number, "error": error})
+
+    def handle_line(line: bytes):
+        nonlocal line_number
+        line_number += 1
+        if not line.strip():
+            return
+        try:
+            book = BookModel.model_validate_json(line)
+            batch.append(book.model_dump(exclude_unset=True))
+        except ValidationError as e:
+            reject_line(str(e))
+
+    async def flush():
+        nonlocal created, batch
+        if batch:
+            created += len(await async_storage.create_books(batch))
+            batch = []
+
+    try:
+        # 尚未遇到換行的部分（可能跨多個 chunk）；只在新的 chunk 中尋找換行，不重複掃描已接收的內容
+        tail: List[bytes] = []
+        tail_size = 0
+        oversized = False
+        async for chunk in request.stream():
+            start = 0
+            while True:
+                end = chunk.find(b"\n", start)
+                if end < 0:
+                    break
+                if oversized or tail_size + end - start > MAX_BULK_LINE_BYTES:
+                    line_number += 1
+                    reject_line(f"單行超過 {MAX_BULK_LINE_BYTES} 位元組")
+                else:
+                    handle_line(b"".join(tail) + chunk[start:end] if tail else chunk[start:end])
+                tail, tail_size, oversized = [], 0, False
+                start = end + 1
+                if len(batch) >= BULK_BATCH_SIZE:
+                    await flush()
+            if start < len(chunk) and not oversized:
+                tail.append(chunk[start:])
+                tail_size += len(chunk) - start
+                if tail_size > MAX_BULK_LINE_BYTES:
+                    # 丟棄已接收的部分，略過到下一個換行
+                    tail, tail_size, oversized = [], 0, True
+        if oversized:
+            line_number += 1
+            reject_line(f"單行超過 {MAX_BULK_LINE_BYTES} 位元組")
+        else:
+            handle_line(b"".join(tail))
+        await flush()
+
+        return {
+            "message": "批次匯入完成",
+            "created": created,
+            "failed": failed,
+            "errors": errors
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批次匯入失敗（已匯入 {created} 本）: {str(e)}")
+
 @router.get("/{book_id}", response_model=Dict[str, Any])
-async def get_book_by_id(book_id: str):
+async def get_book_by_id(
+    book_id: str,
+    request: Request,
+    content: bool = Query(False, description="1 時摘要含完整內容（啟用摘要內容分離時預設只有存根）"),
+):
     """根據ID獲取特定書籍"""
     try:
-        book = storage.get_book_by_id(book_id)
-        if not book:
+        version = await async_storage.get_book_version(book_id)
+        if version is None:
             raise HTTPException(status_code=404, detail="書籍不存在")
-        return book
+        etag = make_etag("book", book_id, version, "content" if content else "")
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+
+        async def load():
+            book = await async_storage.get_book_by_id(book_id, with_content=content)
+            if not book:
+                raise HTTPException(status_code=404, detail="書籍不存在")
+            return book
+
+        # 每本書依版本快取序列化後的內容
+        return await cached_json(etag, load)
     except HTTPException:
         raise
     except Exception as e:
@@ -70,7 +211,7 @@ async def create_book(book: BookModel):
         if 'summaries' in book_data:
             book_data['summaries'] = [summary.model_dump(exclude_unset=True) if hasattr(summary, 'model_dump') else summary for summary in book_data['summaries']]
 
-        new_book = storage.create_book(book_data)
+        new_book = await async_storage.create_book(book_data)
         return new_book
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"創建書籍失敗: {str(e)}")
@@ -80,8 +221,7 @@ async def update_book(book_id: str, book: BookUpdateModel):
     """更新書籍"""
     try:
         # 檢查書籍是否存在
-        existing_book = storage.get_book_by_id(book_id)
-        if not existing_book:
+        if not await async_storage.book_exists(book_id):
             raise HTTPException(status_code=404, detail="書籍不存在")
 
         # 只更新提供的欄位
@@ -91,10 +231,8 @@ async def update_book(book_id: str, book: BookUpdateModel):
         if 'summaries' in book_data:
             book_data['summaries'] = [summary.model_dump(exclude_unset=True) if hasattr(summary, 'model_dump') else summary for summary in book_data['summaries']]
 
-        # 合併現有資料和新資料
-        updated_data = {**existing_book, **book_data}
-
-        updated_book = storage.update_book(book_id, updated_data)
+        # 在儲存層鎖內合併現有資料和新資料
+        updated_book = await async_storage.update_book(book_id, book_data, merge=True)
         if not updated_book:
             raise HTTPException(status_code=500, detail="更新書籍失敗")
 
@@ -108,7 +246,7 @@ async def update_book(book_id: str, book: BookUpdateModel):
 async def delete_book(book_id: str):
     """刪除書籍"""
     try:
-        success = storage.delete_book(book_id)
+        success = await async_storage.delete_book(book_id)
         if not success:
             raise HTTPException(status_code=404, detail="書籍不存在")
         return {"message": "書籍刪除成功", "deleted_id": book_id}
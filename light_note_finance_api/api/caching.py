@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+try:
+    import orjson
+except ImportError:  # 未安裝 orjson 時使用標準 json
+    orjson = None
+
+# 書籍與摘要讀取的快取策略：允許快取，但每次使用前需以 ETag 重新驗證
+CACHE_CONTROL = "public, max-age=0, must-revalidate"
+# 檔名唯一、內容不會改變的檔案：快取一年且不需重新驗證
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# 已序列化回應的快取上限
+SERIALIZED_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "512"))
+SERIALIZED_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_MB", "64")) * 1024 * 1024
+
+
+def make_etag(*parts: str) -> str:
+    """由版本資訊產生強 ETag"""
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match 是否與目前的 ETag 相符"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def is_not_modified_since(request: Request, mtime: float) -> bool:
+    """If-Modified-Since 是否不早於檔案修改時間（有 If-None-Match 時以 ETag 為準）"""
+    header = request.headers.get("if-modified-since")
+    if not header or "if-none-match" in request.headers:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def apply_cache_headers(response: Response, etag: str, cache_control: str = CACHE_CONTROL):
+    """為回應加上 ETag 與 Cache-Control"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+def not_modified(etag: str, cache_control: str = CACHE_CONTROL) -> Response:
+    """304 Not Modified 回應"""
+    response = Response(status_code=304)
+    apply_cache_headers(response, etag, cache_control)
+    return response
+
+
+def file_response(request: Request, path: str, cache_control: str = CACHE_CONTROL,
+                  headers: Optional[Dict[str, str]] = None, media_type: Optional[str] = None) -> Response:
+    """傳送檔案並處理條件式請求
+
+    ETag/Last-Modified 由檔案 mtime 與大小產生，符合 If-None-Match 或
+    If-Modified-Since 時回傳 304。Range 請求與 pathsend（伺服器支援時以
+    零複製方式傳送）由 FileResponse 處理。
+    """
+    stat = os.stat(path)
+    response = FileResponse(
+        path, stat_result=stat, media_type=media_type,
+        headers={**(headers or {}), "Cache-Control": cache_control},
+    )
+    etag = response.headers["etag"]
+    if is_not_modified(request, etag) or is_not_modified_since(request, stat.st_mtime):
+        cached = not_modified(etag, cache_control)
+        cached.headers["Last-Modified"] = response.headers["last-modified"]
+        for name, value in (headers or {}).items():
+            cached.headers[name] = value
+        return cached
+    return response
+
+
+def dumps(data: Any) -> bytes:
+    """序列化為 UTF-8 JSON；有 orjson 時使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class SerializedCache:
+    """ETag → 已序列化 JSON 的 LRU 快取
+
+    ETag 由資料版本產生，版本變更後舊的項目不會再被查到，只會被 LRU 淘汰。
+    """
+
+    def __init__(self, max_entries: int = SERIALIZED_CACHE_ENTRIES, max_bytes: int = SERIALIZED_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, Dict[str, str]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, body: bytes, headers: Dict[str, str]):
+        # 單一回應過大時不快取，避免擠掉其他項目
+        if len(body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = (body, headers)
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+serialized_cache = SerializedCache()
+
+
+def json_response(body: bytes, etag: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Response:
+    """以已序列化的 JSON 建立回應，不經過 response_model 驗證與 jsonable_encoder"""
+    response = Response(content=body, media_type="application/json", headers=headers)
+    if etag is not None:
+        apply_cache_headers(response, etag)
+    return response
+
+
+async def cached_json(etag: str, load: Callable[[], Awaitable[Any]],
+                      headers: Optional[Dict[str, str]] = None) -> Response:
+    """讀取端點的快速路徑：以 ETag 查詢已序列化的內容，未命中時呼叫 load 並快取
+
+    load 可在 headers 中加入需要一併快取的回應標頭（例如 X-Next-Cursor）。
+    """
+    cached = serialized_cache.get(etag)
+    if cached is None:
+        headers = {} if headers is None else headers
+        body = dumps(await load())
+        cached = (body, dict(headers))
+        serialized_cache.put(etag, *cached)
+    return json_response(cached[0], etag, cached[1])
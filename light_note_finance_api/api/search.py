@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import Optional, Any, Dict
+import time
+from services.async_storage import async_storage
+from services.query import encode_cursor, decode_cursor
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+@router.get("", response_model=Dict[str, Any])
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="搜尋字詞，以空白分隔多個詞（須全部出現）"),
+    limit: int = Query(20, ge=1, le=100, description="每頁筆數"),
+    cursor: Optional[str] = Query(None, description="上一頁回應標頭 X-Next-Cursor 的值"),
+):
+    """全文搜尋書籍標題、簡介與摘要內容，依相關度排序並標示命中的詞"""
+    try:
+        start = time.perf_counter()
+        offset = decode_cursor(cursor)
+        hits, total = await async_storage.search(q, offset, limit)
+        if offset + limit < total:
+            response.headers["X-Next-Cursor"] = encode_cursor(offset + limit)
+        return {
+            "query": q,
+            "total": total,
+            "hits": hits,
+            "tookMs": round((time.perf_counter() - start) * 1000, 2),
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"搜尋失敗: {str(e)}")
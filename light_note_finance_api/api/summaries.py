@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict
-from services.json_storage import storage
+from services.async_storage import async_storage
+from api.caching import make_etag, is_not_modified, not_modified, cached_json
 
 router = APIRouter(prefix="/summaries", tags=["summaries"])
 
@@ -13,6 +14,9 @@ class SummaryCreateModel(BaseModel):
     isRead: bool = False
     readAt: Optional[str] = None
 
+class SummaryBatchModel(BaseModel):
+    summaries: List[SummaryCreateModel]
+
 class SummaryUpdateModel(BaseModel):
     content: Optional[str] = None
     order: Optional[int] = None
@@ -22,35 +26,42 @@ class SummaryUpdateModel(BaseModel):
     readAt: Optional[str] = None
 
 @router.get("/book/{book_id}", response_model=List[Dict[str, Any]])
-async def get_summaries_by_book_id(book_id: str):
+async def get_summaries_by_book_id(book_id: str, request: Request):
     """獲取特定書籍的所有摘要"""
     try:
-        # 檢查書籍是否存在
-        book = storage.get_book_by_id(book_id)
-        if not book:
+        # 檢查書籍是否存在，並以書籍版本作為 ETag
+        version = await async_storage.get_book_version(book_id)
+        if version is None:
             raise HTTPException(status_code=404, detail="書籍不存在")
+        etag = make_etag("summaries", book_id, version)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
 
-        summaries = storage.get_summaries_by_book_id(book_id)
-        return summaries
+        return await cached_json(etag, lambda: async_storage.get_summaries_by_book_id(book_id))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取摘要列表失敗: {str(e)}")
 
 @router.get("/{book_id}/{summary_id}", response_model=Dict[str, Any])
-async def get_summary_by_id(book_id: str, summary_id: str):
+async def get_summary_by_id(book_id: str, summary_id: str, request: Request):
     """獲取特定摘要"""
     try:
-        # 檢查書籍是否存在
-        book = storage.get_book_by_id(book_id)
-        if not book:
+        # 檢查書籍是否存在，並以書籍版本作為 ETag
+        version = await async_storage.get_book_version(book_id)
+        if version is None:
             raise HTTPException(status_code=404, detail="書籍不存在")
+        etag = make_etag("summary", book_id, summary_id, version)
+        if is_not_modified(request, etag):
+            return not_modified(etag)
 
-        summary = storage.get_summary_by_id(book_id, summary_id)
-        if not summary:
-            raise HTTPException(status_code=404, detail="摘要不存在")
+        async def load():
+            summary = await async_storage.get_summary_by_id(book_id, summary_id)
+            if not summary:
+                raise HTTPException(status_code=404, detail="摘要不存在")
+            return summary
 
-        return summary
+        return await cached_json(etag, load)
     except HTTPException:
         raise
     except Exception as e:
@@ -61,12 +72,11 @@ async def create_summary(book_id: str, summary: SummaryCreateModel):
     """在特定書籍中創建新摘要"""
     try:
         # 檢查書籍是否存在
-        book = storage.get_book_by_id(book_id)
-        if not book:
+        if not await async_storage.book_exists(book_id):
             raise HTTPException(status_code=404, detail="書籍不存在")
 
         summary_data = summary.model_dump(exclude_unset=True)
-        new_summary = storage.create_summary(book_id, summary_data)
+        new_summary = await async_storage.create_summary(book_id, summary_data)
 
         if not new_summary:
             raise HTTPException(status_code=500, detail="創建摘要失敗")
@@ -77,27 +87,44 @@ async def create_summary(book_id: str, summary: SummaryCreateModel):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"創建摘要失敗: {str(e)}")
 
+@router.post("/book/{book_id}/batch", response_model=List[Dict[str, Any]])
+async def create_summaries_batch(book_id: str, batch: SummaryBatchModel):
+    """在特定書籍中批次創建摘要（單次寫入）"""
+    try:
+        # 檢查書籍是否存在
+        if not await async_storage.book_exists(book_id):
+            raise HTTPException(status_code=404, detail="書籍不存在")
+
+        summaries_data = [summary.model_dump(exclude_unset=True) for summary in batch.summaries]
+        new_summaries = await async_storage.create_summaries(book_id, summaries_data)
+
+        if new_summaries is None:
+            raise HTTPException(status_code=500, detail="批次創建摘要失敗")
+
+        return new_summaries
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批次創建摘要失敗: {str(e)}")
+
 @router.put("/{book_id}/{summary_id}", response_model=Dict[str, Any])
 async def update_summary(book_id: str, summary_id: str, summary: SummaryUpdateModel):
     """更新摘要"""
     try:
         # 檢查書籍是否存在
-        book = storage.get_book_by_id(book_id)
-        if not book:
+        if not await async_storage.book_exists(book_id):
             raise HTTPException(status_code=404, detail="書籍不存在")
 
         # 檢查摘要是否存在
-        existing_summary = storage.get_summary_by_id(book_id, summary_id)
+        existing_summary = await async_storage.get_summary_by_id(book_id, summary_id)
         if not existing_summary:
             raise HTTPException(status_code=404, detail="摘要不存在")
 
         # 只更新提供的欄位
         summary_data = summary.model_dump(exclude_unset=True)
 
-        # 合併現有資料和新資料
-        updated_data = {**existing_summary, **summary_data}
-
-        updated_summary = storage.update_summary(book_id, summary_id, updated_data)
+        # 在儲存層鎖內合併現有資料和新資料
+        updated_summary = await async_storage.update_summary(book_id, summary_id, summary_data, merge=True)
         if not updated_summary:
             raise HTTPException(status_code=500, detail="更新摘要失敗")
 
@@ -112,16 +139,15 @@ async def delete_summary(book_id: str, summary_id: str):
     """刪除摘要"""
     try:
         # 檢查書籍是否存在
-        book = storage.get_book_by_id(book_id)
-        if not book:
+        if not await async_storage.book_exists(book_id):
             raise HTTPException(status_code=404, detail="書籍不存在")
 
         # 檢查摘要是否存在
-        existing_summary = storage.get_summary_by_id(book_id, summary_id)
+        existing_summary = await async_storage.get_summary_by_id(book_id, summary_id)
         if not existing_summary:
             raise HTTPException(status_code=404, detail="摘要不存在")
 
-        success = storage.delete_summary(book_id, summary_id)
+        success = await async_storage.delete_summary(book_id, summary_id)
         if not success:
             raise HTTPException(status_code=500, detail="刪除摘要失敗")
 
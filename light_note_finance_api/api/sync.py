@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional, Any, Dict
+from services.async_storage import async_storage
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+@router.get("", response_model=Dict[str, Any])
+async def get_changes(
+    since: Optional[str] = Query(None, description="上次同步回傳的 cursor；未提供時回傳全部資料"),
+    userId: Optional[str] = Query(None, description="只回傳此使用者的資料"),
+):
+    """增量同步：回傳游標之後異動的書籍、摘要、使用者與刪除紀錄"""
+    try:
+        return await async_storage.get_changes(since=since, user_id=userId)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"同步失敗: {str(e)}")
@@ -1,28 +1,48 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request, Query, Response
 from fastapi.staticfiles import StaticFiles
 import os
+import shutil
 import time
-import random
-import io
 from pathlib import Path
+from typing import Optional
 from PIL import Image
+from services.async_storage import async_storage
+from services.images import (
+    image_processor, image_manifest, pick_variant, accepted_formats,
+    content_filename, image_references, find_orphans,
+    VARIANT_FORMATS, UNIQUE_FILENAME,
+)
+from services.file_modes import inherit_mode
+from services.query import encode_cursor, decode_cursor
+from api.upload_stream import receive_file, UploadTooLarge, UnsupportedImage
+from api.caching import file_response, CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL
 
 router = APIRouter(prefix="/upload", tags=["upload"])
+# /uploads/{filename}?w= 依寬度回傳預先產生的版本（需在 StaticFiles 掛載前註冊）
+files_router = APIRouter(tags=["upload"])
 
 # 上傳目錄設定
 UPLOAD_DIR = "uploads"
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+MAX_IMAGE_PIXELS = 50_000_000  # 約 7000x7000，避免解壓縮炸彈
+VARIANTS_DIR = os.path.join(UPLOAD_DIR, "variants")
+# 接收中的暫存檔（與 UPLOAD_DIR 同一檔案系統，完成後原子移入）
+INCOMING_DIR = os.path.join(UPLOAD_DIR, ".incoming")
+# 未被引用的圖片保留多久才回收（上傳後到儲存書籍之間尚未被引用）
+ORPHAN_GRACE_HOURS = 24
+
+# 版本檔案的 MIME 類型（部分 Python 版本的 mimetypes 不認得 .avif）
+VARIANT_MEDIA_TYPES = dict(VARIANT_FORMATS)
 
 # 確保上傳目錄存在
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
-def validate_image(file: UploadFile) -> None:
+def validate_image(filename: str) -> None:
     """驗證圖片檔案"""
     # 檢查檔案擴展名
-    file_ext = Path(file.filename).suffix.lower()
+    file_ext = Path(filename).suffix.lower()
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
@@ -30,47 +50,159 @@ def validate_image(file: UploadFile) -> None:
         )
 
 
-def generate_unique_filename(original_filename: str) -> str:
-    """生成唯一檔名"""
-    file_ext = Path(original_filename).suffix.lower()
-    unique_suffix = f"{int(time.time())}-{random.randint(10000, 99999)}"
-    return f"book-cover-{unique_suffix}{file_ext}"
+# (書籍版本, 引用表)：書籍未變更時不必重新掃描
+_references_cache = (None, {})
 
 
-@router.post("/image")
-async def upload_image(image: UploadFile = File(...)):
-    """上傳書籍封面圖片"""
-    try:
-        # 驗證檔案
-        if not image.filename:
-            raise HTTPException(status_code=400, detail="沒有選擇檔案")
+async def get_image_references() -> dict:
+    """各上傳檔案被哪些書籍引用（依 imageUrl 計算，以書籍版本快取）"""
+    global _references_cache
+    version = await async_storage.get_books_version()
+    cached_version, references = _references_cache
+    if version != cached_version:
+        references = await async_storage.run(lambda: image_references(async_storage.sync.iter_book_heads()))
+        _references_cache = (version, references)
+    return references
+
+
+async def remove_image_files(filename: str) -> int:
+    """刪除圖片、各版本與清單紀錄，回傳釋放的位元組數"""
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    freed = os.path.getsize(file_path)
+    os.remove(file_path)
+    variants_dir = os.path.join(VARIANTS_DIR, filename)
+    if os.path.isdir(variants_dir):
+        freed += sum(entry.stat().st_size for entry in os.scandir(variants_dir) if entry.is_file())
+        shutil.rmtree(variants_dir, ignore_errors=True)
+    await async_storage.run(image_manifest.remove, filename)
+    return freed
+
 
-        validate_image(image)
+def image_cache_control(filename: str) -> str:
+    """唯一檔名的圖片與其版本內容不會改變，可標記為 immutable"""
+    return IMMUTABLE_CACHE_CONTROL if UNIQUE_FILENAME.match(filename) else CACHE_CONTROL
 
-        # 讀取檔案內容
-        file_content = await image.read()
 
-        # 檢查檔案大小
-        if len(file_content) > MAX_FILE_SIZE:
+def resolve_upload(filename: str, *parts: str) -> str:
+    """取得上傳目錄內的檔案路徑；路徑不在上傳目錄內或檔案不存在時拋出 HTTPException"""
+    file_path = os.path.join(UPLOAD_DIR, filename, *parts)
+
+    # 安全檢查：確保檔案在上傳目錄內
+    if not os.path.abspath(file_path).startswith(os.path.abspath(UPLOAD_DIR) + os.sep):
+        raise HTTPException(status_code=400, detail="無效的檔案路徑")
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="圖片檔案不存在")
+    return file_path
+
+
+def variant_urls(filename: str, entry: Optional[dict]) -> list:
+    """各版本的存取網址（/uploads/{filename}?w=寬度）"""
+    if not entry:
+        return []
+    return [
+        {"width": int(width), "height": variant["height"], "url": f"/uploads/{filename}?w={width}"}
+        for width, variant in sorted(entry["variants"].items(), key=lambda item: int(item[0]))
+    ]
+
+
+async def process_variants(filename: str) -> dict:
+    """在行程池產生縮圖等版本並寫入清單；失敗時清除已產生的檔案"""
+    output_dir = os.path.join(VARIANTS_DIR, filename)
+    try:
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        entry = await image_processor.render(file_path, output_dir)
+    except Exception:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+    entry.update(size=os.path.getsize(file_path), created_at=time.time())
+    await async_storage.run(image_manifest.put, filename, entry)
+    return entry
+
+
+def inspect_image(file_path: str) -> int:
+    """驗證圖片完整性並回傳像素數；無效時拋出例外"""
+    with Image.open(file_path) as img:
+        pixels = img.width * img.height
+        img.verify()
+    return pixels
+
+
+# 文件中仍顯示為 multipart 檔案欄位 image
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["image"],
+                "properties": {"image": {"type": "string", "format": "binary"}},
+            }
+        }
+    },
+}
+
+
+@router.post("/image", openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_image(request: Request):
+    """上傳書籍封面圖片（串流寫入暫存檔，不會整個讀進記憶體）"""
+    temp_path = None
+    try:
+        # 分段接收並檢查大小與檔頭
+        try:
+            received = await receive_file(request, "image", INCOMING_DIR, MAX_FILE_SIZE)
+        except UploadTooLarge:
             raise HTTPException(
                 status_code=400,
                 detail=f"檔案過大。最大允許大小: {MAX_FILE_SIZE // (1024*1024)}MB",
             )
+        except UnsupportedImage:
+            raise HTTPException(status_code=400, detail="無效的圖片檔案")
+
+        # 驗證檔案
+        if received is not None:
+            temp_path = received.path
+        if received is None or not received.filename:
+            raise HTTPException(status_code=400, detail="沒有選擇檔案")
+
+        validate_image(received.filename)
 
         # 驗證是否為有效圖片
         try:
-            img = Image.open(io.BytesIO(file_content))
-            img.verify()  # 驗證圖片完整性
+            pixels = await async_storage.run(inspect_image, temp_path)
         except Exception:
             raise HTTPException(status_code=400, detail="無效的圖片檔案")
 
-        # 生成唯一檔名
-        filename = generate_unique_filename(image.filename)
-        file_path = os.path.join(UPLOAD_DIR, filename)
+        # 檢查圖片尺寸
+        if pixels > MAX_IMAGE_PIXELS:
+            raise HTTPException(status_code=400, detail="圖片尺寸過大")
 
-        # 儲存檔案
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        # 以內容雜湊命名：相同圖片只存一份，網址也相同
+        filename = content_filename(received.sha256, received.image_type)
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        try:
+            # 已存在時更新修改時間，避免剛被重新引用的孤兒圖片在書籍儲存前被 gc 刪除
+            os.utime(file_path)
+            duplicate = True
+        except FileNotFoundError:
+            duplicate = False
+
+        # 原子移入上傳目錄（已存在相同內容時直接丟棄暫存檔）
+        if duplicate:
+            os.remove(temp_path)
+        else:
+            inherit_mode(temp_path, file_path)
+            os.replace(temp_path, file_path)
+        temp_path = None
+
+        # 產生縮圖、列表與詳細頁版本（WebP/JPEG，去除中繼資料）
+        entry = image_manifest.get(filename) if duplicate else None
+        if entry is None:
+            try:
+                entry = await process_variants(filename)
+            except Exception:
+                if not duplicate:
+                    os.remove(file_path)
+                raise HTTPException(status_code=400, detail="無效的圖片檔案")
 
         # 建構圖片URL
         relative_url = f"/uploads/{filename}"
@@ -83,12 +215,17 @@ async def upload_image(image: UploadFile = File(...)):
             "relativePath": relative_url,  # 新的相對路徑選項
             "fullUrl": full_url,  # 明確的完整URL
             "filename": filename,
+            "variants": variant_urls(filename, entry),  # 縮圖等版本
+            "deduplicated": duplicate,  # 已有相同內容的圖片
         }
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上傳失敗: {str(e)}")
+    finally:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
 
 
 @router.delete("/image/{filename}")
@@ -105,8 +242,13 @@ async def delete_image(filename: str):
         if not os.path.abspath(file_path).startswith(os.path.abspath(UPLOAD_DIR)):
             raise HTTPException(status_code=400, detail="無效的檔案路徑")
 
-        # 刪除檔案
-        os.remove(file_path)
+        # 相同內容只存一份，仍被書籍引用時不可刪除
+        book_ids = (await get_image_references()).get(filename, [])
+        if book_ids:
+            raise HTTPException(status_code=409, detail=f"圖片仍被 {len(book_ids)} 本書籍使用")
+
+        # 刪除檔案與各版本
+        await remove_image_files(filename)
 
         return {"success": True, "message": "圖片已刪除", "deleted_filename": filename}
 
@@ -116,21 +258,39 @@ async def delete_image(filename: str):
         raise HTTPException(status_code=500, detail=f"刪除失敗: {str(e)}")
 
 
-@router.get("/image/{filename}")
-async def get_image(filename: str):
-    """獲取圖片檔案"""
+@router.post("/gc")
+async def collect_orphan_images(
+    dryRun: bool = Query(False, description="只列出會刪除的圖片"),
+    graceHours: float = Query(ORPHAN_GRACE_HOURS, ge=0, description="上傳超過此時數且未被引用才刪除"),
+):
+    """回收沒有任何書籍引用的圖片"""
     try:
-        file_path = os.path.join(UPLOAD_DIR, filename)
+        references = await get_image_references()
+        orphans = await async_storage.run(find_orphans, UPLOAD_DIR, references, graceHours * 3600)
 
-        # 檢查檔案是否存在
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="圖片檔案不存在")
+        freed = 0
+        if not dryRun:
+            for filename in orphans:
+                freed += await remove_image_files(filename)
 
-        # 安全檢查：確保檔案在上傳目錄內
-        if not os.path.abspath(file_path).startswith(os.path.abspath(UPLOAD_DIR)):
-            raise HTTPException(status_code=400, detail="無效的檔案路徑")
+        return {
+            "success": True,
+            "dryRun": dryRun,
+            "deleted": orphans,
+            "freedBytes": freed,
+            "referenced": len(references),
+        }
 
-        return FileResponse(file_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"回收圖片失敗: {str(e)}")
+
+
+@router.get("/image/{filename}")
+async def get_image(filename: str, request: Request):
+    """獲取圖片檔案（原始檔案，支援條件式請求與 Range）"""
+    try:
+        file_path = resolve_upload(filename)
+        return file_response(request, file_path, image_cache_control(filename))
 
     except HTTPException:
         raise
@@ -139,34 +299,86 @@ async def get_image(filename: str):
 
 
 @router.get("/images")
-async def list_images():
-    """列出所有上傳的圖片"""
+async def list_images(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="每頁筆數，未提供時回傳全部"),
+    cursor: Optional[str] = Query(None, description="上一頁回應標頭 X-Next-Cursor 的值"),
+    sort: str = Query("created_at", description="排序欄位：created_at、size 或 filename"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="asc 或 desc"),
+):
+    """列出上傳的圖片（由圖片索引提供，不掃描上傳目錄）"""
     try:
-        if not os.path.exists(UPLOAD_DIR):
-            return {"images": []}
+        offset = decode_cursor(cursor)
+        entries, total = await async_storage.run(
+            image_manifest.list, sort, order == "desc", offset, limit
+        )
+        references = await get_image_references()
 
         images = []
-        for filename in os.listdir(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            if os.path.isfile(file_path):
-                # 獲取檔案資訊
-                stat = os.stat(file_path)
-                relative_url = f"/uploads/{filename}"
-                images.append(
-                    {
-                        "filename": filename,
-                        "size": stat.st_size,
-                        "created_at": stat.st_ctime,
-                        "url": f"http://localhost:8000{relative_url}",  # 向後相容
-                        "relativePath": relative_url,  # 新的相對路徑
-                        "fullUrl": f"http://localhost:8000{relative_url}",  # 明確的完整URL
-                    }
-                )
+        for entry in entries:
+            filename = entry["filename"]
+            relative_url = f"/uploads/{filename}"
+            images.append(
+                {
+                    "filename": filename,
+                    "size": entry.get("size"),
+                    "created_at": entry.get("created_at"),
+                    "url": f"http://localhost:8000{relative_url}",  # 向後相容
+                    "relativePath": relative_url,  # 新的相對路徑
+                    "fullUrl": f"http://localhost:8000{relative_url}",  # 明確的完整URL
+                    "width": entry.get("width"),
+                    "height": entry.get("height"),
+                    "bookIds": references.get(filename, []),  # 引用此圖片的書籍
+                    "variants": variant_urls(filename, entry),
+                }
+            )
 
-        # 按建立時間排序
-        images.sort(key=lambda x: x["created_at"], reverse=True)
+        if limit is not None and offset + limit < total:
+            response.headers["X-Next-Cursor"] = encode_cursor(offset + limit)
 
-        return {"images": images}
+        return {"images": images, "total": total}
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"列出圖片失敗: {str(e)}")
+
+
+@files_router.get("/uploads/{filename}")
+async def serve_upload(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, description="需要的寬度，回傳不小於此寬度的最小預先產生版本"),
+):
+    """提供上傳的圖片
+
+    依 Accept 標頭回傳 AVIF/WebP 版本（有與原圖同尺寸的版本時）；指定 w 時回傳縮放版本。
+    唯一檔名的圖片以 immutable 長期快取，並支援 ETag/Last-Modified 與 Range。
+    """
+    file_path = resolve_upload(filename)
+    cache_control = image_cache_control(filename)
+
+    entry = image_manifest.get(filename)
+    if entry and entry.get("variants"):
+        variant = pick_variant(entry, w, accepted_formats(request.headers.get("accept")))
+        if variant is not None:
+            variant_name, variant_format = variant
+            variant_path = os.path.join(VARIANTS_DIR, filename, variant_name)
+            if os.path.isfile(variant_path):
+                return file_response(
+                    request, variant_path, cache_control,
+                    headers={"Vary": "Accept"}, media_type=VARIANT_MEDIA_TYPES[variant_format],
+                )
+        # 回應內容依 Accept 而不同，快取需區分
+        return file_response(request, file_path, cache_control, headers={"Vary": "Accept"})
+
+    return file_response(request, file_path, cache_control)
+
+
+@files_router.get("/uploads/variants/{filename}/{variant_name}")
+async def serve_variant(filename: str, variant_name: str, request: Request):
+    """直接存取預先產生的版本檔案"""
+    variant_path = resolve_upload(os.path.join("variants", filename), variant_name)
+    extension = Path(variant_name).suffix.lstrip(".")
+    media_type = VARIANT_MEDIA_TYPES.get("jpeg" if extension == "jpg" else extension)
+    return file_response(request, variant_path, image_cache_control(filename), media_type=media_type)
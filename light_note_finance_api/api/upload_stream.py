@@ -0,0 +1,171 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional, Dict, List, NamedTuple
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# 判斷格式所需的檔頭長度
+SNIFF_BYTES = 12
+# multipart 邊界與標頭的額外空間，用於以 Content-Length 提早拒絕
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """依檔頭判斷圖片格式，回傳副檔名；無法辨識時回傳 None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+class ReceivedFile(NamedTuple):
+    """串流接收完成的檔案"""
+    filename: str      # 用戶端提供的原始檔名
+    path: str          # 暫存檔路徑
+    size: int
+    sha256: str        # 內容雜湊（十六進位）
+    image_type: str    # 依檔頭判斷的副檔名
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+class _FileFieldReceiver:
+    """multipart 解析回呼：只接收指定欄位的檔案，資料暫存在 pending 等待寫入"""
+
+    def __init__(self, field_name: str, max_size: int):
+        self.field_name = field_name.encode()
+        self.max_size = max_size
+        self.filename: Optional[str] = None
+        self.size = 0
+        self.head = b""
+        self.pending: List[bytes] = []
+        self.error: Optional[Exception] = None
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._receiving = False
+        self._done = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        # 只接收第一個同名檔案欄位
+        self._receiving = (
+            not self._done and options.get(b"name") == self.field_name and b"filename" in options
+        )
+        if self._receiving:
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if not self._receiving or self.error is not None:
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            self.error = UploadTooLarge()
+            return
+        if len(self.head) < SNIFF_BYTES:
+            self.head += chunk[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES and sniff_image_type(self.head) is None:
+                self.error = UnsupportedImage()
+                return
+        self.pending.append(chunk)
+
+    def _on_part_end(self):
+        if self._receiving:
+            self._receiving = False
+            self._done = True
+            # 檔案小於判斷所需長度時，在結束時判斷
+            if self.error is None and 0 < len(self.head) < SNIFF_BYTES and sniff_image_type(self.head) is None:
+                self.error = UnsupportedImage()
+
+
+async def receive_file(request: Request, field_name: str, temp_dir: str, max_size: int):
+    """以串流方式接收 multipart 上傳，分段寫入 temp_dir 中的暫存檔
+
+    大小在接收時逐段檢查，超過 max_size 或檔頭不是支援的圖片格式時立即中止，
+    不會把整個檔案讀進記憶體；寫入的同時計算 SHA-256。
+    回傳 ReceivedFile，沒有上傳檔案時回傳 None；呼叫端負責將暫存檔移到正式位置或刪除。
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="請使用 multipart/form-data 上傳")
+
+    # Content-Length 已超過上限時不必接收內容
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise UploadTooLarge()
+
+    receiver = _FileFieldReceiver(field_name, max_size)
+    hasher = hashlib.sha256()
+    parser = MultipartParser(params[b"boundary"], receiver.callbacks())
+
+    os.makedirs(temp_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix=".tmp")
+    f = os.fdopen(fd, "wb")
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if receiver.error is not None:
+                raise receiver.error
+            if receiver.pending:
+                data, receiver.pending = b"".join(receiver.pending), []
+                hasher.update(data)
+                await run_in_threadpool(f.write, data)
+        parser.finalize()
+        if receiver.error is not None:
+            raise receiver.error
+        await run_in_threadpool(f.close)
+    except BaseException:
+        f.close()
+        os.remove(temp_path)
+        raise
+
+    if receiver.filename is None:
+        os.remove(temp_path)
+        return None
+    return ReceivedFile(
+        receiver.filename, temp_path, receiver.size, hasher.hexdigest(), sniff_image_type(receiver.head) or ""
+    )
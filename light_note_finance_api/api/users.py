@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict
-from services.json_storage import storage
+from services.async_storage import async_storage
+from services.daily_unlock import unlock_date
+from services.progress import merge_book_progress
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -36,11 +38,26 @@ class UserUpdateModel(BaseModel):
     dailyUnlockHistory: Optional[Dict[str, str]] = None
     settings: Optional[UserSettingsModel] = None
 
+class UserOperationModel(BaseModel):
+    op: str                      # increment | add | remove | toggle | push
+    field: str                   # points | favoriteBookIds | unlockedBookIds | viewHistory
+    value: Any = None
+    limit: Optional[int] = None  # push 保留的筆數，預設 100
+
+class UserPatchModel(BaseModel):
+    operations: List[UserOperationModel]
+
+class ProgressUpdateModel(BaseModel):
+    bookId: str
+    read: List[str] = []        # 標記為已讀（同時視為已解鎖）的摘要ID
+    unread: List[str] = []      # 取消已讀
+    unlocked: List[str] = []    # 標記為已解鎖
+
 @router.get("/", response_model=List[Dict[str, Any]])
 async def get_all_users():
     """獲取所有使用者"""
     try:
-        users = storage.get_all_users()
+        users = await async_storage.get_all_users()
         return users
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取使用者列表失敗: {str(e)}")
@@ -49,7 +66,7 @@ async def get_all_users():
 async def get_user_by_id(user_id: str):
     """根據ID獲取特定使用者"""
     try:
-        user = storage.get_user_by_id(user_id)
+        user = await async_storage.get_user_by_id(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="使用者不存在")
         return user
@@ -68,7 +85,7 @@ async def create_user(user: UserModel):
         if 'settings' in user_data and hasattr(user_data['settings'], 'model_dump'):
             user_data['settings'] = user_data['settings'].model_dump(exclude_unset=True)
 
-        new_user = storage.create_user(user_data)
+        new_user = await async_storage.create_user(user_data)
         return new_user
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"創建使用者失敗: {str(e)}")
@@ -78,7 +95,7 @@ async def update_user(user_id: str, user: UserUpdateModel):
     """更新使用者"""
     try:
         # 檢查使用者是否存在
-        existing_user = storage.get_user_by_id(user_id)
+        existing_user = await async_storage.get_user_by_id(user_id)
         if not existing_user:
             raise HTTPException(status_code=404, detail="使用者不存在")
 
@@ -89,10 +106,8 @@ async def update_user(user_id: str, user: UserUpdateModel):
         if 'settings' in user_data and hasattr(user_data['settings'], 'model_dump'):
             user_data['settings'] = user_data['settings'].model_dump(exclude_unset=True)
 
-        # 合併現有資料和新資料
-        updated_data = {**existing_user, **user_data}
-
-        updated_user = storage.update_user(user_id, updated_data)
+        # 在儲存層鎖內合併現有資料和新資料
+        updated_user = await async_storage.update_user(user_id, user_data, merge=True)
         if not updated_user:
             raise HTTPException(status_code=500, detail="更新使用者失敗")
 
@@ -106,7 +121,7 @@ async def update_user(user_id: str, user: UserUpdateModel):
 async def delete_user(user_id: str):
     """刪除使用者"""
     try:
-        success = storage.delete_user(user_id)
+        success = await async_storage.delete_user(user_id)
         if not success:
             raise HTTPException(status_code=404, detail="使用者不存在")
         return {"message": "使用者刪除成功", "deleted_id": user_id}
@@ -117,32 +132,41 @@ async def delete_user(user_id: str):
 
 # 額外的使用者操作端點
 
+@router.patch("/{user_id}", response_model=Dict[str, Any])
+async def patch_user(user_id: str, patch: UserPatchModel):
+    """以原子操作部分更新使用者（增加積分、加入/移除書籍ID、新增閱讀紀錄），整批在一次寫入內完成"""
+    try:
+        result = await async_storage.patch_user(
+            user_id, [operation.model_dump(exclude_none=True) for operation in patch.operations]
+        )
+        if result is None:
+            raise HTTPException(status_code=404, detail="使用者不存在")
+        user, results = result
+        return {"user": user, "results": results}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"更新使用者失敗: {str(e)}")
+
 @router.post("/{user_id}/unlock-book/{book_id}")
 async def unlock_book(user_id: str, book_id: str):
     """為使用者解鎖書籍"""
     try:
-        user = storage.get_user_by_id(user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="使用者不存在")
-
         # 檢查書籍是否存在
-        book = storage.get_book_by_id(book_id)
-        if not book:
+        if not await async_storage.book_exists(book_id):
             raise HTTPException(status_code=404, detail="書籍不存在")
 
-        # 添加到解鎖列表（如果還沒解鎖）
-        unlocked_books = user.get('unlockedBookIds', [])
-        if book_id not in unlocked_books:
-            unlocked_books.append(book_id)
-
-            updated_user = storage.update_user(user_id, {
-                **user,
-                'unlockedBookIds': unlocked_books
-            })
+        # 添加到解鎖集合（如果還沒解鎖），在儲存層鎖內完成
+        result = await async_storage.patch_user(
+            user_id, [{'op': 'add', 'field': 'unlockedBookIds', 'value': book_id}]
+        )
+        if result is None:
+            raise HTTPException(status_code=404, detail="使用者不存在")
 
-            return {"message": "書籍解鎖成功", "user": updated_user}
-        else:
-            return {"message": "書籍已經解鎖", "user": user}
+        user, (added,) = result
+        return {"message": "書籍解鎖成功" if added else "書籍已經解鎖", "user": user}
 
     except HTTPException:
         raise
@@ -153,32 +177,18 @@ async def unlock_book(user_id: str, book_id: str):
 async def toggle_favorite_book(user_id: str, book_id: str):
     """切換使用者的最愛書籍"""
     try:
-        user = storage.get_user_by_id(user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="使用者不存在")
-
         # 檢查書籍是否存在
-        book = storage.get_book_by_id(book_id)
-        if not book:
+        if not await async_storage.book_exists(book_id):
             raise HTTPException(status_code=404, detail="書籍不存在")
 
-        favorite_books = user.get('favoriteBookIds', [])
-
-        if book_id in favorite_books:
-            # 移除最愛
-            favorite_books.remove(book_id)
-            message = "已從最愛移除"
-        else:
-            # 添加最愛
-            favorite_books.append(book_id)
-            message = "已添加到最愛"
-
-        updated_user = storage.update_user(user_id, {
-            **user,
-            'favoriteBookIds': favorite_books
-        })
+        result = await async_storage.patch_user(
+            user_id, [{'op': 'toggle', 'field': 'favoriteBookIds', 'value': book_id}]
+        )
+        if result is None:
+            raise HTTPException(status_code=404, detail="使用者不存在")
 
-        return {"message": message, "user": updated_user}
+        user, (is_favorite,) = result
+        return {"message": "已添加到最愛" if is_favorite else "已從最愛移除", "user": user}
 
     except HTTPException:
         raise
@@ -187,20 +197,129 @@ async def toggle_favorite_book(user_id: str, book_id: str):
 
 @router.put("/{user_id}/points")
 async def update_user_points(user_id: str, points: int):
-    """更新使用者積分"""
+    """設定使用者積分"""
     try:
-        user = storage.get_user_by_id(user_id)
-        if not user:
+        updated_user = await async_storage.update_user(user_id, {'points': points}, merge=True)
+        if not updated_user:
             raise HTTPException(status_code=404, detail="使用者不存在")
 
-        updated_user = storage.update_user(user_id, {
-            **user,
-            'points': points
-        })
-
         return {"message": "積分更新成功", "user": updated_user}
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"更新積分失敗: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"更新積分失敗: {str(e)}")
+
+@router.post("/{user_id}/points/increment")
+async def increment_user_points(user_id: str, amount: int):
+    """增加（負數為扣除）使用者積分；在儲存層鎖內計算，併發請求不會遺失"""
+    try:
+        result = await async_storage.patch_user(
+            user_id, [{'op': 'increment', 'field': 'points', 'value': amount}]
+        )
+        if result is None:
+            raise HTTPException(status_code=404, detail="使用者不存在")
+
+        user, (points,) = result
+        return {"message": "積分更新成功", "points": points, "user": user}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"更新積分失敗: {str(e)}")
+
+@router.post("/daily-unlock/precompute")
+async def precompute_daily_unlocks(
+    date: Optional[str] = Query(None, description="計畫日期 YYYY-MM-DD，預設為明天")
+):
+    """預先計算所有使用者的每日解鎖（批次模式，建議由排程每晚呼叫）"""
+    try:
+        day = unlock_date(date) if date else unlock_date(days=1)
+        planned = await async_storage.plan_daily_unlocks(day)
+        return {"message": "每日解鎖計畫已建立", "date": day, "planned": planned}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"建立每日解鎖計畫失敗: {str(e)}")
+
+@router.post("/{user_id}/daily-unlock")
+async def daily_unlock(
+    user_id: str,
+    date: Optional[str] = Query(None, description="使用者當地日期 YYYY-MM-DD，預設為伺服器今天")
+):
+    """解鎖使用者今天的摘要：依 order 選出下一批並更新解鎖紀錄，同一天重複呼叫不會再解鎖"""
+    try:
+        day = unlock_date(date)
+        result = await async_storage.daily_unlock(user_id, day)
+        if result is None:
+            raise HTTPException(status_code=404, detail="使用者不存在")
+
+        if result['alreadyUnlocked']:
+            message = "今天已經解鎖過"
+        else:
+            message = f"已解鎖 {len(result['summaries'])} 則摘要"
+        return {"message": message, "date": day, **result}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"每日解鎖失敗: {str(e)}")
+
+@router.get("/{user_id}/progress")
+async def get_user_progress(
+    user_id: str,
+    bookId: Optional[str] = Query(None, description="只回傳此書籍的進度")
+):
+    """獲取使用者的閱讀進度（各書已解鎖與已讀的摘要）"""
+    try:
+        if not await async_storage.get_user_by_id(user_id):
+            raise HTTPException(status_code=404, detail="使用者不存在")
+        return {"userId": user_id, "books": await async_storage.get_progress(user_id, bookId)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"獲取閱讀進度失敗: {str(e)}")
+
+@router.post("/{user_id}/progress")
+async def update_user_progress(user_id: str, progress: ProgressUpdateModel):
+    """更新使用者在一本書的閱讀進度；只寫入進度儲存，不會重寫書籍資料"""
+    try:
+        if not await async_storage.get_user_by_id(user_id):
+            raise HTTPException(status_code=404, detail="使用者不存在")
+        if not await async_storage.book_exists(progress.bookId):
+            raise HTTPException(status_code=404, detail="書籍不存在")
+
+        return await async_storage.update_progress(
+            user_id, progress.bookId, read=progress.read, unread=progress.unread, unlocked=progress.unlocked
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"更新閱讀進度失敗: {str(e)}")
+
+@router.get("/{user_id}/books/{book_id}", response_model=Dict[str, Any])
+async def get_user_book(
+    user_id: str,
+    book_id: str,
+    content: bool = Query(False, description="1 時摘要含完整內容（啟用摘要內容分離時預設只有存根）"),
+):
+    """獲取書籍並以使用者的進度填入 isUnlocked、isFavorite、isRead 與 userCompleted"""
+    try:
+        user = await async_storage.get_user_by_id(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="使用者不存在")
+        book = await async_storage.get_book_by_id(book_id, with_content=content)
+        if not book:
+            raise HTTPException(status_code=404, detail="書籍不存在")
+
+        progress = await async_storage.get_progress(user_id, book_id)
+        return merge_book_progress(book, user, progress[0] if progress else None)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"獲取書籍失敗: {str(e)}")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""事件迴圈阻塞測試：寫入進行中時 /api/health 的延遲分佈
+
+以 httpx 的 ASGITransport 在同一個事件迴圈內呼叫 API（需要安裝 httpx），
+比較儲存操作直接在事件迴圈執行（STORAGE_WORKERS=0）與交由執行緒池執行的差異。
+
+用法：python benchmarks/bench_event_loop.py [書籍數] [寫入次數]
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.join(API_DIR, "benchmarks"))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def load_test(writes: int):
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        latencies = []
+        done = asyncio.Event()
+
+        async def writer():
+            await asyncio.sleep(0.05)
+            # 各寫入請求並行送出，模擬同時進行中的寫入
+            await asyncio.gather(*[
+                client.put(f"/api/books/book-{i}", json={"title": f"更新 {i}"})
+                for i in range(writes)
+            ])
+            done.set()
+
+        async def prober():
+            # 從預定送出時間起算，事件迴圈被阻塞的時間也會計入延遲
+            while not done.is_set():
+                scheduled = time.perf_counter() + 0.005
+                await asyncio.sleep(0.005)
+                await client.get("/api/health")
+                latencies.append((time.perf_counter() - scheduled) * 1000)
+
+        await asyncio.gather(writer(), prober())
+
+    print(f"  health 次數 {len(latencies)}，p50 {statistics.median(latencies):.2f} ms，"
+          f"p99 {percentile(latencies, 0.99):.2f} ms，max {max(latencies):.2f} ms")
+
+
+def run_mode(workers: str, book_count: int, writes: int):
+    from bench_storage import build_catalog
+    from services.json_storage import JSONStorage
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        build_catalog(JSONStorage(os.path.join(work_dir, "data")), book_count, 10)
+        env = {**os.environ, "STORAGE_WORKERS": workers, "BENCH_CHILD": str(writes)}
+        subprocess.run([sys.executable, os.path.abspath(__file__)], cwd=work_dir, env=env, check=True)
+
+
+if __name__ == "__main__":
+    if os.getenv("BENCH_CHILD"):
+        asyncio.run(load_test(int(os.environ["BENCH_CHILD"])))
+        sys.exit(0)
+
+    book_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"書籍 {book_count} 本，寫入 {writes} 次\n")
+    print("事件迴圈上執行（STORAGE_WORKERS=0）")
+    run_mode("0", book_count, writes)
+    print("執行緒池（STORAGE_WORKERS=8）")
+    run_mode("8", book_count, writes)
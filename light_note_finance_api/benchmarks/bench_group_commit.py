@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""群組提交效能測試：多執行緒同時更新使用者，比較不同的時間窗口
+
+用法：python benchmarks/bench_group_commit.py [執行緒數] [每執行緒操作次數] [使用者數]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.json_storage import JSONStorage
+
+WINDOWS_MS = (0, 2, 5, 10, 20)
+
+
+def run(journal: bool, window_ms: float, threads: int, ops: int, user_count: int) -> float:
+    """回傳每秒完成的寫入次數"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = JSONStorage(data_dir)
+        users = storage._records(storage.users_file)
+        for i in range(user_count):
+            users[f"user-{i}"] = {"id": f"user-{i}", "points": 0, "settings": {}}
+        storage._write_json(storage.users_file, list(users.values()))
+        storage.close()
+
+        storage = JSONStorage(data_dir, journal=journal, compact_threshold=10 ** 9,
+                              group_commit_window=window_ms / 1000)
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(k: int):
+            barrier.wait()
+            for i in range(ops):
+                storage.update_user(f"user-{(k * ops + i) % user_count}", {"points": i}, merge=True)
+
+        workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        storage.close()
+        return threads * ops / elapsed
+
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    user_count = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    print(f"{threads} 個執行緒 × {ops} 次 update_user，使用者 {user_count} 位\n")
+    print(f"{'窗口':>8} {'整檔重寫':>12} {'日誌模式':>12}")
+    for window_ms in WINDOWS_MS:
+        rates = [run(journal, window_ms, threads, ops, user_count) for journal in (False, True)]
+        label = "未啟用" if window_ms == 0 else f"{window_ms} ms"
+        print(f"{label:>8} {rates[0]:9.0f}/s {rates[1]:9.0f}/s")
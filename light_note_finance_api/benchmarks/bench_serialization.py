@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""讀取端點序列化效能測試：response_model 驗證 + jsonable_encoder 與 orjson 快速路徑
+
+以 httpx 的 ASGITransport 依序呼叫讀取端點（需要安裝 httpx），比較：
+- 原本：回傳 dict，由 FastAPI 依 response_model 驗證並以 jsonable_encoder 編碼
+- orjson：直接序列化為位元組（停用快取，每次都重新序列化）
+- orjson + 快取：以 ETag 快取已序列化的內容
+
+用法：python benchmarks/bench_serialization.py [書籍數] [每本摘要數] [請求次數]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.join(API_DIR, "benchmarks"))
+
+
+def build_baseline_app():
+    """重現原本的讀取端點：先以版本產生 ETag，再回傳 dict 並宣告 response_model"""
+    from fastapi import FastAPI, Query, Request, Response
+    from services.async_storage import async_storage
+    from services.query import parse_fields
+    from api.caching import make_etag, apply_cache_headers
+
+    app = FastAPI()
+
+    @app.get("/api/books/", response_model=List[Dict[str, Any]])
+    async def get_all_books(request: Request, response: Response,
+                            limit: Optional[int] = None, fields: Optional[str] = Query(None)):
+        etag = make_etag("books", await async_storage.get_books_version(), str(request.query_params))
+        books, _ = await async_storage.list_books(limit=limit, fields=parse_fields(fields))
+        apply_cache_headers(response, etag)
+        return books
+
+    @app.get("/api/books/{book_id}", response_model=Dict[str, Any])
+    async def get_book_by_id(book_id: str, response: Response):
+        etag = make_etag("book", book_id, await async_storage.get_book_version(book_id))
+        book = await async_storage.get_book_by_id(book_id)
+        apply_cache_headers(response, etag)
+        return book
+
+    @app.get("/api/summaries/book/{book_id}", response_model=List[Dict[str, Any]])
+    async def get_summaries_by_book_id(book_id: str, response: Response):
+        etag = make_etag("summaries", book_id, await async_storage.get_book_version(book_id))
+        summaries = await async_storage.get_summaries_by_book_id(book_id)
+        apply_cache_headers(response, etag)
+        return summaries
+
+    return app
+
+
+async def requests_per_second(app, path: str, count: int) -> float:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.get(path)  # 暖機：載入資料
+        start = time.perf_counter()
+        for _ in range(count):
+            response = await client.get(path)
+            response.raise_for_status()
+        return count / (time.perf_counter() - start)
+
+
+async def load_test(count: int):
+    import main
+    from api.caching import serialized_cache
+
+    baseline = build_baseline_app()
+    paths = [
+        ("書籍列表（不含摘要）", "/api/books/", count),
+        ("書籍列表（fields=*）", "/api/books/?fields=*", max(1, count // 10)),
+        ("單本書籍", "/api/books/book-1", count),
+        ("書籍摘要列表", "/api/summaries/book/book-1", count),
+    ]
+
+    print(f"  {'端點':<20} {'原本':>10} {'orjson':>10} {'orjson+快取':>12}  (req/s)")
+    for label, path, n in paths:
+        before = await requests_per_second(baseline, path, n)
+        serialized_cache.max_entries = 0
+        uncached = await requests_per_second(main.app, path, n)
+        serialized_cache.max_entries = 512
+        cached = await requests_per_second(main.app, path, n)
+        print(f"  {label:<20} {before:10.0f} {uncached:10.0f} {cached:12.0f}")
+
+
+if __name__ == "__main__":
+    if os.getenv("BENCH_CHILD"):
+        asyncio.run(load_test(int(os.environ["BENCH_CHILD"])))
+        sys.exit(0)
+
+    from bench_storage import build_catalog
+    from services.json_storage import JSONStorage
+
+    book_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    summaries_per_book = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    print(f"書籍 {book_count} 本 / 每本摘要 {summaries_per_book} 則，每個端點 {count} 次請求\n")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        build_catalog(JSONStorage(os.path.join(work_dir, "data")), book_count, summaries_per_book)
+        env = {**os.environ, "BENCH_CHILD": str(count)}
+        subprocess.run([sys.executable, os.path.abspath(__file__)], cwd=work_dir, env=env, check=True)
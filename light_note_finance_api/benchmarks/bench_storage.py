@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""JSONStorage 寫入效能測試：比較整檔重寫、日誌模式、分片模式與二進位快照
+
+用法：python benchmarks/bench_storage.py [書籍數] [每本摘要數] [操作次數]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.book_shards import BookShards
+from services.json_storage import JSONStorage
+from services.snapshot import write_snapshot
+
+
+def build_catalog(storage: JSONStorage, book_count: int, summaries_per_book: int):
+    """直接寫入測試用書目，避免逐筆寫入耗時"""
+    books = storage._records(storage.books_file)
+    for i in range(book_count):
+        book_id = f"book-{i}"
+        books[book_id] = {
+            "id": book_id,
+            "title": f"測試書籍 {i}",
+            "description": "這是一本用於效能測試的書籍" * 4,
+            "imageUrl": f"/uploads/book-{i}.jpg",
+            "summaries": [
+                {
+                    "id": f"{book_id}-s{j}",
+                    "bookId": book_id,
+                    "content": "理財摘要內容，記錄每日的閱讀重點。" * 6,
+                    "order": j + 1,
+                }
+                for j in range(summaries_per_book)
+            ],
+            "isPublished": True,
+        }
+    storage._write_json(storage.books_file, list(books.values()))
+    users = storage._records(storage.users_file)
+    users["user-0"] = {"id": "user-0", "points": 0, "settings": {}}
+    storage._write_json(storage.users_file, list(users.values()))
+
+
+def measure(label: str, func, count: int):
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<16} {elapsed / count * 1000:9.2f} ms/op")
+
+
+def run(journal: bool, book_count: int, summaries_per_book: int, ops: int, sharded: bool = False,
+        snapshot: str = "json"):
+    with tempfile.TemporaryDirectory() as data_dir:
+        build_catalog(JSONStorage(data_dir), book_count, summaries_per_book)
+        if sharded:
+            books_file = os.path.join(data_dir, "books.json")
+            BookShards(os.path.join(data_dir, "books")).import_books(JSONStorage(data_dir).get_all_books())
+            os.remove(books_file)
+        if snapshot == "binary":
+            books_file = os.path.join(data_dir, "books.json")
+            write_snapshot(os.path.join(data_dir, "books.snap"), JSONStorage(data_dir).get_all_books())
+            os.remove(books_file)
+
+        start = time.perf_counter()
+        storage = JSONStorage(data_dir, journal=journal, compact_threshold=10 ** 9, sharded=sharded,
+                              snapshot=snapshot)
+        storage._records(storage.books_file)
+        label = '分片模式' if sharded else '日誌模式' if journal else '整檔重寫'
+        if snapshot == "binary":
+            label = f"二進位快照 + {label}"
+        print(f"{label}（冷啟動 {time.perf_counter() - start:.2f} s）")
+
+        measure("create_summary", lambda i: storage.create_summary(
+            f"book-{i}", {"content": "新增摘要", "order": 99}), ops)
+        measure("update_book", lambda i: storage.update_book(
+            f"book-{i}", {**storage.get_book_by_id(f"book-{i}"), "title": f"更新 {i}"}), ops)
+        measure("update_user", lambda i: storage.update_user(
+            "user-0", {**storage.get_user_by_id("user-0"), "points": i}), ops)
+
+        if journal:
+            start = time.perf_counter()
+            JSONStorage(data_dir, journal=True, compact_threshold=10 ** 9,
+                        snapshot=snapshot)._records(storage.books_file)
+            print(f"  快照+日誌重播    {time.perf_counter() - start:9.2f} s")
+
+            start = time.perf_counter()
+            storage.compact()
+            print(f"  日誌壓縮         {time.perf_counter() - start:9.2f} s")
+        storage.close()
+
+
+if __name__ == "__main__":
+    book_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    summaries_per_book = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    ops = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    print(f"書籍 {book_count} 本 / 摘要 {book_count * summaries_per_book} 則，每項 {ops} 次操作\n")
+    run(False, book_count, summaries_per_book, ops)
+    print()
+    run(True, book_count, summaries_per_book, ops)
+    print()
+    run(False, book_count, summaries_per_book, ops, sharded=True)
+    print()
+    run(True, book_count, summaries_per_book, ops, snapshot="binary")
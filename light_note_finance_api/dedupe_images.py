@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""將 uploads/ 中的舊圖片改為內容雜湊命名，合併重複檔案並更新書籍的 imageUrl
+
+用法：python dedupe_images.py [--dry-run]
+依 STORAGE_BACKEND 使用目前的儲存後端。完成後可執行 generate_image_variants.py 補齊縮放版本，
+未被任何書籍引用的圖片可透過 POST /api/upload/gc 回收。
+"""
+import hashlib
+import os
+import shutil
+import sys
+
+from api.upload import UPLOAD_DIR, VARIANTS_DIR
+from api.upload_stream import sniff_image_type, SNIFF_BYTES
+from services.images import CONTENT_FILENAME, content_filename, filename_from_url, image_manifest
+from services.json_storage import storage
+
+
+def file_digest(file_path: str):
+    """回傳 (SHA-256, 依檔頭判斷的副檔名)"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+        hasher.update(head)
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest(), sniff_image_type(head)
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+    dry_run = "--dry-run" in sys.argv[1:]
+
+    # 1. 計算新檔名；內容相同的檔案對應到同一個新檔名
+    renames = {}
+    for filename in sorted(os.listdir(UPLOAD_DIR)):
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        if not os.path.isfile(file_path) or filename.startswith(".") or CONTENT_FILENAME.match(filename):
+            continue
+        digest, extension = file_digest(file_path)
+        if extension is None:
+            print(f"略過無法辨識的檔案: {filename}")
+            continue
+        renames[filename] = content_filename(digest, extension)
+
+    targets = set(renames.values())
+    duplicates = len(renames) - len(targets)
+    sizes = {old: os.path.getsize(os.path.join(UPLOAD_DIR, old)) for old in renames}
+    new_sizes = {
+        new: sizes[old] for old, new in renames.items() if not os.path.exists(os.path.join(UPLOAD_DIR, new))
+    }
+    freed = sum(sizes.values()) - sum(new_sizes.values())
+    print(f"{len(renames)} 個檔案對應到 {len(targets)} 個內容，重複 {duplicates} 個，可釋放 {freed} 位元組")
+    if dry_run:
+        for old, new in renames.items():
+            print(f"  {old} -> {new}")
+        sys.exit(0)
+
+    # 2. 先建立新檔案，確保更新後的 imageUrl 都指向存在的檔案
+    for old, new in renames.items():
+        target = os.path.join(UPLOAD_DIR, new)
+        if not os.path.exists(target):
+            shutil.copy2(os.path.join(UPLOAD_DIR, old), target)
+
+    # 3. 更新書籍引用
+    updated = 0
+    for book in list(storage.iter_book_heads()):
+        old = filename_from_url(book.get('imageUrl'))
+        if old in renames:
+            image_url = book['imageUrl'].replace(f"/uploads/{old}", f"/uploads/{renames[old]}")
+            storage.update_book(book['id'], {'imageUrl': image_url}, merge=True)
+            updated += 1
+
+    # 4. 移除舊檔案與其縮放版本
+    for old in renames:
+        os.remove(os.path.join(UPLOAD_DIR, old))
+        shutil.rmtree(os.path.join(VARIANTS_DIR, old), ignore_errors=True)
+        image_manifest.remove(old)
+
+    print(f"已合併為 {len(targets)} 個檔案，更新 {updated} 本書籍的 imageUrl")
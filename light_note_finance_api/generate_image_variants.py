@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""為 uploads/ 中尚未處理的圖片產生縮圖、列表與詳細頁版本，並加入圖片索引
+
+用法：python generate_image_variants.py [--force]
+新上傳的圖片會自動產生版本與索引，此腳本用於補齊既有的圖片。
+"""
+import os
+import sys
+
+from api.upload import UPLOAD_DIR, VARIANTS_DIR, ALLOWED_EXTENSIONS
+from services.images import render_variants, image_manifest, VARIANT_WIDTHS
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+
+    force = "--force" in sys.argv[1:]
+    processed = skipped = failed = 0
+    for filename in sorted(os.listdir(UPLOAD_DIR)):
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        if not os.path.isfile(file_path) or os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+            continue
+        if not force and image_manifest.get(filename):
+            skipped += 1
+            continue
+        try:
+            entry = render_variants(file_path, os.path.join(VARIANTS_DIR, filename), list(VARIANT_WIDTHS.values()))
+        except Exception as e:
+            print(f"處理 {filename} 失敗: {e}")
+            failed += 1
+            continue
+        stat = os.stat(file_path)
+        entry.update(size=stat.st_size, created_at=stat.st_mtime)
+        image_manifest.put(filename, entry)
+        processed += 1
+
+    print(f"已處理 {processed} 張圖片，略過 {skipped} 張，失敗 {failed} 張")
@@ -2,7 +2,10 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from api import books, summaries, users, upload
+from api import books, summaries, users, upload, sync, search
+from services.json_storage import storage
+from services.images import image_processor
+from api.caching import serialized_cache
 
 # 創建 FastAPI 應用程式
 app = FastAPI(
@@ -18,11 +21,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # 確保uploads目錄存在
 os.makedirs("uploads", exist_ok=True)
 
+# 圖片縮放版本（/uploads/{filename}?w=），需在靜態檔案掛載前註冊
+app.include_router(upload.files_router)
+
 # 掛載靜態檔案服務
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
@@ -31,6 +38,13 @@ app.include_router(books.router, prefix="/api")
 app.include_router(summaries.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
 app.include_router(upload.router, prefix="/api")
+app.include_router(sync.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
+
+# 關閉時等待圖片處理完成
+@app.on_event("shutdown")
+def shutdown_image_processor():
+    image_processor.shutdown()
 
 # 根路徑
 @app.get("/")
@@ -52,6 +66,15 @@ async def health_check():
         "version": "1.0.0"
     }
 
+# 儲存層指標端點
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "storage_locks": storage.get_lock_stats(),
+        "response_cache": serialized_cache.stats(),
+        "summary_content_cache": storage.get_summary_cache_stats()
+    }
+
 # API 資訊端點
 @app.get("/api/info")
 async def api_info():
@@ -64,6 +87,8 @@ async def api_info():
             "summaries": "/api/summaries",
             "users": "/api/users",
             "upload": "/api/upload",
+            "sync": "/api/sync",
+            "search": "/api/search",
             "health": "/api/health",
             "docs": "/docs"
         },
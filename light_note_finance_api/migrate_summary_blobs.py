@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""將書籍中內嵌的摘要內容移到 data/summaries/，書籍只保留存根（contentHash、contentLength）
+
+用法：
+    python migrate_summary_blobs.py [資料目錄]             # 內嵌內容 -> 存根 + 內容檔
+    python migrate_summary_blobs.py --reverse [資料目錄]   # 存根 -> 內嵌內容
+    python migrate_summary_blobs.py --prune [資料目錄]     # 刪除未被引用的內容檔
+
+轉換前請先停止服務器；書籍的存放方式（分片目錄或二進位快照）依資料目錄自動判斷，
+日誌（books.json.log）會一併套用並壓縮回快照。轉換完成後以 STORAGE_SUMMARY_BLOBS=1 啟動服務器。
+更新或刪除摘要後舊的內容檔不會立即刪除，可定期執行 --prune（只刪除一小時前建立的檔案）。
+"""
+import os
+import sys
+
+from services.book_shards import BookShards
+from services.json_storage import JSONStorage
+from services.summary_blobs import is_stub
+
+
+def stored_books(storage: JSONStorage):
+    """儲存格式的書籍（摘要可能為存根），直接取自快取避免複製"""
+    return list(storage._records(storage.books_file).values())
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+
+    flags = {arg for arg in sys.argv[1:] if arg.startswith("--")}
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    reverse = "--reverse" in flags
+    data_dir = args[0] if args else "data"
+
+    storage = JSONStorage(
+        data_dir, journal=True, compact_interval=3600,
+        sharded=BookShards(os.path.join(data_dir, "books")).exists(),
+        snapshot="binary" if os.path.exists(os.path.join(data_dir, "books.snap")) else "json",
+        summary_blobs=not reverse,
+    )
+    try:
+        if "--prune" in flags:
+            live = {
+                summary['contentHash']
+                for book in stored_books(storage)
+                for summary in book.get('summaries') or [] if is_stub(summary)
+            }
+            removed = storage._blobs.prune(live)
+            print(f"已刪除 {removed} 個未被引用的內容檔，保留 {len(live)} 個")
+            sys.exit(0)
+
+        with storage._locked(storage.books_file):
+            if reverse:
+                books = [
+                    storage._book_with_content(book, cache=False) for book in stored_books(storage)
+                    if any(is_stub(summary) for summary in book.get('summaries') or [])
+                ]
+            else:
+                books = [
+                    book for book in stored_books(storage)
+                    if any('content' in summary for summary in book.get('summaries') or [])
+                ]
+            if books:
+                storage._put_books([dict(book) for book in books])
+        summary_count = sum(len(book.get('summaries') or []) for book in books)
+        if reverse:
+            print(f"已將 {len(books)} 本書籍、{summary_count} 則摘要的內容併回書籍"
+                  f"（{storage._blobs.directory} 可在確認後刪除）")
+        else:
+            print(f"已將 {len(books)} 本書籍、{summary_count} 則摘要的內容移到 {storage._blobs.directory}")
+    finally:
+        storage.close()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""將 data/books.json 轉換為分片目錄 data/books/（每本書一個檔案 + _manifest.json）
+
+用法：
+    python migrate_to_shards.py [資料目錄]             # books.json -> data/books/
+    python migrate_to_shards.py --reverse [資料目錄]   # data/books/ -> books.json
+
+轉換前請先停止服務器，執行時不要設定 STORAGE_SHARDED。books.json 的日誌
+（books.json.log）會一併套用；轉換完成後原檔改名為 .bak，之後以 STORAGE_SHARDED=1 啟動服務器。
+"""
+import os
+import shutil
+import sys
+
+from services.book_shards import BookShards
+from services.json_storage import JSONStorage
+
+
+def backup(path: str):
+    """改名為 .bak（已存在時覆蓋），避免舊資料被誤用"""
+    if os.path.exists(path):
+        if os.path.isdir(path + ".bak"):
+            shutil.rmtree(path + ".bak")
+        os.replace(path, path + ".bak")
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+
+    args = [arg for arg in sys.argv[1:] if arg != "--reverse"]
+    reverse = "--reverse" in sys.argv[1:]
+    data_dir = args[0] if args else "data"
+    books_file = os.path.join(data_dir, "books.json")
+    shards = BookShards(os.path.join(data_dir, "books"))
+
+    if reverse:
+        if not shards.exists():
+            sys.exit(f"找不到 {shards.manifest_path}")
+        books = shards.read_all()
+        backup(books_file)
+        storage = JSONStorage(data_dir)
+        storage._write_json(books_file, books)
+        backup(shards.directory)
+        print(f"已將 {len(books)} 本書籍匯出到 {books_file}，分片目錄改名為 {shards.directory}.bak")
+    else:
+        if shards.exists():
+            sys.exit(f"{shards.directory} 已存在，請先確認是否已轉換過")
+        # 日誌模式讀取會一併重播 books.json.log
+        storage = JSONStorage(data_dir, journal=True, compact_interval=3600)
+        books = list(storage._records(storage.books_file).values())
+        shards.import_books(books)
+        backup(books_file)
+        backup(books_file + ".log")
+        summary_count = sum(len(book.get('summaries') or []) for book in books)
+        print(f"已將 {len(books)} 本書籍、{summary_count} 則摘要轉換到 {shards.directory}")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""將 data/books.json 轉換為二進位書籍快照 data/books.snap
+
+用法：
+    python migrate_to_snapshot.py [資料目錄]             # books.json -> books.snap
+    python migrate_to_snapshot.py --reverse [資料目錄]   # books.snap -> books.json（匯出）
+
+轉換前請先停止服務器，執行時不要設定 STORAGE_SNAPSHOT。books.json 的日誌
+（books.json.log）會一併套用；轉換完成後原檔改名為 .bak，之後以 STORAGE_SNAPSHOT=binary 啟動服務器。
+"""
+import os
+import sys
+
+from services.json_storage import JSONStorage
+from services.snapshot import BookSnapshot, write_snapshot
+
+
+def backup(path: str):
+    """改名為 .bak（已存在時覆蓋），避免舊資料被誤用"""
+    if os.path.exists(path):
+        os.replace(path, path + ".bak")
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+
+    args = [arg for arg in sys.argv[1:] if arg != "--reverse"]
+    reverse = "--reverse" in sys.argv[1:]
+    data_dir = args[0] if args else "data"
+    books_file = os.path.join(data_dir, "books.json")
+    snapshot_file = os.path.join(data_dir, "books.snap")
+
+    if reverse:
+        if not os.path.exists(snapshot_file):
+            sys.exit(f"找不到 {snapshot_file}")
+        # 日誌模式讀取會一併重播 books.json.log
+        storage = JSONStorage(data_dir, journal=True, compact_interval=3600, snapshot="binary")
+        # 保留儲存格式（摘要內容分離時仍為存根）
+        books = [dict(book) for book in storage._records(storage.books_file).values()]
+        backup(books_file)
+        storage._write_json(books_file, books)
+        backup(books_file + ".log")
+        backup(snapshot_file)
+        print(f"已將 {len(books)} 本書籍匯出到 {books_file}，快照改名為 {snapshot_file}.bak")
+    else:
+        if os.path.exists(snapshot_file):
+            sys.exit(f"{snapshot_file} 已存在，請先確認是否已轉換過")
+        storage = JSONStorage(data_dir, journal=True, compact_interval=3600)
+        books = list(storage._records(storage.books_file).values())
+        write_snapshot(snapshot_file, books)
+        backup(books_file)
+        backup(books_file + ".log")
+        snapshot = BookSnapshot(snapshot_file)
+        summary_count = sum(snapshot.summary_count(book_id) for book_id in snapshot.ids())
+        print(f"已將 {len(snapshot)} 本書籍、{summary_count} 則摘要轉換到 {snapshot_file}"
+              f"（{os.path.getsize(snapshot_file) // 1024} KB）")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""將 data/books.json（或分片目錄 data/books/）、data/users.json 與 data/progress.json 一次性匯入 SQLite
+
+摘要內容已分離到 data/summaries/ 時（只有存根），匯入前會還原為完整內容。
+
+用法：python migrate_to_sqlite.py [資料目錄] [資料庫路徑]
+完成後以 STORAGE_BACKEND=sqlite 啟動服務器即可使用 SQLite 後端。
+"""
+import json
+import os
+import sys
+
+from services.book_shards import BookShards
+from services.sqlite_storage import SQLiteStorage
+from services.summary_blobs import SummaryBlobStore, is_stub, CONTENT_FIELDS
+
+
+def load(file_path: str):
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def inline_contents(books, blobs: SummaryBlobStore):
+    """將摘要存根還原為內嵌內容"""
+    for book in books:
+        if not book.get('summaries'):
+            continue
+        book['summaries'] = [
+            {**{k: v for k, v in summary.items() if k not in CONTENT_FIELDS},
+             'content': blobs.get(summary['contentHash'], cache=False)} if is_stub(summary) else summary
+            for summary in book['summaries']
+        ]
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(data_dir, "lightnote.db")
+
+    shards = BookShards(os.path.join(data_dir, "books"))
+    books = shards.read_all() if shards.exists() else load(os.path.join(data_dir, "books.json"))
+    inline_contents(books, SummaryBlobStore(os.path.join(data_dir, "summaries")))
+    users = load(os.path.join(data_dir, "users.json"))
+    progress = load(os.path.join(data_dir, "progress.json"))
+
+    storage = SQLiteStorage(db_path)
+    storage.import_json(books, users, progress)
+    storage.close()
+
+    summary_count = sum(len(book.get('summaries') or []) for book in books)
+    print(f"已匯入 {len(books)} 本書籍、{summary_count} 則摘要、{len(users)} 位使用者到 {db_path}")
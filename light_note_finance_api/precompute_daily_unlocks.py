@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""預先計算所有使用者下一天的每日解鎖（可由 cron 每晚執行）
+
+用法：python precompute_daily_unlocks.py [YYYY-MM-DD]
+未指定日期時為明天。依 STORAGE_BACKEND 使用目前的儲存後端；
+使用者呼叫 POST /api/users/{id}/daily-unlock 時，計畫仍有效就直接套用。
+"""
+import os
+import sys
+import time
+
+from services.daily_unlock import unlock_date
+from services.json_storage import storage
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+
+    day = unlock_date(sys.argv[1]) if len(sys.argv) > 1 else unlock_date(days=1)
+    start = time.perf_counter()
+    planned = storage.plan_daily_unlocks(day)
+    storage.close()
+    print(f"{day}: 已為 {planned} 位使用者建立解鎖計畫（{time.perf_counter() - start:.2f} 秒）")
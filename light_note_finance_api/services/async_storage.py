@@ -0,0 +1,53 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from services.json_storage import storage
+
+
+class AsyncStorage:
+    """儲存層的非同步介面
+
+    同步的 storage 方法（檔案讀寫、JSON 解析、SQLite 查詢）交由有限大小的
+    執行緒池執行，避免阻塞事件迴圈。max_workers=0 時直接在事件迴圈上執行。
+    """
+
+    def __init__(self, storage: Any, max_workers: int = 8):
+        self._storage = storage
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if max_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+
+    @property
+    def sync(self) -> Any:
+        """底層的同步儲存實例"""
+        return self._storage
+
+    async def run(self, func, *args, **kwargs):
+        """在執行緒池中執行任意同步函式"""
+        if self._executor is None:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._storage, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return call
+
+    def shutdown(self):
+        """等待執行中的儲存操作完成並關閉執行緒池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+# 全域實例（STORAGE_WORKERS 設定執行緒池大小）
+async_storage = AsyncStorage(storage, max_workers=int(os.getenv("STORAGE_WORKERS", "8")))
@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+from typing import List, Dict, Any, Optional
+from urllib.parse import quote
+
+from services.file_modes import inherit_mode
+from services.query import project_book
+
+MANIFEST_NAME = "_manifest.json"
+
+
+def shard_name(book_id: str) -> str:
+    """書籍ID轉為檔名：跳脫路徑字元，開頭的底線與點也跳脫，避免與清單檔或隱藏檔衝突"""
+    name = quote(book_id, safe='')
+    if name[:1] in ('_', '.'):
+        name = f"%{ord(name[0]):02X}{name[1:]}"
+    return name + ".json"
+
+
+def manifest_entry(book: Dict[str, Any]) -> Dict[str, Any]:
+    """清單中的書籍項目：與書籍列表預設欄位相同（不含摘要，含 summaryCount）"""
+    return project_book(book, None)
+
+
+class BookShards:
+    """分片的書籍目錄：每本書一個 {id}.json，另有列表欄位的清單檔 _manifest.json
+
+    清單依目錄順序列出每本書的列表欄位與 syncSeq；每次寫入書籍都會取得新的 syncSeq，
+    重新載入時只需讀取 syncSeq 有變動的書籍檔。寫入順序為書籍檔 -> 清單 -> 刪除舊檔，
+    中途中斷時清單列出的書籍一定有對應的檔案。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def book_path(self, book_id: str) -> str:
+        return os.path.join(self.directory, shard_name(book_id))
+
+    def _write(self, file_path: str, data: Any, indent: Optional[int] = 2):
+        """先寫暫存檔再原子替換；清單檔每次寫入都會整份重寫，不縮排以減少大小"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                if indent is None:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                else:
+                    json.dump(data, f, ensure_ascii=False, indent=indent)
+                f.flush()
+                os.fsync(f.fileno())
+            inherit_mode(tmp_path, file_path)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # 讀取
+    def read_manifest(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def read_book(self, book_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.book_path(book_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def read_all(self) -> List[Dict[str, Any]]:
+        """依清單順序讀取所有書籍（匯出與轉換用）"""
+        books = []
+        for entry in self.read_manifest():
+            book = self.read_book(entry['id'])
+            if book is not None:
+                books.append(book)
+        return books
+
+    # 寫入
+    def write_books(self, books: List[Dict[str, Any]], manifest: List[Dict[str, Any]],
+                    deleted: List[str] = ()):
+        """寫入異動的書籍與完整清單，最後刪除已移除書籍的檔案"""
+        os.makedirs(self.directory, exist_ok=True)
+        for book in books:
+            self._write(self.book_path(book['id']), book)
+        self._write(self.manifest_path, manifest, indent=None)
+        for book_id in deleted:
+            try:
+                os.remove(self.book_path(book_id))
+            except FileNotFoundError:
+                pass
+
+    def import_books(self, books: List[Dict[str, Any]]):
+        """以整份書目建立分片目錄（轉換工具用），清單外的舊書籍檔會被刪除"""
+        books = [book for book in books if book.get('id')]
+        known = {shard_name(book['id']) for book in books}
+        stale = []
+        if os.path.isdir(self.directory):
+            stale = [name for name in os.listdir(self.directory)
+                     if name.endswith('.json') and name != MANIFEST_NAME and name not in known]
+        self.write_books(books, [manifest_entry(book) for book in books])
+        for name in stale:
+            os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,111 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable, Iterable, Set
+
+# 使用者未設定時每天解鎖的摘要數（與 UserSettingsModel 預設值相同）
+DEFAULT_DAILY_SUMMARY_COUNT = 10
+
+# 依書籍ID取得摘要（依 order 排序）
+SummariesOf = Callable[[str], List[Dict[str, Any]]]
+# 依目錄順序取得第一本不在已解鎖集合中、且有摘要的上架書籍ID
+NextBook = Callable[[set], Optional[str]]
+# 依書籍ID取得使用者已解鎖的摘要ID（來自閱讀進度）
+UnlockedOf = Callable[[str], Set[str]]
+
+
+def unlock_date(value: Optional[str] = None, days: int = 0) -> str:
+    """解析 YYYY-MM-DD 日期（預設今天）並加上 days 天；格式錯誤時拋出 ValueError"""
+    if value:
+        try:
+            day = date.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"無效的日期: {value}，請使用 YYYY-MM-DD")
+    else:
+        day = date.today()
+    return (day + timedelta(days=days)).isoformat()
+
+
+def sort_summaries(summaries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """依 order 排序，order 相同時保留原本的列表順序"""
+    return sorted(summaries, key=lambda summary: summary.get('order') or 0)
+
+
+def plan_daily_unlock(user: Dict[str, Any], day: str, summaries_of: SummariesOf,
+                      unlocked_of: UnlockedOf, next_book: NextBook) -> Optional[Dict[str, Any]]:
+    """選出使用者當天要解鎖的摘要，回傳解鎖計畫；當天已解鎖過時回傳 None
+
+    依序從目前閱讀的書籍與其他已解鎖書籍中，選出尚未解鎖、order 最小的摘要，
+    最多 settings.dailySummaryCount 則；已解鎖的書籍都讀完時才解鎖下一本新書
+    （與 App 原本的規則相同，一天最多一本）。
+    """
+    if day in (user.get('dailyUnlockHistory') or {}):
+        return None
+
+    count = (user.get('settings') or {}).get('dailySummaryCount', DEFAULT_DAILY_SUMMARY_COUNT)
+    book_ids = list(dict.fromkeys(
+        ([user['currentBookId']] if user.get('currentBookId') else []) + list(user.get('unlockedBookIds') or [])
+    ))
+
+    def pick(book_id: str, limit: int) -> List[str]:
+        done = unlocked_of(book_id)
+        return [
+            summary['id'] for summary in summaries_of(book_id) if summary.get('id') not in done
+        ][:limit]
+
+    selected: Dict[str, List[str]] = {}
+    remaining = count
+    for book_id in book_ids:
+        if remaining <= 0:
+            break
+        ids = pick(book_id, remaining)
+        if ids:
+            selected[book_id] = ids
+            remaining -= len(ids)
+
+    new_book_id = None
+    if not selected and count > 0:
+        new_book_id = next_book(set(book_ids))
+        if new_book_id:
+            selected[new_book_id] = pick(new_book_id, count)
+
+    return {
+        'date': day,
+        'summaryIds': selected,
+        'newBookId': new_book_id,
+        'plannedAt': datetime.now().isoformat(),
+    }
+
+
+def plan_is_valid(user: Dict[str, Any], plan: Optional[Dict[str, Any]], day: str,
+                  unlocked_of: UnlockedOf, summary_exists: Callable[[str, str], bool]) -> bool:
+    """預先計算的計畫是否仍可使用：日期相同、當天尚未解鎖、摘要仍存在且尚未解鎖"""
+    if not plan or plan.get('date') != day or day in (user.get('dailyUnlockHistory') or {}):
+        return False
+    book_ids = set(user.get('unlockedBookIds') or [])
+    for book_id, summary_ids in plan['summaryIds'].items():
+        if book_id != plan.get('newBookId') and book_id not in book_ids:
+            return False
+        done = unlocked_of(book_id)
+        if any(summary_id in done or not summary_exists(book_id, summary_id) for summary_id in summary_ids):
+            return False
+    return True
+
+
+def apply_daily_unlock(user: Dict[str, Any], plan: Dict[str, Any], now: str) -> Dict[str, Any]:
+    """依計畫產生更新後的使用者資料（不修改傳入的物件）
+
+    摘要的解鎖狀態由呼叫端寫入閱讀進度；使用者紀錄保留最後一次的計畫（lastDailyUnlock），
+    同一天重複呼叫時回傳相同的摘要，並可重新套用到閱讀進度（設定位元為冪等操作）。
+    """
+    unlocked_books = list(user.get('unlockedBookIds') or [])
+    if plan.get('newBookId') and plan['newBookId'] not in unlocked_books:
+        unlocked_books.append(plan['newBookId'])
+
+    updated = {k: v for k, v in user.items() if k != 'pendingDailyUnlock'}
+    updated['unlockedBookIds'] = unlocked_books
+    updated['dailyUnlockHistory'] = {**(user.get('dailyUnlockHistory') or {}), plan['date']: now}
+    updated['lastDailyUnlock'] = {key: plan[key] for key in ('date', 'summaryIds', 'newBookId')}
+    if plan['summaryIds']:
+        # 目前閱讀的書籍改為這次解鎖的第一本
+        updated['currentBookId'] = next(iter(plan['summaryIds']))
+    updated['updatedAt'] = now
+    return updated
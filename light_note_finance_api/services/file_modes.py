@@ -0,0 +1,18 @@
+import os
+import stat
+
+# 目前的 umask（只能以設定再還原的方式讀取，非執行緒安全，因此在匯入時讀取一次）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def inherit_mode(tmp_path: str, target_path: str):
+    """mkstemp 建立的暫存檔權限為 0600，取代 target_path 前改為原檔的權限
+
+    原檔不存在時使用 0644 扣除 umask，避免以其他使用者執行的程式（備份、Web 伺服器）無法讀取。
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(target_path).st_mode)
+    except FileNotFoundError:
+        mode = 0o644 & ~_UMASK
+    os.chmod(tmp_path, mode)
@@ -0,0 +1,303 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from urllib.parse import urlsplit
+
+from PIL import Image, ImageOps, features
+
+from services.file_modes import inherit_mode
+from services.locks import CollectionLock
+
+# 預先產生的寬度：縮圖、列表、詳細頁
+VARIANT_WIDTHS = {"thumb": 200, "list": 480, "detail": 1080}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+AVIF_QUALITY = 60
+# Pillow 需編譯 libavif 才能輸出 AVIF；不支援時只產生 WebP/JPEG
+AVIF_ENABLED = features.check("avif") and os.getenv("IMAGE_AVIF", "1") != "0"
+
+# 依壓縮率排列的版本格式與 MIME 類型；jpeg 為所有用戶端都能顯示的後備格式
+VARIANT_FORMATS = (("avif", "image/avif"), ("webp", "image/webp"), ("jpeg", "image/jpeg"))
+
+# 唯一檔名（內容雜湊或舊的時間戳記命名）的內容不會改變，可長期快取
+UNIQUE_FILENAME = re.compile(r"^([0-9a-f]{64}|book-cover-\d+-\d+)\.\w+$")
+
+# 內容定址檔名：SHA-256 + 依檔頭判斷的副檔名
+CONTENT_FILENAME = re.compile(r"^[0-9a-f]{64}\.(jpg|png|gif|webp)$")
+
+
+def content_filename(digest: str, extension: str) -> str:
+    """依內容雜湊產生檔名，相同內容的圖片只會存一份"""
+    return f"{digest}{extension}"
+
+
+def filename_from_url(url: Optional[str]) -> Optional[str]:
+    """從書籍的 imageUrl 取出上傳檔名
+
+    支援 ../uploads/x、/uploads/x、http://host/uploads/x 與 ?w= 參數；
+    不是上傳目錄的網址回傳 None。
+    """
+    if not url:
+        return None
+    path = urlsplit(url).path
+    _, marker, name = path.rpartition("/uploads/")
+    if not marker or not name or "/" in name:
+        return None
+    return name
+
+
+def image_references(books: Iterable[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """統計每個上傳檔案被哪些書籍的 imageUrl 引用（引用數即串列長度）"""
+    references: Dict[str, List[str]] = {}
+    for book in books:
+        filename = filename_from_url(book.get("imageUrl"))
+        if filename:
+            references.setdefault(filename, []).append(book.get("id"))
+    return references
+
+
+def find_orphans(upload_dir: str, references: Dict[str, List[str]],
+                 grace_seconds: float, now: Optional[float] = None) -> List[str]:
+    """找出沒有任何書籍引用、且上傳超過 grace_seconds 的檔案
+
+    上傳後到書籍儲存之間圖片尚未被引用，寬限期避免誤刪剛上傳的圖片。
+    """
+    now = time.time() if now is None else now
+    orphans = []
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith(".") or entry.name in references:
+                continue
+            if now - entry.stat().st_mtime >= grace_seconds:
+                orphans.append(entry.name)
+    return sorted(orphans)
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """將透明背景合成到白底（JPEG 不支援透明）"""
+    if img.mode != "RGBA":
+        return img.convert("RGB")
+    background = Image.new("RGB", img.size, (255, 255, 255))
+    background.paste(img, mask=img.getchannel("A"))
+    return background
+
+
+def render_variants(source_path: str, output_dir: str, widths: List[int]) -> Dict[str, Any]:
+    """產生縮放後的 WebP/JPEG 版本，回傳原圖尺寸與各版本的檔名（相對於 output_dir）
+
+    在行程池中執行；只使用檔案路徑傳遞資料，避免大量位元組在行程間複製。
+    輸出時不帶入 EXIF 等中繼資料，方向先依 EXIF 轉正。
+    """
+    with Image.open(source_path) as source:
+        source.seek(0)  # 動態 GIF 只取第一張
+        img = ImageOps.exif_transpose(source)
+        width, height = img.size
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+        os.makedirs(output_dir, exist_ok=True)
+        variants = {}
+        # 不放大：超過原圖寬度的版本以原圖寬度輸出
+        for target in sorted({min(w, width) for w in widths}):
+            target_height = max(1, round(height * target / width))
+            resized = img if target == width else img.resize((target, target_height), Image.LANCZOS)
+
+            webp_name, jpeg_name = f"{target}.webp", f"{target}.jpg"
+            resized.save(os.path.join(output_dir, webp_name), "WEBP", quality=WEBP_QUALITY, method=4)
+            _flatten(resized).save(os.path.join(output_dir, jpeg_name), "JPEG",
+                                   quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+            variants[str(target)] = {
+                "height": target_height,
+                "webp": webp_name,
+                "jpeg": jpeg_name,
+            }
+            if AVIF_ENABLED:
+                avif_name = f"{target}.avif"
+                resized.save(os.path.join(output_dir, avif_name), "AVIF", quality=AVIF_QUALITY, speed=8)
+                variants[str(target)]["avif"] = avif_name
+
+    return {"width": width, "height": height, "variants": variants}
+
+
+class ImageProcessor:
+    """在行程池中執行 Pillow 運算，避免佔用事件迴圈與 GIL"""
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn：避免 fork 時複製其他執行緒持有的鎖
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def render(self, source_path: str, output_dir: str,
+                     widths: Optional[List[int]] = None) -> Dict[str, Any]:
+        """非同步產生圖片版本；max_workers=0 時直接在目前行程執行"""
+        widths = widths or list(VARIANT_WIDTHS.values())
+        if self.max_workers <= 0:
+            return render_variants(source_path, output_dir, widths)
+        loop = asyncio.get_running_loop()
+        # 子行程不一定與目前行程同一工作目錄，傳入絕對路徑
+        return await loop.run_in_executor(
+            self._pool(), render_variants, os.path.abspath(source_path), os.path.abspath(output_dir), widths
+        )
+
+    def shutdown(self):
+        """等待處理中的圖片完成並關閉行程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# 圖片索引可排序的欄位
+IMAGE_SORT_FIELDS = {"created_at", "size", "filename"}
+
+
+class ImageManifest:
+    """圖片索引：檔名 → 檔案大小、上傳時間、尺寸與各寬度的 WebP/JPEG 檔案
+
+    存放於 data/images.json，上傳與刪除時更新，寫入方式與 JSONStorage 相同
+    （鎖內讀取-修改-原子替換）。列表依排序方式快取，檔案變更時才重新排序。
+    """
+
+    def __init__(self, manifest_path: str = os.path.join("data", "images.json")):
+        self.manifest_path = manifest_path
+        os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+        self._lock = CollectionLock(manifest_path + ".lock")
+        self._signature: Optional[Tuple[int, int]] = None
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # (排序欄位, 是否遞減) → (排序時的清單內容, 排序後的檔名)
+        self._sorted: Dict[Tuple[str, bool], Tuple[Dict[str, Any], List[str]]] = {}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """讀取清單；檔案未變更時使用快取"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            self._signature, self._entries = None, {}
+            return self._entries
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+            self._signature = signature
+        return self._entries
+
+    def _write(self, entries: Dict[str, Dict[str, Any]]):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.manifest_path) or '.',
+            prefix=os.path.basename(self.manifest_path) + '.',
+            suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            inherit_mode(tmp_path, self.manifest_path)
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        return self._load().get(filename)
+
+    def list(self, sort: str = "created_at", descending: bool = True,
+             offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """依欄位排序後分頁，回傳 (該頁項目, 總數)"""
+        if sort not in IMAGE_SORT_FIELDS:
+            raise ValueError(f"不支援的排序欄位: {sort}")
+        entries = self._load()
+        cached = self._sorted.get((sort, descending))
+        if cached is not None and cached[0] is entries:
+            order = cached[1]
+        else:
+            if sort == "filename":
+                key = lambda name: name
+            else:
+                key = lambda name: (entries[name].get(sort) or 0, name)
+            order = sorted(entries, key=key, reverse=descending)
+            self._sorted[(sort, descending)] = (entries, order)
+        end = len(order) if limit is None else offset + limit
+        return [{"filename": name, **entries[name]} for name in order[offset:end]], len(order)
+
+    def put(self, filename: str, entry: Dict[str, Any]):
+        with self._lock.hold():
+            entries = dict(self._load())
+            entries[filename] = entry
+            self._write(entries)
+
+    def remove(self, filename: str) -> Optional[Dict[str, Any]]:
+        with self._lock.hold():
+            entries = dict(self._load())
+            entry = entries.pop(filename, None)
+            if entry is not None:
+                self._write(entries)
+            return entry
+
+
+def accepted_formats(accept: Optional[str]) -> List[str]:
+    """依 Accept 標頭列出用戶端可接受的版本格式（依壓縮率排序，jpeg 一律可用）"""
+    accepted = {}
+    for part in (accept or "").split(","):
+        media_type, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[media_type.strip().lower()] = q
+    return [name for name, mime in VARIANT_FORMATS if name == "jpeg" or accepted.get(mime, 0) > 0]
+
+
+def pick_variant(entry: Optional[Dict[str, Any]], width: Optional[int],
+                 formats: List[str]) -> Optional[Tuple[str, str]]:
+    """選出版本，回傳 (檔名, 格式)；找不到合適版本時回傳 None（改用原圖）
+
+    width 為 None 時只接受與原圖同尺寸的 AVIF/WebP 版本（JPEG 不取代原圖）；
+    否則選寬度不小於 width 的最小版本，
+    都比 width 小時只有原圖本身更小才使用最大版本。格式依 formats 順序選第一個存在的。
+    """
+    if not entry or not entry.get("variants"):
+        return None
+    widths = sorted(int(w) for w in entry["variants"])
+    if width is None:
+        chosen = entry["width"] if entry["width"] in widths else None
+        formats = [name for name in formats if name != "jpeg"]
+    else:
+        candidates = [w for w in widths if w >= width]
+        if candidates:
+            chosen = candidates[0]
+        elif widths[-1] >= entry["width"]:
+            chosen = widths[-1]  # 原圖本身比要求的小，最大版本即為原尺寸
+        else:
+            chosen = None
+    if chosen is None:
+        return None
+    variant = entry["variants"][str(chosen)]
+    for name in formats:
+        if name in variant:
+            return variant[name], name
+    return None
+
+
+# 全域實例（IMAGE_WORKERS 設定行程池大小）
+image_processor = ImageProcessor(max_workers=int(os.getenv("IMAGE_WORKERS", "2")))
+image_manifest = ImageManifest()
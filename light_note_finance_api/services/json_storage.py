@@ -1,21 +1,182 @@
+import hashlib
 import json
+import logging
 import os
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Iterable, Set, AbstractSet
+from datetime import datetime, timedelta
 import uuid
 
+from services.file_modes import inherit_mode
+from services.locks import CollectionLock, SharedCounters
+from services.records import prepare_new_book, encode_sync_cursor, decode_sync_cursor
+from services.query import project_book, matches_filters, encode_cursor, decode_cursor, wants_summaries
+from services.search import SearchIndex
+from services.book_shards import BookShards, manifest_entry
+from services.snapshot import BookSnapshot, LazyBooks, write_snapshot
+from services.summary_blobs import SummaryBlobStore, is_stub, CONTENT_FIELDS
+from services.daily_unlock import plan_daily_unlock, plan_is_valid, apply_daily_unlock, sort_summaries
+from services.user_ops import validate_operations, apply_user_operations
+from services.progress import apply_progress, book_progress, encode_bitmap, decode_bitmap, ids_from_bitmap
+
+logger = logging.getLogger(__name__)
+
+# 日誌模式下，累積多少筆異動後由背景執行緒壓縮回快照
+DEFAULT_COMPACT_THRESHOLD = 1000
+DEFAULT_COMPACT_INTERVAL = 5.0
+# 共享版本計數器未變動時，最多間隔幾秒才 stat 一次檔案（偵測程式以外的修改）
+DEFAULT_STAT_INTERVAL = 1.0
+# 群組提交：累積到多少筆異動時不等時間窗口結束，立即寫入
+DEFAULT_GROUP_COMMIT_OPS = 64
+# 刪除紀錄保留天數；超過的紀錄在新增刪除紀錄時清除（最多每小時一次）
+DEFAULT_TOMBSTONE_DAYS = 30.0
+TOMBSTONE_PRUNE_INTERVAL = 3600.0
+
+
+def _without_seq(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in record.items() if k != 'syncSeq'}
+
+
+def _sync_group(collection: str) -> str:
+    """同步序號群組：書籍與摘要共用 books，使用者為 users"""
+    return 'users' if collection == 'users' else 'books'
+
+
+class _CollectionCache:
+    """單一JSON檔案的常駐快取，以 id 為鍵，依檔案 mtime/size 判斷是否失效"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.log_path = file_path + ".log"
+        # 共享版本計數器中的名稱
+        self.name = os.path.splitext(os.path.basename(file_path))[0]
+        self.signature: Optional[Tuple[Any, ...]] = None
+        # 上次確認快取有效時的共享版本與時間
+        self.version: Optional[int] = None
+        self.checked_at = 0.0
+        self.records: Dict[str, Dict[str, Any]] = {}
+        # 日誌模式：已套用的日誌位移與筆數
+        self.log_offset = 0
+        self.log_entries = 0
+        # 寫入鎖（行程內 + 跨行程）
+        self.lock = CollectionLock(file_path + ".lock")
+        # 目前最大的同步序號，重新載入後延遲計算
+        self.max_seq: Optional[int] = None
+        # 群組提交：已套用到快取、尚未寫入的異動，以及批次編號
+        self.dirty = False
+        self.pending: List[Dict[str, Any]] = []
+        self.pending_since = 0.0
+        self.pending_gen = 0
+        self.flushed_gen = -1
+        # 寫入失敗的批次編號 -> 錯誤
+        self.errors: Dict[int, BaseException] = {}
+
+
 class JSONStorage:
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", journal: bool = False,
+                 compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+                 compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+                 stat_interval: float = DEFAULT_STAT_INTERVAL,
+                 group_commit_window: float = 0.0,
+                 group_commit_ops: int = DEFAULT_GROUP_COMMIT_OPS,
+                 sharded: bool = False,
+                 snapshot: str = "json",
+                 summary_blobs: bool = False,
+                 tombstone_days: float = DEFAULT_TOMBSTONE_DAYS):
         self.data_dir = data_dir
+        # 日誌模式：異動以單行紀錄附加到 *.json.log，由背景執行緒壓縮回快照
+        self.journal = journal
+        self.compact_threshold = compact_threshold
+        self.compact_interval = compact_interval
+        self.stat_interval = stat_interval
+        # 群組提交：異動先套用到快取，最多等 group_commit_window 秒、累積 group_commit_ops 筆，
+        # 或沒有其他寫入在等待集合鎖時一次寫入；請求在寫入完成後才返回。0 表示每次異動立即寫入
+        self.group_commit_window = group_commit_window
+        self.group_commit_ops = group_commit_ops
         self.books_file = os.path.join(data_dir, "books.json")
+        # 分片模式：書籍存放在 data/books/{id}.json 與清單檔，寫入只動到異動的書籍
+        self.sharded = sharded
+        self._shards = BookShards(os.path.join(data_dir, "books")) if sharded else None
+        # 分片模式：書籍ID -> 清單項目，寫入時只重新產生異動書籍的項目
+        self._manifest: Dict[str, Dict[str, Any]] = {}
+        # 書籍快照格式：json 或 binary（data/books.snap，以 mmap 讀取並在存取時才解碼）
+        if snapshot not in ("json", "binary"):
+            raise ValueError(f"不支援的快照格式: {snapshot}")
+        if snapshot == "binary" and sharded:
+            raise ValueError("分片模式不支援二進位快照")
+        if snapshot == "binary" and os.name == "nt":
+            # Windows 無法取代仍被 mmap 對應的檔案（其他 worker 也可能對應著舊快照），每次壓縮都會失敗
+            raise ValueError("二進位快照僅支援 POSIX 系統（Linux/macOS）")
+        self.binary_snapshot = snapshot == "binary"
+        self.snapshot_file = os.path.join(data_dir, "books.snap")
+        # 摘要內容分離：寫入時內容存到 data/summaries/，書籍中的摘要只保留存根
+        # （contentHash、contentLength），讀取單一摘要時才載入內容。
+        # 讀取端一律可解析存根，未啟用時寫入仍內嵌完整內容
+        self.summary_blobs = summary_blobs
+        self._blobs = SummaryBlobStore(os.path.join(data_dir, "summaries"))
         self.users_file = os.path.join(data_dir, "users.json")
+        # 刪除紀錄（供增量同步回傳 tombstone）；保留 tombstone_days 天，0 表示永久保留。
+        # 清除後記錄各序號群組被清除的最大序號（horizon:books / horizon:users），
+        # 游標早於此序號的用戶端可能漏掉刪除，同步時改為完整同步
+        self.tombstones_file = os.path.join(data_dir, "tombstones.json")
+        self.tombstone_days = tombstone_days
+        self._tombstones_pruned_at: Optional[float] = None
+        # 使用者閱讀進度（位元圖）與各書的摘要槽位，寫入進度不會動到 books.json
+        self.progress_file = os.path.join(data_dir, "progress.json")
 
         # 確保資料目錄存在
         os.makedirs(data_dir, exist_ok=True)
 
         # 初始化檔案
-        self._init_file(self.books_file)
+        if sharded:
+            self._init_shards()
+        elif self.binary_snapshot:
+            self._init_snapshot()
+        else:
+            self._init_file(self.books_file)
         self._init_file(self.users_file)
+        self._init_file(self.tombstones_file)
+        self._init_file(self.progress_file)
+
+        # 常駐記憶體索引：檔案只在 mtime/size 改變時重新解析
+        self._caches: Dict[str, _CollectionCache] = {
+            self.books_file: _CollectionCache(self.books_file),
+            self.users_file: _CollectionCache(self.users_file),
+            self.tombstones_file: _CollectionCache(self.tombstones_file),
+            self.progress_file: _CollectionCache(self.progress_file),
+        }
+        # 多個 worker 共用的版本計數器：寫入後遞增，其他 worker 依此判斷快取是否失效
+        self._versions = SharedCounters(
+            os.path.join(data_dir, ".versions"), [cache.name for cache in self._caches.values()]
+        )
+        # 摘要索引：summary id -> (book id, summary)
+        self._summary_index: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        # 全文搜尋索引：第一次搜尋時建立，之後隨寫入增量更新；檔案被外部修改時捨棄重建
+        self._search_index: Optional[SearchIndex] = None
+        # 使用者集合欄位（favoriteBookIds/unlockedBookIds）的成員集合：(使用者ID, 欄位) -> (串列, 集合)
+        # 以串列物件判斷是否失效；寫入時一律換成新的串列，因此不需另外清除
+        self._member_sets: Dict[Tuple[str, str], Tuple[List[str], AbstractSet[str]]] = {}
+
+        # 每個執行緒持有的鎖層數與待確認的寫入批次（集合 -> 批次編號）
+        self._local = threading.local()
+        self._flush_cond = threading.Condition()
+        self._stop_flusher = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._start_flusher()
+
+        self._stop_compactor = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        if self.journal:
+            # 啟動時重播快照與日誌
+            for file_path in self._caches:
+                self._records(file_path)
+            self._compactor = threading.Thread(target=self._compact_loop, daemon=True)
+            self._compactor.start()
+
 
     def _init_file(self, file_path: str):
         """初始化JSON檔案，如果不存在就創建空陣列"""
@@ -23,94 +184,975 @@ class JSONStorage:
             with open(file_path, 'w', encoding='utf-8') as f:
                 json.dump([], f, ensure_ascii=False, indent=2)
 
+    def _init_shards(self):
+        """初始化分片目錄；尚未轉換的 books.json 有資料時拒絕啟動，避免當成空書目"""
+        if self._shards.exists():
+            return
+        if self._read_json(self.books_file):
+            raise RuntimeError("分片模式找不到 data/books/_manifest.json，請先執行 migrate_to_shards.py")
+        self._shards.write_books([], [])
+
+    def _init_snapshot(self):
+        """初始化二進位快照；尚未轉換的 books.json 有資料時拒絕啟動"""
+        if os.path.exists(self.snapshot_file):
+            return
+        if self._read_json(self.books_file):
+            raise RuntimeError("找不到 data/books.snap，請先執行 migrate_to_snapshot.py")
+        write_snapshot(self.snapshot_file)
+
     def _read_json(self, file_path: str) -> List[Dict[str, Any]]:
-        """讀取JSON檔案"""
+        """讀取JSON檔案（檔案損毀時拋出錯誤，避免被當成空資料覆寫）"""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+        except FileNotFoundError:
             return []
 
     def _write_json(self, file_path: str, data: List[Dict[str, Any]]):
-        """寫入JSON檔案"""
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """寫入JSON檔案（先寫暫存檔再原子替換，寫入中斷不會留下殘缺檔案）"""
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(file_path) or '.',
+            prefix=os.path.basename(file_path) + '.',
+            suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            inherit_mode(tmp_path, file_path)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # 鎖
+    @contextmanager
+    def _locked(self, file_path: str):
+        """取得集合的寫入鎖；讀取-修改-寫入必須在鎖內完成
+
+        啟用群組提交時，釋放最後一個鎖後才等待本執行緒的異動寫入完成，
+        等待期間其他請求可以取得鎖並加入同一批次。釋放最外層的鎖時若沒有其他執行緒在等待
+        這個集合的鎖，不會再有異動加入批次，直接寫入而不等到窗口結束。
+        """
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        try:
+            cache = self._caches[file_path]
+            with cache.lock.hold():
+                yield
+                if self._local.depth == 1 and cache.dirty and cache.lock.waiting == 0:
+                    self._flush(cache)
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self._local.tickets = {}
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0 and getattr(self._local, 'tickets', None):
+            self._wait_flushed()
+
+    def get_lock_stats(self) -> Dict[str, Any]:
+        """各集合的鎖等待統計"""
+        return {
+            os.path.splitext(os.path.basename(file_path))[0]: cache.lock.stats()
+            for file_path, cache in self._caches.items()
+        }
+
+    # 快取與索引
+    def _file_signature(self, file_path: str) -> Optional[Tuple[int, int]]:
+        """取得檔案簽章 (mtime_ns, size)，用於判斷快取是否失效"""
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _cache_signature(self, cache: _CollectionCache) -> Tuple[Any, ...]:
+        """快取簽章；日誌模式下同時包含日誌檔，分片模式的書籍為清單檔"""
+        if self.sharded and cache.file_path == self.books_file:
+            return (self._file_signature(self._shards.manifest_path),)
+        snapshot_path = cache.file_path
+        if self.binary_snapshot and cache.file_path == self.books_file:
+            snapshot_path = self.snapshot_file
+        if self.journal:
+            return (self._file_signature(snapshot_path), self._file_signature(cache.log_path))
+        return (self._file_signature(snapshot_path),)
+
+    def _records(self, file_path: str) -> Dict[str, Dict[str, Any]]:
+        """取得常駐的 id -> 資料 索引，檔案有變動時才重新載入
+
+        共享版本未變動時直接使用快取，只有每隔 stat_interval 秒才 stat 檔案確認是否被程式以外的方式修改；
+        共享版本變動時一律重新載入，不依賴檔案簽章（時間戳精度粗的檔案系統上，同大小的改寫簽章可能不變）。
+        """
+        cache = self._caches[file_path]
+        version = self._versions.get(cache.name)
+        if version == cache.version:
+            now = time.monotonic()
+            if now - cache.checked_at < self.stat_interval:
+                return cache.records
+            if self._cache_signature(cache) == cache.signature:
+                cache.checked_at = now
+                return cache.records
+
+        with self._locked(file_path):
+            return self._reload(cache)
+
+    def _reload(self, cache: _CollectionCache) -> Dict[str, Dict[str, Any]]:
+        """在鎖內重新載入快取"""
+        file_path = cache.file_path
+        signature = self._cache_signature(cache)
+        version = self._versions.get(cache.name)
+        if signature == cache.signature and version == cache.version:
+            return cache.records
+
+        if self.sharded and file_path == self.books_file:
+            self._reload_shards(cache)
+        elif (self.journal and cache.signature is not None and signature != cache.signature
+                and signature[0] == cache.signature[0]
+                and signature[1] is not None and signature[1][1] >= cache.log_offset):
+            # 快照未變、日誌只是變長：只重播新增的部分
+            if self._replay_log(cache):
+                signature = self._cache_signature(cache)
+        else:
+            if self.binary_snapshot and file_path == self.books_file:
+                self._open_snapshot(cache)
+            else:
+                records: Dict[str, Dict[str, Any]] = {}
+                for i, item in enumerate(self._read_json(file_path)):
+                    # 缺少ID的資料仍保留，避免下次寫入時遺失
+                    records[item.get('id') or f"__noid_{i}"] = item
+                cache.records = records
+            cache.log_offset = 0
+            cache.log_entries = 0
+            if self.journal and self._replay_log(cache):
+                signature = self._cache_signature(cache)
+
+        cache.signature = signature
+        # 持有跨行程鎖，讀取版本後其他 worker 無法寫入，版本與載入的內容一致
+        cache.version, cache.checked_at = version, time.monotonic()
+        cache.max_seq = None
+        if file_path == self.books_file:
+            self._rebuild_summary_index()
+            self._search_index = None
+        return cache.records
+
+    def _reload_shards(self, cache: _CollectionCache):
+        """依清單重新載入分片書籍；syncSeq 未變的書籍沿用快取，不重新讀檔"""
+        records: Dict[str, Dict[str, Any]] = {}
+        manifest: Dict[str, Dict[str, Any]] = {}
+        for entry in self._shards.read_manifest():
+            book_id = entry.get('id')
+            cached = cache.records.get(book_id)
+            if cached is not None and cached.get('syncSeq') == entry.get('syncSeq'):
+                records[book_id] = cached
+            else:
+                book = self._shards.read_book(book_id)
+                if book is None:
+                    continue
+                records[book_id] = book
+            manifest[book_id] = entry
+        cache.records = records
+        self._manifest = manifest
+
+    def _replay_log(self, cache: _CollectionCache) -> bool:
+        """從目前位移開始重播日誌（呼叫端須持有集合鎖），回傳是否截斷了損壞的結尾
+
+        寫入中斷會在結尾留下不完整的紀錄；若不截斷，之後附加的紀錄都接在損壞的位元組後面，
+        重新啟動時重播停在同一處而遺失。因此在鎖內截回最後一筆完整紀錄的結尾，
+        被捨棄的位元組另存到 *.log.corrupt 供人工檢查。
+        """
+        try:
+            with open(cache.log_path, 'rb') as f:
+                f.seek(cache.log_offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # 寫入中斷留下的不完整紀錄
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    self._apply_entry(cache.records, entry)
+                    cache.log_offset += len(line)
+                    cache.log_entries += 1
+                size = f.seek(0, os.SEEK_END)
+                if size <= cache.log_offset:
+                    return False
+                f.seek(cache.log_offset)
+                tail = f.read()
+        except FileNotFoundError:
+            return False
+
+        logger.warning("日誌 %s 結尾有 %d 位元組不完整或損壞的紀錄，已截斷", cache.log_path, len(tail))
+        with open(cache.log_path + ".corrupt", 'ab') as f:
+            f.write(tail)
+        os.truncate(cache.log_path, cache.log_offset)
+        return True
+
+    def _apply_entry(self, records: Dict[str, Dict[str, Any]], entry: Dict[str, Any]):
+        """套用單筆異動紀錄（所有操作皆為冪等）
+
+        put/del 以整筆資料為單位；sput/sdel 只異動書籍中的摘要，
+        並以新的書籍物件取代，不修改快取中既有的物件。
+        """
+        op = entry['op']
+        if op == 'put':
+            records[entry['record']['id']] = entry['record']
+        elif op == 'del':
+            records.pop(entry['id'], None)
+        elif op in ('sput', 'sdel'):
+            book = records.get(entry['bookId'])
+            if book is None:
+                return
+            summaries = list(book.get('summaries') or [])
+            if op == 'sput':
+                positions = {summary.get('id'): i for i, summary in enumerate(summaries)}
+                for summary in entry['records']:
+                    if summary['id'] in positions:
+                        summaries[positions[summary['id']]] = summary
+                    else:
+                        positions[summary['id']] = len(summaries)
+                        summaries.append(summary)
+            else:
+                removed = set(entry['ids'])
+                summaries = [summary for summary in summaries if summary.get('id') not in removed]
+            records[entry['bookId']] = {
+                **book,
+                'summaries': summaries,
+                'updatedAt': entry['updatedAt'],
+                'syncSeq': entry.get('syncSeq', book.get('syncSeq', 0))
+            }
+
+    def _commit(self, file_path: str, entries: List[Dict[str, Any]]):
+        """持久化已套用到快取的異動（呼叫端須持有集合鎖）
+
+        啟用群組提交時只記錄待寫入的異動並保留跨行程檔案鎖，由背景執行緒或累積到
+        group_commit_ops 筆時一次寫入；呼叫端在 _locked 結束時等待寫入完成。
+        """
+        cache = self._caches[file_path]
+        if self.group_commit_window <= 0:
+            self._write_entries(cache, entries)
+            return
+
+        if not cache.dirty:
+            cache.dirty = True
+            cache.pending_since = time.monotonic()
+            cache.lock.retain()
+        cache.pending.extend(entries)
+        tickets = getattr(self._local, 'tickets', None)
+        if tickets is None:
+            tickets = self._local.tickets = {}
+        tickets[file_path] = cache.pending_gen
+        if len(cache.pending) >= self.group_commit_ops:
+            self._flush(cache)
+        else:
+            with self._flush_cond:
+                self._flush_cond.notify_all()
+
+    def _write_entries(self, cache: _CollectionCache, entries: List[Dict[str, Any]]):
+        """寫入磁碟：一般模式整檔重寫，日誌模式只附加紀錄，分片模式只寫異動的書籍與清單"""
+        file_path = cache.file_path
+        if self.sharded and file_path == self.books_file:
+            self._write_shards(cache, entries)
+            cache.signature = self._cache_signature(cache)
+            self._mark_written(cache)
+            return
+        if not self.journal:
+            self._write_snapshot(cache)
+            cache.signature = self._cache_signature(cache)
+            self._mark_written(cache)
+            return
+
+        payload = b''.join(
+            json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            for entry in entries
+        )
+        with self._locked(file_path):
+            with open(cache.log_path, 'ab') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            cache.log_offset += len(payload)
+            cache.log_entries += len(entries)
+            cache.signature = self._cache_signature(cache)
+            self._mark_written(cache)
+
+            if cache.log_entries >= self.compact_threshold * 4:
+                # 背景壓縮跟不上時，由寫入端直接壓縮避免日誌無限成長
+                self._compact_file(file_path)
+
+    def _write_shards(self, cache: _CollectionCache, entries: List[Dict[str, Any]]):
+        """寫入異動涉及的書籍檔與清單；已刪除的書籍在清單寫入後移除檔案"""
+        book_ids = dict.fromkeys(
+            entry['record']['id'] if entry['op'] == 'put' else entry.get('bookId') or entry['id']
+            for entry in entries
+        )
+        books = [cache.records[book_id] for book_id in book_ids if book_id in cache.records]
+        deleted = [book_id for book_id in book_ids if book_id not in cache.records]
+        for book in books:
+            self._manifest[book['id']] = manifest_entry(book)
+        for book_id in deleted:
+            self._manifest.pop(book_id, None)
+        manifest = [self._manifest[book_id] for book_id in list(cache.records) if book_id in self._manifest]
+        self._shards.write_books(books, manifest, deleted)
+
+    def _write_snapshot(self, cache: _CollectionCache):
+        """將整個集合寫回快照檔（呼叫端須持有集合鎖）
+
+        二進位快照時未修改的書籍直接複製原始位元組，寫入後改由新快照提供資料，
+        修改過的書籍不再常駐記憶體。
+        """
+        if isinstance(cache.records, LazyBooks):
+            write_snapshot(self.snapshot_file, lazy=cache.records)
+            self._open_snapshot(cache)
+            self._rebuild_summary_index()
+        else:
+            self._write_json(cache.file_path, list(cache.records.values()))
+
+    def _open_snapshot(self, cache: _CollectionCache):
+        """改由目前的快照檔提供書籍；舊快照在讀取端都釋放後關閉 mmap"""
+        previous = cache.records if isinstance(cache.records, LazyBooks) else None
+        cache.records = LazyBooks(BookSnapshot(self.snapshot_file))
+        if previous is not None:
+            previous.snapshot.retire()
+
+    # 日誌壓縮
+    def compact(self):
+        """將所有日誌壓縮回快照檔"""
+        for file_path in self._caches:
+            self._compact_file(file_path)
+
+    def close(self):
+        """寫入尚未寫入的異動，停止背景執行緒並將日誌併入快照"""
+        self._stop_flusher.set()
+        with self._flush_cond:
+            self._flush_cond.notify_all()
+        if self._flusher:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        self._stop_compactor.set()
+        if self._compactor:
+            self._compactor.join()
+            self._compactor = None
+        self.compact()
+
+    # 群組提交
+    def flush(self):
+        """立即寫入所有集合尚未寫入的異動"""
+        for file_path, cache in self._caches.items():
+            if cache.dirty:
+                with self._locked(file_path):
+                    self._flush(cache)
+
+    def _flush(self, cache: _CollectionCache):
+        """將累積的異動一次寫入並喚醒等待中的請求（呼叫端須持有集合鎖）"""
+        if not cache.dirty:
+            return
+        entries, generation = cache.pending, cache.pending_gen
+        cache.pending, cache.dirty = [], False
+        cache.pending_gen += 1
+        try:
+            self._write_entries(cache, entries)
+        except BaseException as e:
+            # 捨棄快取中未寫入的異動，下次讀取時由磁碟重新載入
+            cache.signature = None
+            cache.version = None
+            cache.errors[generation] = e
+            for old in [g for g in cache.errors if g < generation - 100]:
+                del cache.errors[old]
+            raise
+        finally:
+            cache.lock.release_retained()
+            with self._flush_cond:
+                cache.flushed_gen = generation
+                self._flush_cond.notify_all()
+
+    def _wait_flushed(self):
+        """等待本執行緒提交的異動寫入磁碟；所屬批次寫入失敗時拋出錯誤"""
+        tickets, self._local.tickets = self._local.tickets, {}
+        for file_path, generation in tickets.items():
+            cache = self._caches[file_path]
+            with self._flush_cond:
+                while cache.flushed_gen < generation:
+                    self._flush_cond.wait()
+            error = cache.errors.get(generation)
+            if error is not None:
+                raise RuntimeError(f"寫入資料失敗: {error}") from error
+
+    def _start_flusher(self):
+        self._stop_flusher = threading.Event()
+        self._flusher = None
+        if self.group_commit_window > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        """背景寫入執行緒：最早的待寫入異動滿 group_commit_window 秒時寫入該集合"""
+        while not self._stop_flusher.is_set():
+            with self._flush_cond:
+                dirty = [cache for cache in self._caches.values() if cache.dirty]
+                if not dirty:
+                    if not self._stop_flusher.is_set():
+                        self._flush_cond.wait()
+                    continue
+            delay = min(cache.pending_since for cache in dirty) + self.group_commit_window - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.monotonic()
+            for file_path, cache in self._caches.items():
+                if cache.dirty and now - cache.pending_since >= self.group_commit_window:
+                    try:
+                        with self._locked(file_path):
+                            self._flush(cache)
+                    except Exception:
+                        # 錯誤已記錄在所屬批次，等待中的請求會收到例外
+                        logger.exception("群組提交寫入 %s 失敗", file_path)
+
+    # 多行程
+    def preload(self, search_index: Optional[bool] = None):
+        """載入所有集合；生產模式在 fork worker 前呼叫，子行程共用已載入的記憶體
+
+        search_index 指定是否一併建立搜尋索引，None 時依設定決定：啟用摘要內容分離或二進位快照時
+        不建立（索引需要所有摘要內容，會把刻意留在磁碟上的內容全部讀進主行程），改在第一次搜尋時建立。
+        """
+        for file_path in self._caches:
+            self._records(file_path)
+        if search_index is None:
+            search_index = not (self.summary_blobs or self.binary_snapshot)
+        if search_index:
+            self.search("")
+
+    def after_fork(self):
+        """在 fork 出的子行程中呼叫：背景執行緒不會被複製，重新啟動群組提交與日誌壓縮"""
+        self._flush_cond = threading.Condition()
+        self._start_flusher()
+        self._stop_compactor = threading.Event()
+        self._compactor = None
+        if self.journal:
+            self._compactor = threading.Thread(target=self._compact_loop, daemon=True)
+            self._compactor.start()
+
+    def _compact_file(self, file_path: str):
+        """將單一檔案的日誌併入快照並清空日誌"""
+        if not self.journal:
+            return
+        cache = self._caches[file_path]
+        with self._locked(file_path):
+            self._flush(cache)
+            # 其他 worker 附加的紀錄必須先重播，否則快照會漏掉它們而日誌又被清空
+            self._reload(cache)
+            if cache.log_entries == 0:
+                return
+
+            # 先寫快照再清空日誌；中途當機時重播的紀錄皆為冪等，不會造成錯誤
+            self._write_snapshot(cache)
+            with open(cache.log_path, 'wb'):
+                pass
+            cache.log_offset = 0
+            cache.log_entries = 0
+            cache.signature = self._cache_signature(cache)
+            self._mark_written(cache)
+
+    def _mark_written(self, cache: _CollectionCache):
+        """寫入後遞增共享版本，通知其他 worker 重新載入（呼叫端須持有集合鎖）"""
+        cache.version = self._versions.bump(cache.name)
+        cache.checked_at = time.monotonic()
+
+    def _compact_loop(self):
+        """背景壓縮執行緒"""
+        while not self._stop_compactor.wait(self.compact_interval):
+            for file_path, cache in self._caches.items():
+                if cache.log_entries >= self.compact_threshold:
+                    try:
+                        self._compact_file(file_path)
+                    except Exception:
+                        logger.exception("日誌壓縮 %s 失敗", file_path)
+
+    def _rebuild_summary_index(self):
+        """重建摘要索引（建好後一次替換，讀取端不會看到建立中的索引）
+
+        二進位快照不建立全域索引，摘要改由所屬書籍的摘要表查詢（見 _find_summary）。
+        """
+        index: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        books = self._caches[self.books_file].records
+        if not isinstance(books, LazyBooks):
+            for book in list(books.values()):
+                self._index_summaries(book, index)
+        self._summary_index = index
+
+    def _find_summary(self, book_id: str, summary_id: str) -> Optional[Dict[str, Any]]:
+        """查詢書籍中的摘要（不複製）"""
+        books = self._records(self.books_file)
+        if isinstance(books, LazyBooks):
+            return books.summary(book_id, summary_id)
+        entry = self._summary_index.get(summary_id)
+        return entry[1] if entry and entry[0] == book_id else None
+
+    def _book_heads(self) -> Iterator[Tuple[Dict[str, Any], int]]:
+        """依目錄順序逐本產生 (書籍欄位, 摘要數)；二進位快照只解碼書籍欄位，不含摘要"""
+        books = self._records(self.books_file)
+        if isinstance(books, LazyBooks):
+            yield from books.heads()
+            return
+        for book in list(books.values()):
+            yield book, len(book.get('summaries') or [])
+
+    def _each_book(self, books: Dict[str, Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """依目錄順序逐本產生書籍；二進位快照每次只解碼一本，不會一次解碼整個書目"""
+        for book_id in list(books):
+            book = books.get(book_id)
+            if book is not None:
+                yield book
+
+    def _index_summaries(self, book: Dict[str, Any], index: Optional[Dict[str, Tuple[str, Dict[str, Any]]]] = None):
+        """將書籍的摘要加入索引"""
+        if index is None:
+            index = self._summary_index
+        for summary in book.get('summaries') or []:
+            if summary.get('id'):
+                index[summary['id']] = (book.get('id'), summary)
+
+    def _unindex_summaries(self, book: Dict[str, Any]):
+        """將書籍的摘要從索引移除"""
+        for summary in book.get('summaries') or []:
+            entry = self._summary_index.get(summary.get('id'))
+            if entry and entry[0] == book.get('id'):
+                del self._summary_index[summary['id']]
+
+    def _stub_summary(self, summary: Dict[str, Any]) -> Dict[str, Any]:
+        """啟用摘要內容分離時，將內容寫入區塊存放區並回傳存根；否則原樣回傳"""
+        if not self.summary_blobs or 'content' not in summary:
+            return summary
+        content = summary['content'] or ''
+        stub = {k: v for k, v in summary.items() if k != 'content'}
+        stub['contentHash'] = self._blobs.put(content)
+        stub['contentLength'] = len(content)
+        return stub
+
+    def _with_content(self, summary: Dict[str, Any], cache: bool = True) -> Dict[str, Any]:
+        """將存根還原為含 content 的摘要（與內嵌內容時的格式相同）；不是存根時原樣回傳"""
+        if not is_stub(summary):
+            return summary
+        resolved = {k: v for k, v in summary.items() if k not in CONTENT_FIELDS}
+        resolved['content'] = self._blobs.get(summary['contentHash'], cache)
+        return resolved
+
+    def _book_with_content(self, book: Dict[str, Any], cache: bool = True) -> Dict[str, Any]:
+        """書籍的摘要都還原為完整內容（搜尋索引、匯出、同步與明確要求內容的查詢用）"""
+        summaries = book.get('summaries')
+        if not summaries or not any(is_stub(summary) for summary in summaries):
+            return book
+        return {**book, 'summaries': [self._with_content(summary, cache) for summary in summaries]}
+
+    def _put_books(self, new_books: List[Dict[str, Any]]):
+        """寫入書籍到快取、同步摘要索引並標記同步序號（呼叫端須持有書籍鎖）
+
+        內容未變的摘要保留原本的序號；被移除的摘要會留下 tombstone。
+        """
+        books = self._records(self.books_file)
+        seq = self._next_seq(self.books_file)
+        entries = []
+        tombstones = []
+        for book in new_books:
+            old_book = books.get(book['id'])
+            old_summaries = {}
+            if old_book:
+                self._unindex_summaries(old_book)
+                old_summaries = {summary.get('id'): summary for summary in old_book.get('summaries') or []}
+
+            summaries = []
+            for summary in book.get('summaries') or []:
+                summary = self._stub_summary(summary)
+                old_summary = old_summaries.pop(summary.get('id'), None)
+                unchanged = old_summary is not None and _without_seq(old_summary) == _without_seq(summary)
+                summaries.append({**summary, 'syncSeq': old_summary.get('syncSeq', seq) if unchanged else seq})
+            if 'summaries' in book:
+                book['summaries'] = summaries
+            book['syncSeq'] = seq
+
+            tombstones.extend(
+                {'collection': 'summaries', 'entityId': summary_id, 'bookId': book['id'], 'syncSeq': seq}
+                for summary_id in old_summaries if summary_id
+            )
+            books[book['id']] = book
+            self._index_summaries(book)
+            if self._search_index is not None:
+                self._search_index.index_book(self._book_with_content(book))
+            entries.append({'op': 'put', 'record': book})
+
+        self._commit(self.books_file, entries)
+        self._add_tombstones(tombstones)
+
+    # 增量同步
+    def _next_seq(self, file_path: str) -> int:
+        """分配集合的下一個同步序號（呼叫端須持有該集合的鎖）
+
+        books 與其摘要共用同一組序號，users 另有一組；寫入前一律在鎖內
+        重新載入，因此多個 worker 分配到的序號不會重複。
+        """
+        cache = self._caches[file_path]
+        self._records(file_path)
+        if cache.max_seq is None:
+            cache.max_seq = self._scan_max_seq(file_path)
+        cache.max_seq += 1
+        return cache.max_seq
+
+    def _scan_max_seq(self, file_path: str) -> int:
+        """掃描集合（含 tombstone）中最大的同步序號"""
+        seqs = [0]
+        records = self._records(file_path)
+        if isinstance(records, LazyBooks):
+            # 快照中的最大序號記錄在檔頭，只需掃描修改過的書籍
+            seqs.append(records.snapshot.max_seq)
+            records = {book.get('id'): book for book in records.modified_values()}
+        for record in list(records.values()):
+            seqs.append(record.get('syncSeq', 0))
+            for summary in record.get('summaries') or []:
+                seqs.append(summary.get('syncSeq', 0))
+        group = 'users' if file_path == self.users_file else 'books'
+        for tombstone in list(self._records(self.tombstones_file).values()):
+            if tombstone['collection'] == 'horizon':
+                # 已清除的刪除紀錄仍佔用過序號，不可重複分配
+                if tombstone['group'] == group:
+                    seqs.append(tombstone.get('prunedSeq', 0))
+            elif _sync_group(tombstone['collection']) == group:
+                seqs.append(tombstone.get('syncSeq', 0))
+        return max(seqs)
+
+    def _add_tombstones(self, tombstones: List[Dict[str, Any]]):
+        """記錄刪除（呼叫端須持有對應集合的鎖；鎖順序固定為集合 -> tombstones）"""
+        if not tombstones:
+            return
+        deleted_at = datetime.now().isoformat()
+        with self._locked(self.tombstones_file):
+            records = self._records(self.tombstones_file)
+            entries = []
+            for tombstone in tombstones:
+                record = {
+                    **tombstone,
+                    'id': f"{tombstone['collection']}:{tombstone['entityId']}",
+                    'deletedAt': deleted_at
+                }
+                records[record['id']] = record
+                entries.append({'op': 'put', 'record': record})
+            self._commit(self.tombstones_file, entries)
+
+            now = time.monotonic()
+            if self._tombstones_pruned_at is None or now - self._tombstones_pruned_at >= TOMBSTONE_PRUNE_INTERVAL:
+                self._tombstones_pruned_at = now
+                self.prune_tombstones()
+
+    def prune_tombstones(self, max_age_days: Optional[float] = None) -> int:
+        """清除超過保留天數的刪除紀錄，回傳清除數
+
+        被清除紀錄的最大序號記在 horizon 紀錄中；游標早於此序號的增量同步會改回傳完整資料。
+        """
+        days = self.tombstone_days if max_age_days is None else max_age_days
+        if days <= 0:
+            return 0
+        cutoff = datetime.now() - timedelta(days=days)
+        with self._locked(self.tombstones_file):
+            records = self._records(self.tombstones_file)
+            expired = [
+                record for record in list(records.values())
+                if record['collection'] != 'horizon' and datetime.fromisoformat(record['deletedAt']) < cutoff
+            ]
+            if not expired:
+                return 0
+
+            entries: List[Dict[str, Any]] = []
+            pruned: Dict[str, int] = {}
+            for record in expired:
+                group = _sync_group(record['collection'])
+                pruned[group] = max(pruned.get(group, 0), record.get('syncSeq', 0))
+                records.pop(record['id'], None)
+                entries.append({'op': 'del', 'id': record['id']})
+            pruned_at = datetime.now().isoformat()
+            for group, seq in pruned.items():
+                horizon_id = f"horizon:{group}"
+                previous = records.get(horizon_id)
+                horizon = {
+                    'id': horizon_id,
+                    'collection': 'horizon',
+                    'group': group,
+                    'prunedSeq': max(seq, previous['prunedSeq'] if previous else 0),
+                    'prunedAt': pruned_at,
+                }
+                records[horizon_id] = horizon
+                entries.append({'op': 'put', 'record': horizon})
+            self._commit(self.tombstones_file, entries)
+        return len(expired)
+
+    def _read_unlocked(self, file_path: str, read):
+        """不取集合鎖讀取 read() 的結果
+
+        讀取前後鎖的 epoch 相同且為偶數時，期間沒有執行緒持有鎖，結果是一致的快照；
+        其他 worker 的寫入由 _records 的共享版本檢查反映。read() 回傳 None 表示需要在鎖內讀取。
+        多次衝突後改在鎖內讀取。
+        """
+        lock = self._caches[file_path].lock
+        for _ in range(3):
+            epoch = lock.epoch
+            if epoch % 2 == 0:
+                result = read()
+                if result is not None and lock.epoch == epoch:
+                    return result
+            time.sleep(0)
+        with self._locked(file_path):
+            self._current_seq(file_path)
+            return read()
+
+    def get_changes(self, since: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """取得游標之後新增、修改或刪除的書籍、摘要與使用者
+
+        since 為 None 時回傳全部資料；回傳的 cursor 供下次同步使用。游標早於已清除的刪除紀錄時
+        （見 prune_tombstones）同樣回傳全部資料並設定 resync，用戶端應以回應取代本機資料。
+        資料與序號取自同一個一致的快取快照（不取集合鎖，見 _read_unlocked），
+        確保游標之前的異動都已包含在回應中。
+        """
+        cursor = decode_sync_cursor(since)
+
+        def read_books():
+            records = self._records(self.books_file)
+            seq = self._caches[self.books_file].max_seq
+            if seq is None:
+                return None
+            if isinstance(records, LazyBooks):
+                return records.copy(), [], seq
+            return None, list(records.values()), seq
+
+        def read_users():
+            users = list(self._records(self.users_file).values())
+            seq = self._caches[self.users_file].max_seq
+            return None if seq is None else (users, seq)
+
+        lazy, books, books_seq = self._read_unlocked(self.books_file, read_books)
+        users, users_seq = self._read_unlocked(self.users_file, read_users)
+        tombstones = list(self._records(self.tombstones_file).values())
+
+        horizon = {
+            tombstone['group']: tombstone.get('prunedSeq', 0)
+            for tombstone in tombstones if tombstone['collection'] == 'horizon'
+        }
+        resync = since is not None and (
+            cursor['books'] < horizon.get('books', 0) or cursor['users'] < horizon.get('users', 0)
+        )
+        if resync:
+            since = None
+
+        # 尚未帶有 syncSeq 的舊資料視為序號 0，完整同步時也要包含
+        since_books = cursor['books'] if since is not None else -1
+        since_users = cursor['users'] if since is not None else -1
+        changes: Dict[str, Any] = {
+            'books': [],
+            'summaries': [],
+            'users': [],
+            'deleted': {'books': [], 'summaries': [], 'users': []},
+        }
+        live_summaries = set()
+        live_books = set()
+        if lazy is not None:
+            # 二進位快照：只解碼有異動的書籍，其餘只讀取摘要表取得仍存在的摘要ID
+            for book_id in lazy:
+                live_books.add(book_id)
+                if lazy.changed_since(book_id, since_books):
+                    books.append(lazy[book_id])
+                else:
+                    live_summaries.update(lazy.summary_ids(book_id))
+        for book in books:
+            if book.get('syncSeq', 0) > since_books:
+                changes['books'].append(project_book(book, None))
+            for summary in book.get('summaries') or []:
+                live_summaries.add(summary.get('id'))
+                if summary.get('syncSeq', 0) > since_books:
+                    changes['summaries'].append(self._with_content(summary, cache=False))
+        for user in users:
+            if user.get('syncSeq', 0) > since_users and (user_id is None or user.get('id') == user_id):
+                changes['users'].append(user)
+
+        if since is not None:
+            live = {
+                'books': live_books | {book.get('id') for book in books},
+                'summaries': live_summaries,
+                'users': {user.get('id') for user in users},
+            }
+            for tombstone in tombstones:
+                collection = tombstone['collection']
+                if collection == 'horizon':
+                    continue
+                since_group = since_users if collection == 'users' else since_books
+                # 已重新建立的資料不回傳 tombstone
+                if tombstone.get('syncSeq', 0) <= since_group or tombstone['entityId'] in live[collection]:
+                    continue
+                if collection == 'users' and user_id is not None and tombstone['entityId'] != user_id:
+                    continue
+                if collection == 'summaries':
+                    changes['deleted']['summaries'].append({'id': tombstone['entityId'], 'bookId': tombstone.get('bookId')})
+                else:
+                    changes['deleted'][collection].append(tombstone['entityId'])
+
+        changes['cursor'] = encode_sync_cursor({'books': books_seq, 'users': users_seq})
+        changes['resync'] = resync
+        return changes
+
+    def _current_seq(self, file_path: str) -> int:
+        """目前已分配的最大同步序號（呼叫端須持有該集合的鎖）"""
+        cache = self._caches[file_path]
+        if cache.max_seq is None:
+            cache.max_seq = self._scan_max_seq(file_path)
+        return cache.max_seq
 
     # Books CRUD
     def get_all_books(self) -> List[Dict[str, Any]]:
-        """獲取所有書籍"""
-        return self._read_json(self.books_file)
+        """獲取所有書籍（啟用摘要內容分離時摘要為存根）"""
+        # list() 先取快照，避免其他執行緒寫入時迭代中的字典被修改
+        return [dict(book) for book in list(self._records(self.books_file).values())]
 
-    def get_book_by_id(self, book_id: str) -> Optional[Dict[str, Any]]:
-        """根據ID獲取書籍"""
-        books = self._read_json(self.books_file)
-        for book in books:
-            if book.get('id') == book_id:
-                return book
-        return None
+    def list_books(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                   is_published: Optional[bool] = None, is_completed: Optional[bool] = None,
+                   fields: Optional[List[str]] = None,
+                   with_content: bool = False) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分頁、篩選並投影書籍列表，回傳 (書籍, 下一頁游標)
+
+        啟用摘要內容分離時，投影出的摘要預設為存根；with_content=True 時還原完整內容。
+        """
+        start = decode_cursor(cursor)
+        records = self._records(self.books_file)
+        # 二進位快照：不需要摘要時只解碼書籍欄位
+        lazy = isinstance(records, LazyBooks) and not wants_summaries(fields)
+        books = list(records) if lazy else list(records.values())
+
+        items: List[Dict[str, Any]] = []
+        for position in range(start, len(books)):
+            if limit is not None and len(items) >= limit:
+                return items, encode_cursor(position)
+            try:
+                book, summary_count = records.head(books[position]) if lazy else (books[position], None)
+            except KeyError:
+                continue
+            if matches_filters(book, is_published, is_completed):
+                if with_content and wants_summaries(fields):
+                    book = self._book_with_content(book, cache=False)
+                items.append(project_book(book, fields, summary_count))
+        return items, None
+
+    def get_books_version(self) -> str:
+        """書籍集合的版本號；取自檔案簽章，多個 worker 之間一致"""
+        self._records(self.books_file)
+        signature = self._caches[self.books_file].signature
+        return hashlib.sha1(repr(signature).encode()).hexdigest()[:16]
+
+    def get_book_version(self, book_id: str) -> Optional[str]:
+        """單本書籍的版本（updatedAt），書籍不存在時回傳 None；二進位快照只解碼書籍欄位"""
+        records = self._records(self.books_file)
+        if isinstance(records, LazyBooks):
+            return records.head(book_id)[0].get('updatedAt', '') if book_id in records else None
+        book = records.get(book_id)
+        return book.get('updatedAt', '') if book else None
+
+    def get_book_by_id(self, book_id: str, with_content: bool = False) -> Optional[Dict[str, Any]]:
+        """根據ID獲取書籍；啟用摘要內容分離時摘要為存根，with_content=True 時還原完整內容"""
+        book = self._records(self.books_file).get(book_id)
+        if not book:
+            return None
+        return dict(self._book_with_content(book) if with_content else book)
+
+    def iter_books(self) -> Iterator[Dict[str, Any]]:
+        """逐本產生書籍（含摘要完整內容），供串流匯出使用"""
+        for book in self._each_book(self._records(self.books_file)):
+            yield dict(self._book_with_content(book, cache=False))
+
+    def iter_book_heads(self) -> Iterator[Dict[str, Any]]:
+        """逐本產生不含摘要的書籍欄位（圖片引用等只需書籍欄位的掃描用）
+
+        不還原摘要內容；二進位快照只解碼書籍欄位。
+        """
+        records = self._records(self.books_file)
+        if isinstance(records, LazyBooks):
+            for head, _ in records.heads():
+                yield head
+            return
+        for book in list(records.values()):
+            yield {k: v for k, v in book.items() if k != 'summaries'}
 
     def create_book(self, book_data: Dict[str, Any]) -> Dict[str, Any]:
         """創建新書籍"""
-        books = self._read_json(self.books_file)
+        return self.create_books([book_data])[0]
 
-        # 生成ID如果沒有提供
-        if 'id' not in book_data or not book_data['id']:
-            book_data['id'] = str(uuid.uuid4())
+    def create_books(self, books_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批次創建書籍，整批只寫入一次"""
+        now = datetime.now().isoformat()
+        for book_data in books_data:
+            prepare_new_book(book_data, now)
 
-        # 添加創建時間
-        book_data['createdAt'] = datetime.now().isoformat()
-        book_data['updatedAt'] = datetime.now().isoformat()
+        with self._locked(self.books_file):
+            self._put_books([dict(book_data) for book_data in books_data])
+        return books_data
 
-        books.append(book_data)
-        self._write_json(self.books_file, books)
-        return book_data
+    def update_book(self, book_id: str, book_data: Dict[str, Any], merge: bool = False) -> Optional[Dict[str, Any]]:
+        """更新書籍；merge=True 時在鎖內與現有資料合併，避免併發更新遺失"""
+        with self._locked(self.books_file):
+            book = self._records(self.books_file).get(book_id)
+            if not book:
+                return None
 
-    def update_book(self, book_id: str, book_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """更新書籍"""
-        books = self._read_json(self.books_file)
+            if merge:
+                book_data = {**book, **book_data}
 
-        for i, book in enumerate(books):
-            if book.get('id') == book_id:
-                # 保持原有的ID和創建時間
-                book_data['id'] = book_id
-                book_data['createdAt'] = book.get('createdAt', datetime.now().isoformat())
-                book_data['updatedAt'] = datetime.now().isoformat()
+            # 保持原有的ID和創建時間
+            book_data['id'] = book_id
+            book_data['createdAt'] = book.get('createdAt', datetime.now().isoformat())
+            book_data['updatedAt'] = datetime.now().isoformat()
 
-                books[i] = book_data
-                self._write_json(self.books_file, books)
-                return book_data
-
-        return None
+            self._put_books([dict(book_data)])
+            return book_data
 
     def delete_book(self, book_id: str) -> bool:
         """刪除書籍"""
-        books = self._read_json(self.books_file)
-        original_length = len(books)
+        with self._locked(self.books_file):
+            books = self._records(self.books_file)
+            book = books.pop(book_id, None)
+            if not book:
+                return False
 
-        books = [book for book in books if book.get('id') != book_id]
-
-        if len(books) < original_length:
-            self._write_json(self.books_file, books)
+            self._unindex_summaries(book)
+            if self._search_index is not None:
+                self._search_index.remove_book(book_id)
+            self._commit(self.books_file, [{'op': 'del', 'id': book_id}])
+            self._add_tombstones([{
+                'collection': 'books', 'entityId': book_id, 'syncSeq': self._next_seq(self.books_file)
+            }])
             return True
-        return False
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+        """全文搜尋書籍標題、簡介與摘要內容，回傳 (該頁命中, 總數)"""
+        self._records(self.books_file)
+        index = self._search_index
+        if index is None:
+            # 在書籍鎖內建立，避免建立期間的寫入沒有反映到索引
+            with self._locked(self.books_file):
+                books = self._records(self.books_file)
+                index = self._search_index
+                if index is None:
+                    index = SearchIndex()
+                    index.rebuild(self._book_with_content(book, cache=False) for book in self._each_book(books))
+                    self._search_index = index
+        return index.search(query, offset, limit)
 
     # Users CRUD
     def get_all_users(self) -> List[Dict[str, Any]]:
         """獲取所有使用者"""
-        return self._read_json(self.users_file)
+        return [dict(user) for user in list(self._records(self.users_file).values())]
 
     def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
         """根據ID獲取使用者"""
-        users = self._read_json(self.users_file)
-        for user in users:
-            if user.get('id') == user_id:
-                return user
-        return None
+        user = self._records(self.users_file).get(user_id)
+        return dict(user) if user else None
 
     def create_user(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """創建新使用者"""
-        users = self._read_json(self.users_file)
-
         # 生成ID如果沒有提供
         if 'id' not in user_data or not user_data['id']:
             user_data['id'] = str(uuid.uuid4())
@@ -119,109 +1161,401 @@ class JSONStorage:
         user_data['createdAt'] = datetime.now().isoformat()
         user_data['updatedAt'] = datetime.now().isoformat()
 
-        users.append(user_data)
-        self._write_json(self.users_file, users)
+        with self._locked(self.users_file):
+            users = self._records(self.users_file)
+            user = users[user_data['id']] = {**user_data, 'syncSeq': self._next_seq(self.users_file)}
+            self._commit(self.users_file, [{'op': 'put', 'record': user}])
         return user_data
 
-    def update_user(self, user_id: str, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """更新使用者"""
-        users = self._read_json(self.users_file)
+    def update_user(self, user_id: str, user_data: Dict[str, Any], merge: bool = False) -> Optional[Dict[str, Any]]:
+        """更新使用者；merge=True 時在鎖內與現有資料合併，避免併發更新遺失"""
+        with self._locked(self.users_file):
+            users = self._records(self.users_file)
+            user = users.get(user_id)
+            if not user:
+                return None
 
-        for i, user in enumerate(users):
-            if user.get('id') == user_id:
-                # 保持原有的ID和創建時間
-                user_data['id'] = user_id
-                user_data['createdAt'] = user.get('createdAt', datetime.now().isoformat())
-                user_data['updatedAt'] = datetime.now().isoformat()
+            if merge:
+                user_data = {**user, **user_data}
 
-                users[i] = user_data
-                self._write_json(self.users_file, users)
-                return user_data
+            # 保持原有的ID和創建時間
+            user_data['id'] = user_id
+            user_data['createdAt'] = user.get('createdAt', datetime.now().isoformat())
+            user_data['updatedAt'] = datetime.now().isoformat()
 
-        return None
+            user = users[user_id] = {**user_data, 'syncSeq': self._next_seq(self.users_file)}
+            self._commit(self.users_file, [{'op': 'put', 'record': user}])
+            return user_data
+
+    def _member_set(self, user_id: str, field: str, values: Optional[List[str]]) -> AbstractSet[str]:
+        """使用者集合欄位的成員集合，串列未變更時重複使用，判斷成員為 O(1)"""
+        if not values:
+            return frozenset()
+        cached = self._member_sets.get((user_id, field))
+        if cached is None or cached[0] is not values:
+            cached = self._member_sets[(user_id, field)] = (values, frozenset(values))
+        return cached[1]
+
+    def patch_user(self, user_id: str, operations: List[Dict[str, Any]]) -> Optional[Tuple[Dict[str, Any], List[Any]]]:
+        """在使用者鎖內依序套用原子操作（increment/add/remove/toggle/push），回傳 (使用者, 各操作結果)
+
+        整批操作只寫入一筆紀錄，沒有變更時不寫入；使用者不存在時回傳 None，操作不合法時拋出 ValueError。
+        """
+        validate_operations(operations)
+        with self._locked(self.users_file):
+            users = self._records(self.users_file)
+            user = users.get(user_id)
+            if not user:
+                return None
+
+            updated, results, changed = apply_user_operations(
+                user, operations, lambda field: self._member_set(user_id, field, user.get(field))
+            )
+            if not changed:
+                return dict(user), results
+
+            updated['updatedAt'] = datetime.now().isoformat()
+            user = users[user_id] = {**updated, 'syncSeq': self._next_seq(self.users_file)}
+            self._commit(self.users_file, [{'op': 'put', 'record': user}])
+            return dict(user), results
 
     def delete_user(self, user_id: str) -> bool:
         """刪除使用者"""
-        users = self._read_json(self.users_file)
-        original_length = len(users)
-
-        users = [user for user in users if user.get('id') != user_id]
+        with self._locked(self.users_file):
+            users = self._records(self.users_file)
+            if users.pop(user_id, None) is None:
+                return False
+            for field in ('favoriteBookIds', 'unlockedBookIds'):
+                self._member_sets.pop((user_id, field), None)
 
-        if len(users) < original_length:
-            self._write_json(self.users_file, users)
+            self._commit(self.users_file, [{'op': 'del', 'id': user_id}])
+            self._add_tombstones([{
+                'collection': 'users', 'entityId': user_id, 'syncSeq': self._next_seq(self.users_file)
+            }])
+            with self._locked(self.progress_file):
+                if self._records(self.progress_file).pop(f'user:{user_id}', None) is not None:
+                    self._commit(self.progress_file, [{'op': 'del', 'id': f'user:{user_id}'}])
             return True
-        return False
+
+    # 每日解鎖
+    def _sorted_summaries(self, book_id: str) -> List[Dict[str, Any]]:
+        """書籍的摘要依 order 排序"""
+        book = self._records(self.books_file).get(book_id)
+        return sort_summaries(book.get('summaries') or []) if book else []
+
+    def _next_unlock_book(self, excluded: set) -> Optional[str]:
+        """依目錄順序找出第一本未解鎖、已上架且有摘要的書籍"""
+        for book, summary_count in self._book_heads():
+            if book.get('id') not in excluded and book.get('isPublished', True) and summary_count:
+                return book['id']
+        return None
+
+    def _summary_exists(self, book_id: str, summary_id: str) -> bool:
+        return self._find_summary(book_id, summary_id) is not None
+
+    def _plan_summaries(self, plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """計畫中仍存在的摘要"""
+        summaries = []
+        for book_id, summary_ids in plan['summaryIds'].items():
+            for summary_id in summary_ids:
+                summary = self._find_summary(book_id, summary_id)
+                if summary is not None:
+                    summaries.append(dict(self._with_content(summary)))
+        return summaries
+
+    def _unlock_plan_progress(self, user_id: str, plan: Dict[str, Any]):
+        """將計畫中的摘要記錄為已解鎖（冪等，已記錄過時不寫入）"""
+        with self._locked(self.progress_file):
+            self._put_progress(user_id, {
+                book_id: {'unlocked_ids': summary_ids} for book_id, summary_ids in plan['summaryIds'].items()
+            })
+
+    def daily_unlock(self, user_id: str, day: str) -> Optional[Dict[str, Any]]:
+        """解鎖使用者當天的摘要，回傳 {user, summaries, newBookId, alreadyUnlocked}；使用者不存在時回傳 None
+
+        選擇摘要與更新使用者在同一次使用者鎖內完成；有預先計算且仍有效的計畫時直接套用，
+        不必掃描書籍。使用者紀錄先寫入，摘要的解鎖狀態接著寫入閱讀進度；
+        兩次寫入之間中斷時，同一天再次呼叫會依 lastDailyUnlock 補上閱讀進度。
+        """
+        with self._locked(self.users_file):
+            users = self._records(self.users_file)
+            user = users.get(user_id)
+            if not user:
+                return None
+
+            self._records(self.books_file)
+            if day in (user.get('dailyUnlockHistory') or {}):
+                plan = user.get('lastDailyUnlock')
+                if not plan or plan.get('date') != day:
+                    return {'user': dict(user), 'summaries': [], 'newBookId': None, 'alreadyUnlocked': True}
+                self._unlock_plan_progress(user_id, plan)
+                return {'user': dict(user), 'summaries': self._plan_summaries(plan),
+                        'newBookId': plan.get('newBookId'), 'alreadyUnlocked': True}
+
+            unlocked_of = lambda book_id: self._unlocked_summary_ids(user_id, book_id)
+            plan = user.get('pendingDailyUnlock')
+            if not plan_is_valid(user, plan, day, unlocked_of, self._summary_exists):
+                plan = plan_daily_unlock(user, day, self._sorted_summaries, unlocked_of, self._next_unlock_book)
+
+            updated = apply_daily_unlock(user, plan, datetime.now().isoformat())
+            user = users[user_id] = {**updated, 'syncSeq': self._next_seq(self.users_file)}
+            self._commit(self.users_file, [{'op': 'put', 'record': user}])
+            self._unlock_plan_progress(user_id, plan)
+
+        return {'user': dict(user), 'summaries': self._plan_summaries(plan),
+                'newBookId': plan['newBookId'], 'alreadyUnlocked': False}
+
+    def plan_daily_unlocks(self, day: str) -> int:
+        """預先計算所有使用者指定日期的解鎖計畫（存於 pendingDailyUnlock），整批只寫入一次
+
+        當天已解鎖的使用者略過；回傳建立計畫的使用者數。
+        """
+        # 同一批次中每本書的摘要只排序一次
+        summaries_of = lru_cache(maxsize=None)(self._sorted_summaries)
+        with self._locked(self.users_file):
+            users = self._records(self.users_file)
+            entries = []
+            for user_id, user in list(users.items()):
+                plan = plan_daily_unlock(
+                    user, day, summaries_of,
+                    lambda book_id: self._unlocked_summary_ids(user_id, book_id), self._next_unlock_book
+                )
+                if plan is None:
+                    continue
+                user = users[user_id] = {
+                    **user, 'pendingDailyUnlock': plan, 'syncSeq': self._next_seq(self.users_file)
+                }
+                entries.append({'op': 'put', 'record': user})
+            if entries:
+                self._commit(self.users_file, entries)
+            return len(entries)
+
+    # 閱讀進度
+    def _book_slots(self, book_id: str) -> List[str]:
+        record = self._records(self.progress_file).get(f'slots:{book_id}')
+        return record['slots'] if record else []
+
+    def _user_progress(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        record = self._records(self.progress_file).get(f'user:{user_id}')
+        return record['books'] if record else {}
+
+    def _unlocked_summary_ids(self, user_id: str, book_id: str) -> Set[str]:
+        entry = self._user_progress(user_id).get(book_id)
+        if not entry:
+            return set()
+        return set(ids_from_bitmap(self._book_slots(book_id), decode_bitmap(entry.get('unlocked'))))
+
+    def _put_progress(self, user_id: str, changes: Dict[str, Dict[str, Iterable[str]]]):
+        """套用多本書的進度更新並一次寫入（呼叫端須持有進度鎖）
+
+        changes 為 書籍ID -> {read_ids, unread_ids, unlocked_ids}；新的摘要先分配槽位，
+        槽位與使用者進度在同一次寫入中持久化。位元沒有變化時不寫入。
+        """
+        records = self._records(self.progress_file)
+        now = datetime.now().isoformat()
+        user_key = f'user:{user_id}'
+        books = dict(self._user_progress(user_id))
+        entries = []
+        changed = False
+        for book_id, change in changes.items():
+            slots = self._book_slots(book_id)
+            entry = books.get(book_id) or {}
+            unlocked, read = decode_bitmap(entry.get('unlocked')), decode_bitmap(entry.get('read'))
+            result = apply_progress(slots, unlocked, read, **change)
+            if result['slots'] is not slots:
+                record = records[f'slots:{book_id}'] = {
+                    'id': f'slots:{book_id}', 'bookId': book_id, 'slots': result['slots']
+                }
+                entries.append({'op': 'put', 'record': record})
+            if entry and (result['unlocked'], result['read']) == (unlocked, read):
+                continue
+            books[book_id] = {
+                'unlocked': encode_bitmap(result['unlocked']),
+                'read': encode_bitmap(result['read']),
+                'updatedAt': now,
+                'lastReadAt': now if change.get('read_ids') else entry.get('lastReadAt'),
+            }
+            changed = True
+        if changed:
+            record = records[user_key] = {'id': user_key, 'userId': user_id, 'books': books, 'updatedAt': now}
+            entries.append({'op': 'put', 'record': record})
+        if not entries:
+            return
+        self._commit(self.progress_file, entries)
+
+    def get_progress(self, user_id: str, book_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """使用者各書的閱讀進度（解碼為摘要ID）；指定 book_id 時只回傳該書"""
+        books = self._user_progress(user_id)
+        book_ids = [book_id] if book_id else list(books)
+        result = []
+        for progress_book_id in book_ids:
+            entry = books.get(progress_book_id)
+            if entry:
+                result.append(book_progress(
+                    progress_book_id, self._book_slots(progress_book_id),
+                    decode_bitmap(entry.get('unlocked')), decode_bitmap(entry.get('read')),
+                    entry.get('updatedAt'), entry.get('lastReadAt')
+                ))
+        return result
+
+    def update_progress(self, user_id: str, book_id: str, read: Iterable[str] = (),
+                        unread: Iterable[str] = (), unlocked: Iterable[str] = ()) -> Dict[str, Any]:
+        """記錄使用者在一本書的已讀/未讀/已解鎖摘要，回傳更新後的進度
+
+        只寫入 progress.json；摘要不屬於該書時拋出 ValueError。
+        """
+        read, unread, unlocked = list(read), list(unread), list(unlocked)
+        self._records(self.books_file)
+        missing = [summary_id for summary_id in read + unread + unlocked
+                   if not self._summary_exists(book_id, summary_id)]
+        if missing:
+            raise ValueError(f"摘要不存在: {', '.join(missing)}")
+
+        with self._locked(self.progress_file):
+            self._put_progress(user_id, {book_id: {'read_ids': read, 'unread_ids': unread, 'unlocked_ids': unlocked}})
+            return self.get_progress(user_id, book_id)[0]
 
     # Summary operations (summaries are stored within books)
+    def _commit_summaries(self, entry: Dict[str, Any]):
+        """套用摘要層級的異動到快取與索引並持久化（呼叫端須持有書籍鎖）
+
+        日誌模式下只附加異動的摘要，不會重寫整本書。
+        """
+        books = self._records(self.books_file)
+        entry['syncSeq'] = self._next_seq(self.books_file)
+        if entry['op'] == 'sput':
+            entry['records'] = [self._stub_summary(summary) for summary in entry['records']]
+            for summary in entry['records']:
+                summary['syncSeq'] = entry['syncSeq']
+        else:
+            self._add_tombstones([
+                {'collection': 'summaries', 'entityId': summary_id, 'bookId': entry['bookId'], 'syncSeq': entry['syncSeq']}
+                for summary_id in entry['ids']
+            ])
+        self._apply_entry(books, entry)
+        if entry['op'] == 'sput':
+            for summary in entry['records']:
+                self._summary_index[summary['id']] = (entry['bookId'], summary)
+        else:
+            for summary_id in entry['ids']:
+                self._summary_index.pop(summary_id, None)
+        if self._search_index is not None and entry['bookId'] in books:
+            self._search_index.index_book(self._book_with_content(books[entry['bookId']]))
+        self._commit(self.books_file, [entry])
+
+    def book_exists(self, book_id: str) -> bool:
+        """書籍是否存在"""
+        return book_id in self._records(self.books_file)
+
     def get_summaries_by_book_id(self, book_id: str) -> List[Dict[str, Any]]:
-        """獲取特定書籍的所有摘要"""
-        book = self.get_book_by_id(book_id)
+        """獲取特定書籍的所有摘要（含完整內容）"""
+        book = self._records(self.books_file).get(book_id)
         if book and 'summaries' in book:
-            return book['summaries']
+            return [self._with_content(summary) for summary in book['summaries']]
         return []
 
     def get_summary_by_id(self, book_id: str, summary_id: str) -> Optional[Dict[str, Any]]:
-        """獲取特定摘要"""
-        summaries = self.get_summaries_by_book_id(book_id)
-        for summary in summaries:
-            if summary.get('id') == summary_id:
-                return summary
-        return None
+        """獲取特定摘要（含完整內容；書籍中只有存根時從區塊存放區載入）"""
+        summary = self._find_summary(book_id, summary_id)
+        return dict(self._with_content(summary)) if summary is not None else None
+
+    def get_summary_cache_stats(self) -> Dict[str, Any]:
+        """摘要內容 LRU 快取的統計"""
+        return self._blobs.stats()
 
     def create_summary(self, book_id: str, summary_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """在書籍中創建新摘要"""
-        book = self.get_book_by_id(book_id)
-        if not book:
-            return None
+        created = self.create_summaries(book_id, [summary_data])
+        return created[0] if created else None
 
-        # 生成ID如果沒有提供
-        if 'id' not in summary_data or not summary_data['id']:
-            summary_data['id'] = str(uuid.uuid4())
+    def create_summaries(self, book_id: str, summaries_data: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """在書籍中批次創建摘要，只寫入一次"""
+        with self._locked(self.books_file):
+            if not self.book_exists(book_id):
+                return None
 
-        # 設定書籍ID
-        summary_data['bookId'] = book_id
+            for summary_data in summaries_data:
+                # 生成ID如果沒有提供
+                if 'id' not in summary_data or not summary_data['id']:
+                    summary_data['id'] = str(uuid.uuid4())
 
-        # 確保book有summaries欄位
-        if 'summaries' not in book:
-            book['summaries'] = []
+                # 設定書籍ID
+                summary_data['bookId'] = book_id
 
-        book['summaries'].append(summary_data)
+            self._commit_summaries({
+                'op': 'sput',
+                'bookId': book_id,
+                'records': [dict(summary_data) for summary_data in summaries_data],
+                'updatedAt': datetime.now().isoformat()
+            })
+            return summaries_data
 
-        # 更新整本書
-        self.update_book(book_id, book)
-        return summary_data
+    def update_summary(self, book_id: str, summary_id: str, summary_data: Dict[str, Any], merge: bool = False) -> Optional[Dict[str, Any]]:
+        """更新摘要；merge=True 時在鎖內與現有資料合併"""
+        with self._locked(self.books_file):
+            summary = self.get_summary_by_id(book_id, summary_id)
+            if not summary:
+                return None
 
-    def update_summary(self, book_id: str, summary_id: str, summary_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """更新摘要"""
-        book = self.get_book_by_id(book_id)
-        if not book or 'summaries' not in book:
-            return None
+            if merge:
+                summary_data = {**summary, **summary_data}
 
-        for i, summary in enumerate(book['summaries']):
-            if summary.get('id') == summary_id:
-                # 保持原有的ID和書籍ID
-                summary_data['id'] = summary_id
-                summary_data['bookId'] = book_id
+            # 保持原有的ID和書籍ID
+            summary_data['id'] = summary_id
+            summary_data['bookId'] = book_id
 
-                book['summaries'][i] = summary_data
-                self.update_book(book_id, book)
-                return summary_data
-
-        return None
+            self._commit_summaries({
+                'op': 'sput',
+                'bookId': book_id,
+                'records': [dict(summary_data)],
+                'updatedAt': datetime.now().isoformat()
+            })
+            return summary_data
 
     def delete_summary(self, book_id: str, summary_id: str) -> bool:
         """刪除摘要"""
-        book = self.get_book_by_id(book_id)
-        if not book or 'summaries' not in book:
-            return False
-
-        original_length = len(book['summaries'])
-        book['summaries'] = [s for s in book['summaries'] if s.get('id') != summary_id]
+        with self._locked(self.books_file):
+            if not self.get_summary_by_id(book_id, summary_id):
+                return False
 
-        if len(book['summaries']) < original_length:
-            self.update_book(book_id, book)
+            self._commit_summaries({
+                'op': 'sdel',
+                'bookId': book_id,
+                'ids': [summary_id],
+                'updatedAt': datetime.now().isoformat()
+            })
             return True
-        return False
+
+
+def create_storage():
+    """依環境變數建立儲存後端
+
+    STORAGE_BACKEND=json（預設）或 sqlite；SQLITE_PATH 指定資料庫檔案；
+    STORAGE_JOURNAL=1 啟用 JSON 日誌模式；STORAGE_STAT_INTERVAL 指定
+    JSON 後端最多間隔幾秒檢查一次檔案是否被程式以外的方式修改（0 表示每次讀取都檢查）；
+    STORAGE_GROUP_COMMIT_MS 啟用 JSON 後端的群組提交並指定時間窗口上限（毫秒，建議 2–5），
+    STORAGE_GROUP_COMMIT_OPS 指定累積幾筆異動時立即寫入；STORAGE_SHARDED=1 將書籍
+    分片存放在 data/books/（需先執行 migrate_to_shards.py）；STORAGE_SNAPSHOT=binary 改用
+    二進位書籍快照 data/books.snap（需先執行 migrate_to_snapshot.py）；STORAGE_SUMMARY_BLOBS=1
+    將摘要內容存到 data/summaries/，書籍中只保留存根（既有資料以 migrate_summary_blobs.py 轉換）；
+    SYNC_TOMBSTONE_DAYS 指定增量同步的刪除紀錄保留天數（預設 30，0 表示永久保留）。
+    """
+    backend = os.getenv("STORAGE_BACKEND", "json").lower()
+    if backend == "sqlite":
+        from services.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(os.getenv("SQLITE_PATH", os.path.join("data", "lightnote.db")))
+    if backend != "json":
+        raise ValueError(f"不支援的儲存後端: {backend}")
+    return JSONStorage(
+        journal=os.getenv("STORAGE_JOURNAL") == "1",
+        stat_interval=float(os.getenv("STORAGE_STAT_INTERVAL", DEFAULT_STAT_INTERVAL)),
+        group_commit_window=float(os.getenv("STORAGE_GROUP_COMMIT_MS", "0")) / 1000,
+        group_commit_ops=int(os.getenv("STORAGE_GROUP_COMMIT_OPS", DEFAULT_GROUP_COMMIT_OPS)),
+        sharded=os.getenv("STORAGE_SHARDED") == "1",
+        snapshot=os.getenv("STORAGE_SNAPSHOT", "json").lower(),
+        summary_blobs=os.getenv("STORAGE_SUMMARY_BLOBS") == "1",
+        tombstone_days=float(os.getenv("SYNC_TOMBSTONE_DAYS", DEFAULT_TOMBSTONE_DAYS)),
+    )
 
 # 全域實例
-storage = JSONStorage()
\ No newline at end of file
+storage = create_storage()
@@ -0,0 +1,150 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List
+
+try:
+    import fcntl
+except ImportError:  # Windows 不支援 fcntl，僅使用行程內鎖
+    fcntl = None
+
+
+class LockStats:
+    """鎖等待時間統計"""
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float, contended: bool = False):
+        self.acquisitions += 1
+        self.contended += int(contended)
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """鎖競爭統計（毫秒）"""
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "total_wait_ms": round(self.total_wait * 1000, 3),
+            "avg_wait_ms": round(self.total_wait * 1000 / self.acquisitions, 3) if self.acquisitions else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+class CollectionLock:
+    """單一資料集合的鎖：行程內可重入鎖 + 跨行程檔案鎖，並記錄等待時間"""
+
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        # 保留檔案鎖：群組提交有尚未寫入的異動時，釋放行程內鎖但不讓其他行程寫入
+        self._retained = False
+        self._stats = LockStats()
+        # 正在等待行程內鎖的執行緒數（群組提交依此判斷是否還有寫入要加入批次）
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+        # 最外層取得與釋放時各加一（奇數表示有執行緒持有）；不取鎖的讀取端比對前後的值，
+        # 確認讀取期間沒有人修改受這個鎖保護的資料
+        self.epoch = 0
+
+    @contextmanager
+    def hold(self):
+        """取得鎖；同一執行緒可重入，只有最外層會取得檔案鎖"""
+        start = time.perf_counter()
+        contended = not self._lock.acquire(blocking=False)
+        if contended:
+            with self._waiting_lock:
+                self._waiting += 1
+            try:
+                self._lock.acquire()
+            finally:
+                with self._waiting_lock:
+                    self._waiting -= 1
+        try:
+            if self._depth == 0:
+                if self._fd is None:
+                    self._acquire_file_lock()
+                self._stats.record(time.perf_counter() - start, contended)
+                self.epoch += 1
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.epoch += 1
+                    if not self._retained:
+                        self._release_file_lock()
+        finally:
+            self._lock.release()
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def retain(self):
+        """最外層釋放時保留檔案鎖，直到 release_retained（呼叫端須持有鎖）"""
+        self._retained = True
+
+    def release_retained(self):
+        """取消保留，最外層釋放時一併釋放檔案鎖（呼叫端須持有鎖）"""
+        self._retained = False
+
+    def _acquire_file_lock(self):
+        """取得跨行程的獨占檔案鎖（uvicorn 多 worker 時避免互相覆寫）"""
+        if fcntl is None:
+            return
+        self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def _release_file_lock(self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def stats(self) -> Dict[str, Any]:
+        """鎖競爭統計（毫秒）"""
+        return self._stats.as_dict()
+
+
+class SharedCounters:
+    """跨行程共用的版本計數器：以 mmap 對應到小檔案，每個名稱佔 8 位元組
+
+    寫入端在集合鎖內遞增，其他 worker 讀取共享記憶體即可得知資料是否變動，
+    不需要每個請求都 stat 檔案。
+    """
+
+    SLOT_SIZE = 8
+
+    def __init__(self, path: str, names: List[str]):
+        self.path = path
+        self._offsets = {name: i * self.SLOT_SIZE for i, name in enumerate(names)}
+        size = len(names) * self.SLOT_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # 只會變大：多個行程同時建立時，較晚的不會清掉已寫入的計數
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def get(self, name: str) -> int:
+        return struct.unpack_from('<Q', self._map, self._offsets[name])[0]
+
+    def bump(self, name: str) -> int:
+        """遞增並回傳新值（呼叫端須持有該集合的跨行程鎖）"""
+        value = self.get(name) + 1
+        struct.pack_into('<Q', self._map, self._offsets[name], value)
+        return value
@@ -0,0 +1,99 @@
+import base64
+from typing import Dict, Any, List, Optional, Iterable, Set
+
+# 每位使用者在每本書的閱讀進度以兩個位元圖表示（unlocked / read），
+# 第 i 個位元對應該書第 i 個摘要槽位。槽位依摘要第一次被記錄的順序分配、只增不減，
+# 摘要刪除或重新排序都不會改變既有使用者的位元。
+
+
+def bitmap_to_bytes(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def bitmap_from_bytes(data: Optional[bytes]) -> int:
+    return int.from_bytes(data or b'', 'little')
+
+
+def encode_bitmap(bits: int) -> str:
+    """位元圖編碼為 base64 字串（JSON 儲存用）"""
+    return base64.b64encode(bitmap_to_bytes(bits)).decode()
+
+
+def decode_bitmap(text: Optional[str]) -> int:
+    return bitmap_from_bytes(base64.b64decode(text)) if text else 0
+
+
+def assign_slots(slots: List[str], summary_ids: Iterable[str]) -> List[str]:
+    """為尚未分配槽位的摘要分配新槽位，回傳新的槽位列表（沒有新摘要時回傳原列表）"""
+    known = set(slots)
+    new_ids = [summary_id for summary_id in dict.fromkeys(summary_ids) if summary_id not in known]
+    return slots + new_ids if new_ids else slots
+
+
+def slot_mask(slots: List[str], summary_ids: Iterable[str]) -> int:
+    """摘要ID對應的位元（摘要須已分配槽位）"""
+    positions = {summary_id: i for i, summary_id in enumerate(slots)}
+    mask = 0
+    for summary_id in summary_ids:
+        mask |= 1 << positions[summary_id]
+    return mask
+
+
+def ids_from_bitmap(slots: List[str], bits: int) -> List[str]:
+    """位元圖轉回摘要ID（依槽位順序）"""
+    return [summary_id for i, summary_id in enumerate(slots) if bits >> i & 1]
+
+
+def apply_progress(slots: List[str], unlocked: int, read: int,
+                   read_ids: Iterable[str] = (), unread_ids: Iterable[str] = (),
+                   unlocked_ids: Iterable[str] = ()) -> Dict[str, Any]:
+    """套用一次進度更新，回傳 {slots, unlocked, read}；已讀的摘要同時視為已解鎖"""
+    read_ids, unread_ids, unlocked_ids = list(read_ids), list(unread_ids), list(unlocked_ids)
+    slots = assign_slots(slots, read_ids + unread_ids + unlocked_ids)
+    read_mask = slot_mask(slots, read_ids)
+    read = (read | read_mask) & ~slot_mask(slots, unread_ids)
+    unlocked |= read_mask | slot_mask(slots, unlocked_ids)
+    return {'slots': slots, 'unlocked': unlocked, 'read': read}
+
+
+def book_progress(book_id: str, slots: List[str], unlocked: int, read: int,
+                  updated_at: Optional[str], last_read_at: Optional[str]) -> Dict[str, Any]:
+    """解碼後的單本書進度（API 回傳格式）"""
+    return {
+        'bookId': book_id,
+        'unlockedSummaryIds': ids_from_bitmap(slots, unlocked),
+        'readSummaryIds': ids_from_bitmap(slots, read),
+        'updatedAt': updated_at,
+        'lastReadAt': last_read_at,
+    }
+
+
+def merge_book_progress(book: Dict[str, Any], user: Dict[str, Any],
+                        progress: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """以使用者的進度覆蓋書籍中共用的 isUnlocked/isFavorite/isRead 等欄位，回傳新的書籍物件
+
+    進度位元圖不記錄各摘要的解鎖與閱讀時間，因此移除共用的 unlockedAt/readAt，
+    不以 null 表示；使用者是否讀完全書放在 userCompleted，isCompleted 保留書籍本身的欄位。
+    """
+    unlocked: Set[str] = set(progress['unlockedSummaryIds']) if progress else set()
+    read: Set[str] = set(progress['readSummaryIds']) if progress else set()
+    summaries = []
+    for summary in book.get('summaries') or []:
+        summaries.append({
+            **{k: v for k, v in summary.items() if k not in ('unlockedAt', 'readAt')},
+            'isUnlocked': summary.get('id') in unlocked,
+            'isRead': summary.get('id') in read,
+        })
+    book_id = book.get('id')
+    merged = {
+        **book,
+        'summaries': summaries,
+        'isUnlocked': book_id in (user.get('unlockedBookIds') or []),
+        'isFavorite': book_id in (user.get('favoriteBookIds') or []),
+        'userCompleted': bool(summaries) and all(summary['isRead'] for summary in summaries),
+        'readCount': sum(1 for summary in summaries if summary['isRead']),
+        'unlockedCount': sum(1 for summary in summaries if summary['isUnlocked']),
+        'lastReadAt': progress['lastReadAt'] if progress else None,
+    }
+    merged.pop('unlockedAt', None)
+    return merged
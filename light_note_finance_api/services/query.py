@@ -0,0 +1,66 @@
+import base64
+from typing import List, Dict, Any, Optional
+
+# 書籍列表預設不含摘要內容，只回傳摘要數量
+LIST_EXCLUDED_FIELDS = {"summaries"}
+ALL_FIELDS = "*"
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """解析 fields= 參數；None 表示使用預設欄位，['*'] 表示全部欄位"""
+    if fields is None:
+        return None
+    parsed = [field.strip() for field in fields.split(',') if field.strip()]
+    return parsed or None
+
+
+def project_book(book: Dict[str, Any], fields: Optional[List[str]],
+                 summary_count: Optional[int] = None) -> Dict[str, Any]:
+    """依欄位清單投影書籍資料；summary_count 未提供時由 summaries 計算"""
+    if summary_count is None:
+        summary_count = len(book.get('summaries') or [])
+    if fields is None:
+        projected = {k: v for k, v in book.items() if k not in LIST_EXCLUDED_FIELDS}
+        projected['summaryCount'] = summary_count
+        return projected
+    if ALL_FIELDS in fields:
+        return dict(book)
+
+    projected = {k: book[k] for k in fields if k in book}
+    if 'summaryCount' in fields:
+        projected['summaryCount'] = summary_count
+    projected.setdefault('id', book.get('id'))
+    return projected
+
+
+def wants_summaries(fields: Optional[List[str]]) -> bool:
+    """投影結果是否需要摘要內容"""
+    return fields is not None and (ALL_FIELDS in fields or 'summaries' in fields)
+
+
+def matches_filters(book: Dict[str, Any], is_published: Optional[bool], is_completed: Optional[bool]) -> bool:
+    """書籍是否符合 isPublished / isCompleted 篩選條件"""
+    if is_published is not None and bool(book.get('isPublished', True)) != is_published:
+        return False
+    if is_completed is not None and bool(book.get('isCompleted', False)) != is_completed:
+        return False
+    return True
+
+
+def encode_cursor(position: int) -> str:
+    """將位置編碼為不透明的分頁游標"""
+    return base64.urlsafe_b64encode(str(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """解碼分頁游標，無效時拋出 ValueError"""
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError("無效的分頁游標")
+    if position < 0:
+        raise ValueError("無效的分頁游標")
+    return position
@@ -0,0 +1,37 @@
+import base64
+import json
+import uuid
+from typing import Dict, Any, Optional
+
+
+def prepare_new_book(book_data: Dict[str, Any], now: str):
+    """為新書籍補上ID、時間戳記與摘要ID"""
+    # 生成ID如果沒有提供
+    if 'id' not in book_data or not book_data['id']:
+        book_data['id'] = str(uuid.uuid4())
+
+    # 添加創建時間
+    book_data['createdAt'] = now
+    book_data['updatedAt'] = now
+
+    for summary in book_data.get('summaries') or []:
+        if not summary.get('id'):
+            summary['id'] = str(uuid.uuid4())
+        summary['bookId'] = book_data['id']
+
+
+def encode_sync_cursor(seqs: Dict[str, int]) -> str:
+    """將各集合的同步序號編碼為不透明的同步游標"""
+    return base64.urlsafe_b64encode(json.dumps(seqs, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_sync_cursor(cursor: Optional[str]) -> Dict[str, int]:
+    """解碼同步游標，無效時拋出 ValueError"""
+    if not cursor:
+        return {'books': 0, 'users': 0}
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        seqs = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return {'books': int(seqs.get('books', 0)), 'users': int(seqs.get('users', 0))}
+    except Exception:
+        raise ValueError("無效的同步游標")
@@ -0,0 +1,223 @@
+import html
+import math
+import re
+import threading
+import unicodedata
+from typing import Dict, Any, List, Optional, Tuple, Iterable, Set
+
+# 中日韓文字：以二字詞（bigram）建立索引，不需要斷詞字典
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af"
+_TOKEN = re.compile(f"([{_CJK}]+)|([0-9a-z]+)")
+
+# 欄位權重：標題命中比內文重要
+FIELD_WEIGHTS = {"title": 3, "description": 1, "content": 1}
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_RADIUS = 30
+
+
+def normalize(text: str) -> str:
+    """全形轉半形並轉小寫，索引與查詢使用相同的正規化"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """將文字切成索引詞：英數字以單字為單位，中文以相鄰二字為單位
+
+    單獨一個中文字（前後不是中文）保留為單字詞。
+    """
+    tokens = []
+    for match in _TOKEN.finditer(normalize(text)):
+        cjk, word = match.groups()
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def _highlight(text: str, phrases: List[str]) -> Optional[str]:
+    """擷取第一個命中附近的片段，以 <mark> 標示所有命中的詞（其餘文字做 HTML 跳脫）"""
+    normalized = normalize(text)
+    # 正規化改變長度時（少見），改以正規化後的文字產生片段，確保位置對應正確
+    source = text if len(normalized) == len(text) else normalized
+
+    spans = []
+    for phrase in phrases:
+        start = normalized.find(phrase)
+        while start != -1:
+            spans.append((start, start + len(phrase)))
+            start = normalized.find(phrase, start + len(phrase))
+    if not spans:
+        return None
+
+    # 合併重疊的命中範圍
+    spans.sort()
+    merged = [spans[0]]
+    for start, end in spans[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    window_start = max(0, merged[0][0] - SNIPPET_RADIUS)
+    window_end = min(len(source), merged[0][1] + SNIPPET_RADIUS * 2)
+    parts = ["…" if window_start > 0 else ""]
+    position = window_start
+    for start, end in merged:
+        if start >= window_end:
+            break
+        end = min(end, window_end)
+        parts.append(html.escape(source[position:start]))
+        parts.append(f"<mark>{html.escape(source[start:end])}</mark>")
+        position = end
+    parts.append(html.escape(source[position:window_end]))
+    parts.append("…" if window_end < len(source) else "")
+    return "".join(parts)
+
+
+class SearchIndex:
+    """書籍標題、簡介與摘要內容的倒排索引（BM25 排序）
+
+    文件分為書籍（title、description）與摘要（content）兩類，
+    以書籍為單位增量更新。所有操作都在鎖內進行，可由多個執行緒共用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # 文件編號 → (中繼資料, 各欄位原文, 索引詞, 長度)
+        self._docs: Dict[int, Tuple[Dict[str, Any], Dict[str, str], Set[str], int]] = {}
+        self._book_docs: Dict[str, List[int]] = {}
+        self._next_doc = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # 維護
+    def rebuild(self, books: Iterable[Dict[str, Any]]):
+        """清空後重新建立索引"""
+        with self._lock:
+            self._postings = {}
+            self._docs = {}
+            self._book_docs = {}
+            self._total_length = 0
+            for book in books:
+                self._add_book(book)
+
+    def index_book(self, book: Dict[str, Any]):
+        """新增或更新一本書（含其摘要）"""
+        with self._lock:
+            self._remove_book(book.get("id"))
+            self._add_book(book)
+
+    def remove_book(self, book_id: str):
+        with self._lock:
+            self._remove_book(book_id)
+
+    def _add_book(self, book: Dict[str, Any]):
+        book_id = book.get("id")
+        if not book_id:
+            return
+        title = book.get("title") or ""
+        doc_ids = [self._add_doc(
+            {"type": "book", "bookId": book_id, "bookTitle": title},
+            {"title": title, "description": book.get("description") or ""},
+        )]
+        for summary in book.get("summaries") or []:
+            doc_ids.append(self._add_doc(
+                {"type": "summary", "bookId": book_id, "bookTitle": title,
+                 "summaryId": summary.get("id"), "order": summary.get("order")},
+                {"content": summary.get("content") or ""},
+            ))
+        self._book_docs[book_id] = doc_ids
+
+    def _add_doc(self, meta: Dict[str, Any], fields: Dict[str, str]) -> int:
+        doc_id = self._next_doc
+        self._next_doc += 1
+        weighted: Dict[str, int] = {}
+        length = 0
+        for field, text in fields.items():
+            tokens = tokenize(text)
+            length += len(tokens)
+            for token in tokens:
+                weighted[token] = weighted.get(token, 0) + FIELD_WEIGHTS[field]
+        for token, tf in weighted.items():
+            self._postings.setdefault(token, {})[doc_id] = tf
+        self._docs[doc_id] = (meta, fields, set(weighted), length)
+        self._total_length += length
+        return doc_id
+
+    def _remove_book(self, book_id: Optional[str]):
+        for doc_id in self._book_docs.pop(book_id, []):
+            _, _, terms, length = self._docs.pop(doc_id)
+            self._total_length -= length
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    # 查詢
+    def _term_postings(self, term: str) -> Dict[int, int]:
+        """單一中文字沒有獨立的索引詞，合併所有包含該字的二字詞"""
+        postings = self._postings.get(term)
+        if postings is not None or len(term) != 1 or term.isascii():
+            return postings or {}
+        merged: Dict[int, int] = {}
+        for key, docs in self._postings.items():
+            if term in key:
+                for doc_id, tf in docs.items():
+                    merged[doc_id] = merged.get(doc_id, 0) + tf
+        return merged
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+        """搜尋所有詞都出現的文件，依 BM25 分數排序，回傳 (該頁命中, 總數)"""
+        phrases = [phrase for phrase in normalize(query).split() if phrase]
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+
+        with self._lock:
+            postings = [self._term_postings(term) for term in terms]
+            if not all(postings):
+                return [], 0
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for docs in postings[1:]:
+                candidates &= docs.keys()
+
+            # 二字詞都命中不代表整段詞語相連出現，再以原文確認
+            matched = [
+                doc_id for doc_id in candidates
+                if all(any(phrase in normalize(text) for text in self._docs[doc_id][1].values()) for phrase in phrases)
+            ]
+
+            doc_count = len(self._docs)
+            average_length = self._total_length / doc_count if doc_count else 1.0
+            scored = []
+            for doc_id in matched:
+                length = self._docs[doc_id][3]
+                score = 0.0
+                for docs in postings:
+                    tf = docs[doc_id]
+                    idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                    score += idf * tf * (BM25_K1 + 1) / (
+                        tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1.0)))
+                scored.append((score, doc_id))
+            scored.sort(key=lambda item: (-item[0], item[1]))
+
+            hits = []
+            for score, doc_id in scored[offset:offset + limit]:
+                meta, fields, _, _ = self._docs[doc_id]
+                highlights = {}
+                for field, text in fields.items():
+                    snippet = _highlight(text, phrases)
+                    if snippet is not None:
+                        highlights[field] = snippet
+                hits.append({**meta, "score": round(score, 4), "highlights": highlights})
+            return hits, len(scored)
@@ -0,0 +1,318 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import weakref
+from collections.abc import MutableMapping
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Iterable
+
+from services.file_modes import inherit_mode
+
+try:
+    import orjson
+except ImportError:  # 未安裝 orjson 時使用標準 json
+    orjson = None
+
+# 書籍二進位快照（data/books.snap）
+#
+#   [檔頭] MAGIC(8) | 書籍表位移 u64 | 書籍表長度 u64 | 最大同步序號 u64
+#   [書籍區塊]* 每本書連續存放：書籍欄位(不含摘要) | 各摘要 | 摘要表
+#   [書籍表]   JSON 陣列，每列 [id, 區塊位移, 書籍欄位長度, 摘要表位移, 摘要表長度, 摘要數, 最大同步序號]
+#
+# 摘要表為 [[摘要ID, 位移, 長度], ...]，位移相對於所屬區塊開頭，因此區塊可以原樣複製到新快照。
+# 每個欄位與摘要都是獨立的 JSON 片段，讀取時只解碼需要的部分。
+MAGIC = b"LNBSNAP1"
+HEADER = struct.Struct("<8sQQQ")
+
+# 書籍表欄位
+_OFFSET, _HEAD_LENGTH, _TABLE_OFFSET, _TABLE_LENGTH, _COUNT, _MAX_SEQ = range(1, 7)
+
+
+def _dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
+
+def _book_max_seq(book: Dict[str, Any]) -> int:
+    return max([book.get('syncSeq', 0)] + [summary.get('syncSeq', 0) for summary in book.get('summaries') or []])
+
+
+def _encode_book(book: Dict[str, Any]) -> Tuple[bytes, int, int, int]:
+    """編碼單本書的區塊，回傳 (區塊, 書籍欄位長度, 摘要表位移, 摘要表長度)"""
+    head = _dumps({k: v for k, v in book.items() if k != 'summaries'})
+    parts = [head]
+    position = len(head)
+    table = []
+    for summary in book.get('summaries') or []:
+        data = _dumps(summary)
+        table.append([summary.get('id'), position, len(data)])
+        parts.append(data)
+        position += len(data)
+    table_data = _dumps(table)
+    parts.append(table_data)
+    return b''.join(parts), len(head), position, len(table_data)
+
+
+class BookSnapshot:
+    """唯讀的書籍快照，以 mmap 對應檔案；開啟時只解碼書籍表
+
+    檔案被新快照取代後，已開啟的對應仍指向舊內容。取代後呼叫 retire，
+    等所有以此快照為底的 LazyBooks（含讀取端的複本）都釋放後才關閉對應。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+        # 使用中的 LazyBooks 數與是否已被新快照取代
+        self._users = 0
+        self._retired = False
+        self._state_lock = threading.Lock()
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, table_offset, table_length, max_seq = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是書籍快照檔: {path}")
+        self.max_seq = max_seq
+        self._rows: Dict[str, list] = {
+            row[0]: row for row in _loads(self._view(table_offset, table_length))
+        }
+
+    def _view(self, offset: int, length: int) -> memoryview:
+        return memoryview(self._map)[offset:offset + length]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def acquire(self):
+        with self._state_lock:
+            self._users += 1
+
+    def release(self):
+        with self._state_lock:
+            self._users -= 1
+            if self._retired and self._users <= 0:
+                self.close()
+
+    def retire(self):
+        """已被新快照取代：沒有使用者時立即關閉，否則在最後一個使用者釋放時關閉"""
+        with self._state_lock:
+            self._retired = True
+            if self._users <= 0:
+                self.close()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, book_id: str) -> bool:
+        return book_id in self._rows
+
+    def ids(self) -> List[str]:
+        return list(self._rows)
+
+    def max_seq_of(self, book_id: str) -> int:
+        """書籍與其摘要中最大的同步序號"""
+        return self._rows[book_id][_MAX_SEQ]
+
+    def summary_count(self, book_id: str) -> int:
+        return self._rows[book_id][_COUNT]
+
+    def head(self, book_id: str) -> Dict[str, Any]:
+        """書籍欄位（不含摘要）"""
+        row = self._rows[book_id]
+        return _loads(self._view(row[_OFFSET], row[_HEAD_LENGTH]))
+
+    def _summary_table(self, row: list) -> List[list]:
+        return _loads(self._view(row[_OFFSET] + row[_TABLE_OFFSET], row[_TABLE_LENGTH]))
+
+    def summary_ids(self, book_id: str) -> List[str]:
+        return [entry[0] for entry in self._summary_table(self._rows[book_id])]
+
+    def summaries(self, book_id: str) -> List[Dict[str, Any]]:
+        row = self._rows[book_id]
+        return [_loads(self._view(row[_OFFSET] + offset, length)) for _, offset, length in self._summary_table(row)]
+
+    def summary(self, book_id: str, summary_id: str) -> Optional[Dict[str, Any]]:
+        """只解碼單一摘要"""
+        row = self._rows[book_id]
+        for entry_id, offset, length in self._summary_table(row):
+            if entry_id == summary_id:
+                return _loads(self._view(row[_OFFSET] + offset, length))
+        return None
+
+    def book(self, book_id: str) -> Dict[str, Any]:
+        book = self.head(book_id)
+        book['summaries'] = self.summaries(book_id)
+        return book
+
+    def chunk(self, book_id: str) -> Tuple[memoryview, list]:
+        """書籍區塊的原始位元組與書籍表列（寫入新快照時直接複製）"""
+        row = self._rows[book_id]
+        return self._view(row[_OFFSET], row[_TABLE_OFFSET] + row[_TABLE_LENGTH]), row
+
+
+class LazyBooks(MutableMapping):
+    """以快照為底的書籍集合：未修改的書籍每次存取時才從快照解碼，修改過的書籍存於記憶體
+
+    保留與 dict 相同的鍵順序語意（更新既有書籍不改變位置，新書籍加在最後）。
+    """
+
+    def __init__(self, snapshot: BookSnapshot):
+        self.snapshot = snapshot
+        self._order: Dict[str, None] = dict.fromkeys(snapshot.ids())
+        self._modified: Dict[str, Dict[str, Any]] = {}
+        self._hold()
+
+    def _hold(self):
+        """登記為快照的使用者，物件回收時釋放（讓被取代的快照在沒有讀取端後關閉）"""
+        self.snapshot.acquire()
+        weakref.finalize(self, self.snapshot.release)
+
+    def __getitem__(self, book_id: str) -> Dict[str, Any]:
+        book = self._modified.get(book_id)
+        if book is not None:
+            return book
+        if book_id in self._order:
+            return self.snapshot.book(book_id)
+        raise KeyError(book_id)
+
+    def __setitem__(self, book_id: str, book: Dict[str, Any]):
+        self._modified[book_id] = book
+        self._order.setdefault(book_id)
+
+    def __delitem__(self, book_id: str):
+        del self._order[book_id]
+        self._modified.pop(book_id, None)
+
+    def __contains__(self, book_id) -> bool:
+        return book_id in self._order
+
+    def __iter__(self) -> Iterator[str]:
+        # 先取鍵的快照，迭代期間其他執行緒寫入也不會出錯
+        return iter(list(self._order))
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def values(self) -> List[Dict[str, Any]]:
+        """所有書籍（會解碼全部未修改的書籍）"""
+        books = []
+        for book_id in list(self._order):
+            try:
+                books.append(self[book_id])
+            except KeyError:
+                pass
+        return books
+
+    def copy(self) -> "LazyBooks":
+        """淺層複本（共用快照），供在鎖內取得一致的快照後於鎖外讀取"""
+        copied = LazyBooks.__new__(LazyBooks)
+        copied.snapshot = self.snapshot
+        copied._order = dict(self._order)
+        copied._modified = dict(self._modified)
+        copied._hold()
+        return copied
+
+    def is_modified(self, book_id: str) -> bool:
+        return book_id in self._modified
+
+    def modified_values(self) -> List[Dict[str, Any]]:
+        return list(self._modified.values())
+
+    def head(self, book_id: str) -> Tuple[Dict[str, Any], int]:
+        """(不含摘要的書籍欄位, 摘要數)，未修改的書籍不解碼摘要"""
+        book = self._modified.get(book_id)
+        if book is not None:
+            return {k: v for k, v in book.items() if k != 'summaries'}, len(book.get('summaries') or [])
+        return self.snapshot.head(book_id), self.snapshot.summary_count(book_id)
+
+    def heads(self) -> Iterator[Tuple[Dict[str, Any], int]]:
+        for book_id in list(self._order):
+            try:
+                yield self.head(book_id)
+            except KeyError:
+                continue
+
+    def summary(self, book_id: str, summary_id: str) -> Optional[Dict[str, Any]]:
+        book = self._modified.get(book_id)
+        if book is not None:
+            return next((s for s in book.get('summaries') or [] if s.get('id') == summary_id), None)
+        if book_id not in self._order:
+            return None
+        return self.snapshot.summary(book_id, summary_id)
+
+    def summary_ids(self, book_id: str) -> List[str]:
+        book = self._modified.get(book_id)
+        if book is not None:
+            return [summary.get('id') for summary in book.get('summaries') or []]
+        return self.snapshot.summary_ids(book_id)
+
+    def changed_since(self, book_id: str, seq: int) -> bool:
+        """書籍或其摘要的同步序號是否大於 seq"""
+        book = self._modified.get(book_id)
+        if book is not None:
+            return _book_max_seq(book) > seq
+        return self.snapshot.max_seq_of(book_id) > seq
+
+
+def write_snapshot(path: str, books: Iterable[Dict[str, Any]] = (), lazy: Optional[LazyBooks] = None):
+    """寫入新快照（先寫暫存檔再原子替換）
+
+    提供 lazy 時以其內容寫入，未修改的書籍直接複製原快照的區塊，不需解碼再編碼；
+    否則寫入 books。
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'\0' * HEADER.size)
+            position = HEADER.size
+            rows = []
+            max_seq = 0
+
+            def add(book_id: str, chunk, head_length: int, table_offset: int, table_length: int,
+                    count: int, book_seq: int):
+                nonlocal position, max_seq
+                f.write(chunk)
+                rows.append([book_id, position, head_length, table_offset, table_length, count, book_seq])
+                position += len(chunk)
+                max_seq = max(max_seq, book_seq)
+
+            if lazy is not None:
+                for book_id in list(lazy):
+                    if lazy.is_modified(book_id) or book_id not in lazy.snapshot:
+                        book = lazy.get(book_id)
+                        if book is None:
+                            continue
+                        add(book_id, *_encode_book(book), len(book.get('summaries') or []), _book_max_seq(book))
+                    else:
+                        chunk, row = lazy.snapshot.chunk(book_id)
+                        add(book_id, chunk, *row[_HEAD_LENGTH:])
+            else:
+                for i, book in enumerate(books):
+                    # 缺少ID的資料仍保留，與 JSON 快照相同
+                    add(book.get('id') or f"__noid_{i}", *_encode_book(book),
+                        len(book.get('summaries') or []), _book_max_seq(book))
+
+            table = _dumps(rows)
+            f.write(table)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, position, len(table), max_seq))
+            f.flush()
+            os.fsync(f.fileno())
+        inherit_mode(tmp_path, path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
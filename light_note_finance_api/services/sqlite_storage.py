@@ -0,0 +1,860 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Set
+
+from services.locks import LockStats
+from services.records import prepare_new_book, encode_sync_cursor, decode_sync_cursor
+from services.query import project_book, wants_summaries, encode_cursor, decode_cursor
+from services.search import SearchIndex
+from services.daily_unlock import plan_daily_unlock, plan_is_valid, apply_daily_unlock
+from services.user_ops import validate_operations, apply_user_operations
+from services.progress import (
+    apply_progress, book_progress, bitmap_to_bytes, bitmap_from_bytes, decode_bitmap, ids_from_bitmap
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    is_published INTEGER NOT NULL DEFAULT 1,
+    is_completed INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    id TEXT PRIMARY KEY,
+    book_id TEXT NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    ord INTEGER NOT NULL DEFAULT 0,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_book ON summaries(book_id, position);
+
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    created_at TEXT,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+
+-- 集合版本號，由觸發器在每次異動時遞增（供 ETag 使用）
+CREATE TABLE IF NOT EXISTS collection_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO collection_versions (name) VALUES ('books'), ('users');
+
+-- 異動紀錄：每筆資料只保留最後一次異動，供增量同步使用
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    book_id TEXT,
+    op TEXT NOT NULL,
+    UNIQUE (collection, entity_id)
+);
+
+-- 閱讀進度：每位使用者每本書一列，以位元圖記錄已解鎖/已讀的摘要槽位
+CREATE TABLE IF NOT EXISTS summary_slots (
+    book_id TEXT NOT NULL,
+    summary_id TEXT NOT NULL,
+    slot INTEGER NOT NULL,
+    PRIMARY KEY (book_id, summary_id)
+);
+
+CREATE TABLE IF NOT EXISTS progress (
+    user_id TEXT NOT NULL,
+    book_id TEXT NOT NULL,
+    unlocked BLOB NOT NULL,
+    read BLOB NOT NULL,
+    updated_at TEXT,
+    last_read_at TEXT,
+    PRIMARY KEY (user_id, book_id)
+);
+"""
+
+VERSION_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS {table}_{event}_version AFTER {event} ON {table}
+BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = '{collection}';
+END;
+"""
+
+CHANGE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS {table}_{event}_change AFTER {event} ON {table}
+BEGIN
+    -- 觸發器內的 OR REPLACE 會被外層 UPSERT 的衝突處理取代，改為先刪後插
+    DELETE FROM changes WHERE collection = '{table}' AND entity_id = {ref}.id;
+    INSERT INTO changes (collection, entity_id, book_id, op)
+    VALUES ('{table}', {ref}.id, {book_ref}, '{op}');
+END;
+"""
+
+# 以 IN (...) 查詢時每批的最大ID數量
+IN_CHUNK_SIZE = 500
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class SQLiteStorage:
+    """SQLite 儲存後端，提供與 JSONStorage 相同的方法介面
+
+    書籍與摘要分表存放：books 只存書籍欄位，summaries 以 book_id + position
+    建立索引並保留原本的列表順序；完整資料以 JSON 存在 data 欄位。
+    """
+
+    def __init__(self, db_path: str = os.path.join("data", "lightnote.db")):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+        # 每個執行緒各自持有一條連線
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # fork 後從父行程繼承的連線（只保留參照，見 after_fork）
+        self._inherited: List[sqlite3.Connection] = []
+        self._write_stats = LockStats()
+
+        # 全文搜尋索引：第一次搜尋時建立，之後依 changes 資料表增量更新
+        self._search_index: Optional[SearchIndex] = None
+        self._search_seq = 0
+        self._search_lock = threading.Lock()
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        for table, collection in (('books', 'books'), ('summaries', 'books'), ('users', 'users')):
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.executescript(VERSION_TRIGGER.format(table=table, event=event, collection=collection))
+                ref = 'OLD' if event == 'DELETE' else 'NEW'
+                conn.executescript(CHANGE_TRIGGER.format(
+                    table=table, event=event, ref=ref,
+                    book_ref=f'{ref}.book_id' if table == 'summaries' else 'NULL',
+                    op='del' if event == 'DELETE' else 'put'
+                ))
+
+    def _conn(self) -> sqlite3.Connection:
+        """取得目前執行緒的連線"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """寫入交易；BEGIN IMMEDIATE 先取得寫入鎖，讀取-修改-寫入不會互相覆蓋
+
+        巢狀呼叫時沿用最外層的交易。
+        """
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        self._write_stats.record(time.perf_counter() - start)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get_lock_stats(self) -> Dict[str, Any]:
+        """寫入交易的鎖等待統計"""
+        return {"database": self._write_stats.as_dict()}
+
+    def get_summary_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """摘要內容快取統計；SQLite 的摘要本來就是獨立的資料列，沒有另外的內容快取"""
+        return None
+
+    def compact(self):
+        """將 WAL 內容寫回主資料庫檔"""
+        self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        """關閉所有連線"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    # 多行程
+    def preload(self, search_index: Optional[bool] = None):
+        """建立搜尋索引（search_index=False 時略過）；生產模式在 fork worker 前呼叫"""
+        if search_index is not False:
+            self.search("")
+
+    def after_fork(self):
+        """在 fork 出的子行程中呼叫：SQLite 連線不可跨行程使用，子行程改用新的連線
+
+        繼承的連線保留在 _inherited 中，既不使用也不關閉：在子行程關閉（包含被回收時
+        自動關閉）父行程開啟的 SQLite 連線會影響父行程的鎖與 WAL 狀態。
+        """
+        # fork 時其他執行緒可能持有鎖，子行程只有目前的執行緒，不取鎖直接換新
+        self._inherited.extend(self._connections)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._search_lock = threading.Lock()
+
+    # 資料列轉換
+    def _book_from_row(self, row: sqlite3.Row, summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        book = json.loads(row['data'])
+        book['summaries'] = summaries
+        return book
+
+    def _load_summaries(self, conn: sqlite3.Connection, book_id: str) -> List[Dict[str, Any]]:
+        rows = conn.execute(
+            "SELECT data FROM summaries WHERE book_id = ? ORDER BY position", (book_id,)
+        )
+        return [json.loads(row['data']) for row in rows]
+
+    def _write_book(self, conn: sqlite3.Connection, book: Dict[str, Any]):
+        """寫入書籍及其摘要（整本取代）"""
+        summaries = book.get('summaries') or []
+        data = {k: v for k, v in book.items() if k != 'summaries'}
+        conn.execute(
+            """INSERT INTO books (id, title, is_published, is_completed, created_at, updated_at, data)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET
+                   title = excluded.title,
+                   is_published = excluded.is_published,
+                   is_completed = excluded.is_completed,
+                   created_at = excluded.created_at,
+                   updated_at = excluded.updated_at,
+                   data = excluded.data""",
+            (book['id'], book.get('title', ''), int(book.get('isPublished', True)),
+             int(book.get('isCompleted', False)), book.get('createdAt'), book.get('updatedAt'),
+             _dumps(data))
+        )
+        conn.execute("DELETE FROM summaries WHERE book_id = ?", (book['id'],))
+        self._insert_summaries(conn, book['id'], summaries, 0)
+
+    def _insert_summaries(self, conn: sqlite3.Connection, book_id: str,
+                          summaries: Iterable[Dict[str, Any]], start_position: int):
+        rows = []
+        for i, summary in enumerate(summaries):
+            if not summary.get('id'):
+                summary['id'] = str(uuid.uuid4())
+            rows.append((summary['id'], book_id, summary.get('order', 0), start_position + i, _dumps(summary)))
+        conn.executemany(
+            "INSERT OR REPLACE INTO summaries (id, book_id, ord, position, data) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def _write_user(self, conn: sqlite3.Connection, user: Dict[str, Any]):
+        conn.execute(
+            """INSERT INTO users (id, created_at, updated_at, data) VALUES (?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET
+                   created_at = excluded.created_at,
+                   updated_at = excluded.updated_at,
+                   data = excluded.data""",
+            (user['id'], user.get('createdAt'), user.get('updatedAt'), _dumps(user))
+        )
+
+    # Books CRUD
+    def get_all_books(self) -> List[Dict[str, Any]]:
+        """獲取所有書籍"""
+        conn = self._conn()
+        summaries: Dict[str, List[Dict[str, Any]]] = {}
+        for row in conn.execute("SELECT book_id, data FROM summaries ORDER BY book_id, position"):
+            summaries.setdefault(row['book_id'], []).append(json.loads(row['data']))
+        return [
+            self._book_from_row(row, summaries.get(row['id'], []))
+            for row in conn.execute("SELECT id, data FROM books ORDER BY rowid")
+        ]
+
+    def list_books(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                   is_published: Optional[bool] = None, is_completed: Optional[bool] = None,
+                   fields: Optional[List[str]] = None,
+                   with_content: bool = False) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分頁、篩選並投影書籍列表，回傳 (書籍, 下一頁游標)；游標為 rowid
+
+        摘要內容一律存在資料列中，with_content 僅為與 JSON 後端相容。
+        """
+        conn = self._conn()
+        where = ["rowid > ?"]
+        params: List[Any] = [decode_cursor(cursor)]
+        if is_published is not None:
+            where.append("is_published = ?")
+            params.append(int(is_published))
+        if is_completed is not None:
+            where.append("is_completed = ?")
+            params.append(int(is_completed))
+        sql = f"SELECT rowid, id, data FROM books WHERE {' AND '.join(where)} ORDER BY rowid"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        rows = conn.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['rowid'])
+
+        book_ids = [row['id'] for row in rows]
+        placeholders = ','.join('?' * len(book_ids))
+        summaries: Dict[str, List[Dict[str, Any]]] = {}
+        counts: Dict[str, int] = {}
+        if book_ids and wants_summaries(fields):
+            for row in conn.execute(
+                f"SELECT book_id, data FROM summaries WHERE book_id IN ({placeholders}) ORDER BY book_id, position",
+                book_ids
+            ):
+                summaries.setdefault(row['book_id'], []).append(json.loads(row['data']))
+        elif book_ids:
+            # 只需要摘要數量時不讀取摘要內容
+            for row in conn.execute(
+                f"SELECT book_id, COUNT(*) AS n FROM summaries WHERE book_id IN ({placeholders}) GROUP BY book_id",
+                book_ids
+            ):
+                counts[row['book_id']] = row['n']
+
+        items = [
+            project_book(self._book_from_row(row, summaries.get(row['id'], [])), fields,
+                         counts.get(row['id'], 0) if row['id'] not in summaries else None)
+            for row in rows
+        ]
+        return items, next_cursor
+
+    def get_books_version(self) -> str:
+        """書籍集合的版本號，任何書籍或摘要異動都會改變"""
+        row = self._conn().execute("SELECT version FROM collection_versions WHERE name = 'books'").fetchone()
+        return str(row['version'])
+
+    def get_book_version(self, book_id: str) -> Optional[str]:
+        """單本書籍的版本（updatedAt），書籍不存在時回傳 None"""
+        row = self._conn().execute("SELECT updated_at FROM books WHERE id = ?", (book_id,)).fetchone()
+        return (row['updated_at'] or '') if row else None
+
+    def get_book_by_id(self, book_id: str, with_content: bool = False) -> Optional[Dict[str, Any]]:
+        """根據ID獲取書籍（摘要一律含內容，with_content 僅為與 JSON 後端相容）"""
+        conn = self._conn()
+        row = conn.execute("SELECT data FROM books WHERE id = ?", (book_id,)).fetchone()
+        if not row:
+            return None
+        return self._book_from_row(row, self._load_summaries(conn, book_id))
+
+    def iter_books(self, page_size: int = 200) -> Iterator[Dict[str, Any]]:
+        """逐本產生書籍（含摘要），以 rowid 分頁查詢，記憶體用量固定
+
+        每頁重新取得目前執行緒的連線，產生器可以跨執行緒迭代。
+        """
+        last_rowid = 0
+        while True:
+            conn = self._conn()
+            rows = conn.execute(
+                "SELECT rowid, id, data FROM books WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._book_from_row(row, self._load_summaries(conn, row['id']))
+            last_rowid = rows[-1]['rowid']
+
+    def iter_book_heads(self) -> Iterator[Dict[str, Any]]:
+        """逐本產生不含摘要的書籍欄位（圖片引用等只需書籍欄位的掃描用），不查詢摘要"""
+        rows = self._conn().execute("SELECT data FROM books ORDER BY rowid").fetchall()
+        for row in rows:
+            yield json.loads(row['data'])
+
+    def create_book(self, book_data: Dict[str, Any]) -> Dict[str, Any]:
+        """創建新書籍"""
+        return self.create_books([book_data])[0]
+
+    def create_books(self, books_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批次創建書籍（單一交易）"""
+        now = datetime.now().isoformat()
+        for book_data in books_data:
+            prepare_new_book(book_data, now)
+
+        with self._transaction() as conn:
+            for book_data in books_data:
+                self._write_book(conn, book_data)
+        return books_data
+
+    def update_book(self, book_id: str, book_data: Dict[str, Any], merge: bool = False) -> Optional[Dict[str, Any]]:
+        """更新書籍；merge=True 時在交易內與現有資料合併"""
+        with self._transaction() as conn:
+            book = self.get_book_by_id(book_id)
+            if not book:
+                return None
+
+            if merge:
+                book_data = {**book, **book_data}
+
+            # 保持原有的ID和創建時間
+            book_data['id'] = book_id
+            book_data['createdAt'] = book.get('createdAt', datetime.now().isoformat())
+            book_data['updatedAt'] = datetime.now().isoformat()
+
+            self._write_book(conn, book_data)
+            return book_data
+
+    def delete_book(self, book_id: str) -> bool:
+        """刪除書籍（摘要隨外鍵一併刪除）"""
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM books WHERE id = ?", (book_id,)).rowcount > 0
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+        """全文搜尋書籍標題、簡介與摘要內容，回傳 (該頁命中, 總數)
+
+        索引常駐記憶體；每次查詢前套用 changes 資料表中新的異動，
+        其他行程的寫入也會反映到索引。
+        """
+        with self._search_lock:
+            conn = self._conn()
+            latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            if self._search_index is None:
+                # 先取得序號再建立：建立期間的異動會在下次查詢時重新套用（重複套用無妨）
+                index = SearchIndex()
+                index.rebuild(self.iter_books())
+                self._search_index = index
+            elif latest > self._search_seq:
+                rows = conn.execute(
+                    "SELECT entity_id, book_id, collection FROM changes "
+                    "WHERE seq > ? AND collection IN ('books', 'summaries')",
+                    (self._search_seq,)
+                ).fetchall()
+                book_ids = {row['entity_id'] if row['collection'] == 'books' else row['book_id'] for row in rows}
+                for book_id in book_ids:
+                    book = self.get_book_by_id(book_id)
+                    if book:
+                        self._search_index.index_book(book)
+                    else:
+                        self._search_index.remove_book(book_id)
+            self._search_seq = latest
+            index = self._search_index
+        return index.search(query, offset, limit)
+
+    # Users CRUD
+    def get_all_users(self) -> List[Dict[str, Any]]:
+        """獲取所有使用者"""
+        return [json.loads(row['data']) for row in self._conn().execute("SELECT data FROM users ORDER BY rowid")]
+
+    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """根據ID獲取使用者"""
+        row = self._conn().execute("SELECT data FROM users WHERE id = ?", (user_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def create_user(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
+        """創建新使用者"""
+        # 生成ID如果沒有提供
+        if 'id' not in user_data or not user_data['id']:
+            user_data['id'] = str(uuid.uuid4())
+
+        # 添加創建時間
+        user_data['createdAt'] = datetime.now().isoformat()
+        user_data['updatedAt'] = datetime.now().isoformat()
+
+        with self._transaction() as conn:
+            self._write_user(conn, user_data)
+        return user_data
+
+    def update_user(self, user_id: str, user_data: Dict[str, Any], merge: bool = False) -> Optional[Dict[str, Any]]:
+        """更新使用者；merge=True 時在交易內與現有資料合併"""
+        with self._transaction() as conn:
+            user = self.get_user_by_id(user_id)
+            if not user:
+                return None
+
+            if merge:
+                user_data = {**user, **user_data}
+
+            # 保持原有的ID和創建時間
+            user_data['id'] = user_id
+            user_data['createdAt'] = user.get('createdAt', datetime.now().isoformat())
+            user_data['updatedAt'] = datetime.now().isoformat()
+
+            self._write_user(conn, user_data)
+            return user_data
+
+    def patch_user(self, user_id: str, operations: List[Dict[str, Any]]) -> Optional[Tuple[Dict[str, Any], List[Any]]]:
+        """在交易內依序套用原子操作（increment/add/remove/toggle/push），回傳 (使用者, 各操作結果)
+
+        沒有變更時不寫入；使用者不存在時回傳 None，操作不合法時拋出 ValueError。
+        """
+        validate_operations(operations)
+        with self._transaction() as conn:
+            user = self.get_user_by_id(user_id)
+            if not user:
+                return None
+
+            updated, results, changed = apply_user_operations(
+                user, operations, lambda field: set(user.get(field) or [])
+            )
+            if changed:
+                updated['updatedAt'] = datetime.now().isoformat()
+                self._write_user(conn, updated)
+            return updated, results
+
+    def delete_user(self, user_id: str) -> bool:
+        """刪除使用者"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM progress WHERE user_id = ?", (user_id,))
+            return conn.execute("DELETE FROM users WHERE id = ?", (user_id,)).rowcount > 0
+
+    # 每日解鎖
+    def _sorted_summaries(self, book_id: str) -> List[Dict[str, Any]]:
+        """書籍的摘要依 order 排序（order 相同時依原本順序）"""
+        rows = self._conn().execute(
+            "SELECT data FROM summaries WHERE book_id = ? ORDER BY ord, position", (book_id,)
+        )
+        return [json.loads(row['data']) for row in rows]
+
+    def _next_unlock_book(self, excluded: set) -> Optional[str]:
+        """依目錄順序找出第一本未解鎖、已上架且有摘要的書籍"""
+        rows = self._conn().execute(
+            """SELECT id FROM books WHERE is_published = 1
+               AND EXISTS (SELECT 1 FROM summaries WHERE summaries.book_id = books.id)
+               ORDER BY rowid"""
+        )
+        for row in rows:
+            if row['id'] not in excluded:
+                return row['id']
+        return None
+
+    def _summary_exists(self, book_id: str, summary_id: str) -> bool:
+        return self.get_summary_by_id(book_id, summary_id) is not None
+
+    def _plan_summaries(self, plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """計畫中仍存在的摘要"""
+        summaries = []
+        for book_id, summary_ids in plan['summaryIds'].items():
+            for summary_id in summary_ids:
+                summary = self.get_summary_by_id(book_id, summary_id)
+                if summary:
+                    summaries.append(summary)
+        return summaries
+
+    def _unlock_plan_progress(self, conn: sqlite3.Connection, user_id: str, plan: Dict[str, Any]):
+        self._put_progress(conn, user_id, {
+            book_id: {'unlocked_ids': summary_ids} for book_id, summary_ids in plan['summaryIds'].items()
+        })
+
+    def daily_unlock(self, user_id: str, day: str) -> Optional[Dict[str, Any]]:
+        """解鎖使用者當天的摘要，回傳 {user, summaries, newBookId, alreadyUnlocked}；使用者不存在時回傳 None
+
+        選擇摘要、更新使用者與寫入閱讀進度在同一個交易內完成；有預先計算且仍有效的計畫時直接套用。
+        """
+        with self._transaction() as conn:
+            user = self.get_user_by_id(user_id)
+            if not user:
+                return None
+
+            if day in (user.get('dailyUnlockHistory') or {}):
+                plan = user.get('lastDailyUnlock')
+                if not plan or plan.get('date') != day:
+                    return {'user': user, 'summaries': [], 'newBookId': None, 'alreadyUnlocked': True}
+                return {'user': user, 'summaries': self._plan_summaries(plan),
+                        'newBookId': plan.get('newBookId'), 'alreadyUnlocked': True}
+
+            unlocked_of = lambda book_id: self._unlocked_summary_ids(user_id, book_id)
+            plan = user.get('pendingDailyUnlock')
+            if not plan_is_valid(user, plan, day, unlocked_of, self._summary_exists):
+                plan = plan_daily_unlock(user, day, self._sorted_summaries, unlocked_of, self._next_unlock_book)
+
+            user = apply_daily_unlock(user, plan, datetime.now().isoformat())
+            self._write_user(conn, user)
+            self._unlock_plan_progress(conn, user_id, plan)
+            summaries = self._plan_summaries(plan)
+        return {'user': user, 'summaries': summaries, 'newBookId': plan['newBookId'], 'alreadyUnlocked': False}
+
+    def plan_daily_unlocks(self, day: str) -> int:
+        """預先計算所有使用者指定日期的解鎖計畫（存於 pendingDailyUnlock），在單一交易內寫入
+
+        當天已解鎖的使用者略過；回傳建立計畫的使用者數。
+        """
+        summaries_of = lru_cache(maxsize=None)(self._sorted_summaries)
+        planned = 0
+        with self._transaction() as conn:
+            for user in self.get_all_users():
+                plan = plan_daily_unlock(
+                    user, day, summaries_of,
+                    lambda book_id: self._unlocked_summary_ids(user['id'], book_id), self._next_unlock_book
+                )
+                if plan is None:
+                    continue
+                self._write_user(conn, {**user, 'pendingDailyUnlock': plan})
+                planned += 1
+        return planned
+
+    # 閱讀進度
+    def _book_slots(self, book_id: str) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT summary_id FROM summary_slots WHERE book_id = ? ORDER BY slot", (book_id,)
+        )
+        return [row['summary_id'] for row in rows]
+
+    def _progress_row(self, user_id: str, book_id: str) -> Optional[sqlite3.Row]:
+        return self._conn().execute(
+            "SELECT * FROM progress WHERE user_id = ? AND book_id = ?", (user_id, book_id)
+        ).fetchone()
+
+    def _unlocked_summary_ids(self, user_id: str, book_id: str) -> Set[str]:
+        row = self._progress_row(user_id, book_id)
+        if row is None:
+            return set()
+        return set(ids_from_bitmap(self._book_slots(book_id), bitmap_from_bytes(row['unlocked'])))
+
+    def _put_progress(self, conn: sqlite3.Connection, user_id: str,
+                      changes: Dict[str, Dict[str, Iterable[str]]]):
+        """套用多本書的進度更新（呼叫端須在交易內）；新的摘要先分配槽位，位元沒有變化時不寫入"""
+        now = datetime.now().isoformat()
+        for book_id, change in changes.items():
+            slots = self._book_slots(book_id)
+            row = self._progress_row(user_id, book_id)
+            unlocked = bitmap_from_bytes(row['unlocked']) if row else 0
+            read = bitmap_from_bytes(row['read']) if row else 0
+            result = apply_progress(slots, unlocked, read, **change)
+            conn.executemany(
+                "INSERT INTO summary_slots (book_id, summary_id, slot) VALUES (?, ?, ?)",
+                [(book_id, summary_id, slot)
+                 for slot, summary_id in enumerate(result['slots'][len(slots):], start=len(slots))]
+            )
+            if row is not None and (result['unlocked'], result['read']) == (unlocked, read):
+                continue
+            conn.execute(
+                """INSERT INTO progress (user_id, book_id, unlocked, read, updated_at, last_read_at)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(user_id, book_id) DO UPDATE SET
+                       unlocked = excluded.unlocked,
+                       read = excluded.read,
+                       updated_at = excluded.updated_at,
+                       last_read_at = excluded.last_read_at""",
+                (user_id, book_id, bitmap_to_bytes(result['unlocked']), bitmap_to_bytes(result['read']),
+                 now, now if change.get('read_ids') else (row['last_read_at'] if row else None))
+            )
+
+    def get_progress(self, user_id: str, book_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """使用者各書的閱讀進度（解碼為摘要ID）；指定 book_id 時只回傳該書"""
+        if book_id:
+            rows = [row for row in [self._progress_row(user_id, book_id)] if row is not None]
+        else:
+            rows = self._conn().execute(
+                "SELECT * FROM progress WHERE user_id = ? ORDER BY rowid", (user_id,)
+            ).fetchall()
+        return [
+            book_progress(row['book_id'], self._book_slots(row['book_id']),
+                          bitmap_from_bytes(row['unlocked']), bitmap_from_bytes(row['read']),
+                          row['updated_at'], row['last_read_at'])
+            for row in rows
+        ]
+
+    def update_progress(self, user_id: str, book_id: str, read: Iterable[str] = (),
+                        unread: Iterable[str] = (), unlocked: Iterable[str] = ()) -> Dict[str, Any]:
+        """記錄使用者在一本書的已讀/未讀/已解鎖摘要，回傳更新後的進度
+
+        只寫入 progress 與 summary_slots 資料表；摘要不屬於該書時拋出 ValueError。
+        """
+        read, unread, unlocked = list(read), list(unread), list(unlocked)
+        missing = [summary_id for summary_id in read + unread + unlocked
+                   if not self._summary_exists(book_id, summary_id)]
+        if missing:
+            raise ValueError(f"摘要不存在: {', '.join(missing)}")
+
+        with self._transaction() as conn:
+            self._put_progress(conn, user_id, {book_id: {'read_ids': read, 'unread_ids': unread, 'unlocked_ids': unlocked}})
+            return self.get_progress(user_id, book_id)[0]
+
+    # Summary operations
+    def book_exists(self, book_id: str) -> bool:
+        """書籍是否存在"""
+        return self._conn().execute("SELECT 1 FROM books WHERE id = ?", (book_id,)).fetchone() is not None
+
+    def get_summaries_by_book_id(self, book_id: str) -> List[Dict[str, Any]]:
+        """獲取特定書籍的所有摘要"""
+        return self._load_summaries(self._conn(), book_id)
+
+    def get_summary_by_id(self, book_id: str, summary_id: str) -> Optional[Dict[str, Any]]:
+        """獲取特定摘要"""
+        row = self._conn().execute(
+            "SELECT data FROM summaries WHERE id = ? AND book_id = ?", (summary_id, book_id)
+        ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def _touch_book(self, conn: sqlite3.Connection, book_id: str):
+        """更新書籍的 updatedAt（與 JSONStorage 行為一致）"""
+        row = conn.execute("SELECT data FROM books WHERE id = ?", (book_id,)).fetchone()
+        data = json.loads(row['data'])
+        data['updatedAt'] = datetime.now().isoformat()
+        conn.execute(
+            "UPDATE books SET updated_at = ?, data = ? WHERE id = ?",
+            (data['updatedAt'], _dumps(data), book_id)
+        )
+
+    def create_summary(self, book_id: str, summary_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """在書籍中創建新摘要"""
+        created = self.create_summaries(book_id, [summary_data])
+        return created[0] if created else None
+
+    def create_summaries(self, book_id: str, summaries_data: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """在書籍中批次創建摘要（單一交易）"""
+        with self._transaction() as conn:
+            if not self.book_exists(book_id):
+                return None
+
+            for summary_data in summaries_data:
+                # 生成ID如果沒有提供
+                if 'id' not in summary_data or not summary_data['id']:
+                    summary_data['id'] = str(uuid.uuid4())
+
+                # 設定書籍ID
+                summary_data['bookId'] = book_id
+
+            position = conn.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM summaries WHERE book_id = ?", (book_id,)
+            ).fetchone()[0]
+            self._insert_summaries(conn, book_id, summaries_data, position)
+            self._touch_book(conn, book_id)
+            return summaries_data
+
+    def update_summary(self, book_id: str, summary_id: str, summary_data: Dict[str, Any], merge: bool = False) -> Optional[Dict[str, Any]]:
+        """更新摘要；merge=True 時在交易內與現有資料合併"""
+        with self._transaction() as conn:
+            summary = self.get_summary_by_id(book_id, summary_id)
+            if not summary:
+                return None
+
+            if merge:
+                summary_data = {**summary, **summary_data}
+
+            # 保持原有的ID和書籍ID
+            summary_data['id'] = summary_id
+            summary_data['bookId'] = book_id
+
+            conn.execute(
+                "UPDATE summaries SET ord = ?, data = ? WHERE id = ?",
+                (summary_data.get('order', 0), _dumps(summary_data), summary_id)
+            )
+            self._touch_book(conn, book_id)
+            return summary_data
+
+    def delete_summary(self, book_id: str, summary_id: str) -> bool:
+        """刪除摘要"""
+        with self._transaction() as conn:
+            deleted = conn.execute(
+                "DELETE FROM summaries WHERE id = ? AND book_id = ?", (summary_id, book_id)
+            ).rowcount > 0
+            if deleted:
+                self._touch_book(conn, book_id)
+            return deleted
+
+    # 增量同步
+    def _fetch_by_ids(self, conn: sqlite3.Connection, sql: str, ids: List[str]) -> List[sqlite3.Row]:
+        """分批以 IN (...) 查詢"""
+        rows: List[sqlite3.Row] = []
+        for i in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = ids[i:i + IN_CHUNK_SIZE]
+            rows.extend(conn.execute(sql.format(placeholders=','.join('?' * len(chunk))), chunk))
+        return rows
+
+    def get_changes(self, since: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """取得游標之後新增、修改或刪除的書籍、摘要與使用者
+
+        since 為 None 時回傳全部資料。所有查詢在同一個讀取交易中執行，
+        看到的是同一個快照。
+        """
+        cursor = decode_sync_cursor(since)
+        since_seq = min(cursor['books'], cursor['users'])
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            changes: Dict[str, Any] = {
+                'books': [],
+                'summaries': [],
+                'users': [],
+                'deleted': {'books': [], 'summaries': [], 'users': []},
+            }
+
+            if since is None:
+                book_rows = conn.execute("SELECT id, data FROM books ORDER BY rowid").fetchall()
+                summary_rows = conn.execute("SELECT data FROM summaries ORDER BY book_id, position").fetchall()
+                user_rows = conn.execute("SELECT data FROM users ORDER BY rowid").fetchall()
+            else:
+                updated: Dict[str, List[str]] = {'books': [], 'summaries': [], 'users': []}
+                for row in conn.execute(
+                    "SELECT collection, entity_id, book_id, op FROM changes WHERE seq > ? ORDER BY seq", (since_seq,)
+                ):
+                    if row['op'] == 'put':
+                        updated[row['collection']].append(row['entity_id'])
+                    elif row['collection'] == 'summaries':
+                        changes['deleted']['summaries'].append({'id': row['entity_id'], 'bookId': row['book_id']})
+                    elif row['collection'] == 'books' or user_id is None or row['entity_id'] == user_id:
+                        changes['deleted'][row['collection']].append(row['entity_id'])
+                book_rows = self._fetch_by_ids(
+                    conn, "SELECT id, data FROM books WHERE id IN ({placeholders}) ORDER BY rowid", updated['books'])
+                summary_rows = self._fetch_by_ids(
+                    conn, "SELECT data FROM summaries WHERE id IN ({placeholders}) ORDER BY book_id, position",
+                    updated['summaries'])
+                user_rows = self._fetch_by_ids(
+                    conn, "SELECT data FROM users WHERE id IN ({placeholders}) ORDER BY rowid", updated['users'])
+
+            counts = {
+                row['book_id']: row['n'] for row in self._fetch_by_ids(
+                    conn, "SELECT book_id, COUNT(*) AS n FROM summaries WHERE book_id IN ({placeholders}) GROUP BY book_id",
+                    [row['id'] for row in book_rows])
+            }
+            changes['books'] = [
+                project_book(self._book_from_row(row, []), None, counts.get(row['id'], 0)) for row in book_rows
+            ]
+            changes['summaries'] = [json.loads(row['data']) for row in summary_rows]
+            users = [json.loads(row['data']) for row in user_rows]
+            changes['users'] = [user for user in users if user_id is None or user.get('id') == user_id]
+        finally:
+            conn.execute("COMMIT")
+
+        changes['cursor'] = encode_sync_cursor({'books': seq, 'users': seq})
+        # changes 資料表每筆資料只保留一列，不會清除刪除紀錄，不需要完整同步
+        changes['resync'] = False
+        return changes
+
+    # 遷移
+    def import_json(self, books: List[Dict[str, Any]], users: List[Dict[str, Any]],
+                    progress: Iterable[Dict[str, Any]] = ()):
+        """一次性匯入 JSONStorage 的資料（含 progress.json），保留原有的ID與時間戳記"""
+        with self._transaction() as conn:
+            for book in books:
+                if not book.get('id'):
+                    book['id'] = str(uuid.uuid4())
+                self._write_book(conn, book)
+            for user in users:
+                if not user.get('id'):
+                    user['id'] = str(uuid.uuid4())
+                self._write_user(conn, user)
+            for record in progress:
+                if 'slots' in record:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO summary_slots (book_id, summary_id, slot) VALUES (?, ?, ?)",
+                        [(record['bookId'], summary_id, slot) for slot, summary_id in enumerate(record['slots'])]
+                    )
+                    continue
+                conn.executemany(
+                    """INSERT OR REPLACE INTO progress (user_id, book_id, unlocked, read, updated_at, last_read_at)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    [(record['userId'], book_id, bitmap_to_bytes(decode_bitmap(entry.get('unlocked'))),
+                      bitmap_to_bytes(decode_bitmap(entry.get('read'))), entry.get('updatedAt'), entry.get('lastReadAt'))
+                     for book_id, entry in record['books'].items()]
+                )
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Iterator
+
+from services.file_modes import inherit_mode
+
+# 摘要內容快取上限
+CACHE_ENTRIES = int(os.getenv("SUMMARY_CACHE_ENTRIES", "4096"))
+CACHE_BYTES = int(os.getenv("SUMMARY_CACHE_MB", "32")) * 1024 * 1024
+
+# 書籍中摘要的存根欄位（取代 content）
+CONTENT_FIELDS = ('contentHash', 'contentLength')
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def is_stub(summary: Dict[str, Any]) -> bool:
+    return 'contentHash' in summary and 'content' not in summary
+
+
+class SummaryBlobStore:
+    """摘要內容的區塊存放區：data/summaries/{雜湊前兩碼}/{雜湊}.txt
+
+    以內容雜湊為檔名，檔案寫入後不再修改，因此多個 worker 共用時不需要鎖，
+    快取也不會失效；更新摘要內容只會產生新檔案，舊檔案由 prune 清除。
+    最近讀取的內容保留在有上限的 LRU 快取中。
+    """
+
+    def __init__(self, directory: str, max_entries: int = CACHE_ENTRIES, max_bytes: int = CACHE_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest + ".txt")
+
+    def put(self, content: str) -> str:
+        """寫入內容並回傳雜湊（同時放入快取）；相同內容已存在時不重寫"""
+        digest = content_hash(content)
+        path = self.path(digest)
+        try:
+            # 已存在時只更新修改時間，避免剛被重新引用的檔案在提交前被 prune 刪除
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content.encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            inherit_mode(tmp_path, path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._remember(digest, content)
+        return digest
+
+    def get(self, digest: str, cache: bool = True) -> str:
+        """讀取內容；cache=False 時不放入快取（整批讀取用，避免擠掉常用的內容）"""
+        with self._lock:
+            content = self._entries.get(digest)
+            if content is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return content
+            self.misses += 1
+        with open(self.path(digest), 'rb') as f:
+            content = f.read().decode('utf-8')
+        if cache:
+            self._remember(digest, content)
+        return content
+
+    def _remember(self, digest: str, content: str):
+        # 單則內容過大時不快取，避免擠掉其他項目
+        if len(content) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if digest in self._entries:
+                return
+            self._entries[digest] = content
+            self._size += len(content)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+    def _digests(self) -> Iterator[str]:
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name.endswith('.txt'):
+                    yield name[:-4]
+
+    def prune(self, live: Iterable[str], min_age: float = 3600.0) -> int:
+        """刪除未被引用的內容檔，回傳刪除數
+
+        寫入流程是先寫內容再提交書籍，min_age 秒內建立的檔案可能屬於尚未提交的寫入，不會刪除。
+        """
+        live = set(live)
+        cutoff = time.time() - min_age
+        removed = 0
+        for digest in list(self._digests()):
+            if digest in live:
+                continue
+            path = self.path(digest)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
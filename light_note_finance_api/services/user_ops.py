@@ -0,0 +1,97 @@
+from typing import Dict, Any, List, Callable, AbstractSet, Tuple
+
+# 可進行原子操作的使用者欄位
+INTEGER_FIELDS = {'points'}
+SET_FIELDS = {'favoriteBookIds', 'unlockedBookIds'}
+HISTORY_FIELDS = {'viewHistory'}
+# 閱讀紀錄保留的筆數（與 App 相同，新的在前）
+VIEW_HISTORY_LIMIT = 100
+
+# 操作 -> 適用欄位
+OPERATIONS = {
+    'increment': INTEGER_FIELDS,
+    'add': SET_FIELDS,
+    'remove': SET_FIELDS,
+    'toggle': SET_FIELDS,
+    'push': HISTORY_FIELDS,
+}
+
+
+def validate_operations(operations: List[Dict[str, Any]]):
+    """檢查操作格式，不合法時拋出 ValueError"""
+    if not operations:
+        raise ValueError("至少需要一個操作")
+    for operation in operations:
+        op, field, value = operation.get('op'), operation.get('field'), operation.get('value')
+        if op not in OPERATIONS:
+            raise ValueError(f"不支援的操作: {op}")
+        if field not in OPERATIONS[op]:
+            raise ValueError(f"操作 {op} 不適用於欄位: {field}")
+        if op == 'increment':
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError("increment 的 value 必須是整數")
+        elif not isinstance(value, str) or not value:
+            raise ValueError(f"{op} 的 value 必須是非空字串")
+        limit = operation.get('limit')
+        if limit is not None and (not isinstance(limit, int) or limit <= 0):
+            raise ValueError("limit 必須是正整數")
+
+
+def apply_user_operations(user: Dict[str, Any], operations: List[Dict[str, Any]],
+                          members: Callable[[str], AbstractSet[str]]) -> Tuple[Dict[str, Any], List[Any], bool]:
+    """依序套用操作，回傳 (更新後的使用者, 各操作結果, 是否有變更)；不修改傳入的物件
+
+    members(field) 回傳集合欄位目前的成員，用於 O(1) 判斷是否已存在；
+    集合欄位仍以串列儲存並保留加入順序。結果依操作為：increment 回傳新值，
+    add/remove 回傳是否有變更，toggle 回傳操作後是否為成員，push 回傳 None。
+    積分扣到負數時拋出 ValueError，整批操作都不會套用。
+    """
+    updated = dict(user)
+    # 本批次已修改的集合欄位：欄位 -> (串列, 成員集合)
+    working: Dict[str, Tuple[List[str], set]] = {}
+    results: List[Any] = []
+    changed = False
+
+    def member_set(field: str) -> AbstractSet[str]:
+        return working[field][1] if field in working else members(field)
+
+    def edit(field: str) -> Tuple[List[str], set]:
+        if field not in working:
+            working[field] = (list(updated.get(field) or []), set(members(field)))
+        return working[field]
+
+    for operation in operations:
+        op, field, value = operation['op'], operation['field'], operation.get('value')
+        if op == 'increment':
+            new_value = (updated.get(field) or 0) + value
+            if new_value < 0:
+                raise ValueError("積分不足")
+            updated[field] = new_value
+            changed = changed or value != 0
+            results.append(new_value)
+        elif op == 'push':
+            history = [item for item in (updated.get(field) or []) if item != value]
+            updated[field] = [value] + history[:(operation.get('limit') or VIEW_HISTORY_LIMIT) - 1]
+            changed = True
+            results.append(None)
+        else:
+            present = value in member_set(field)
+            if op == 'toggle':
+                op = 'remove' if present else 'add'
+            if op == 'add' and not present:
+                values, value_set = edit(field)
+                values.append(value)
+                value_set.add(value)
+            elif op == 'remove' and present:
+                values, value_set = edit(field)
+                values.remove(value)
+                value_set.discard(value)
+            else:
+                # 已存在時 add、不存在時 remove 不需變更（toggle 一定會變更）
+                results.append(False)
+                continue
+            updated[field] = values
+            changed = True
+            results.append(True if operation['op'] != 'toggle' else op == 'add')
+
+    return updated, results, changed
@@ -1,31 +1,138 @@
 #!/usr/bin/env python3
-import uvicorn
-import sys
+"""啟動 Light Note Finance API
+
+開發模式（預設）：單一行程並自動重載。
+生產模式（--prod）：先在主行程載入資料（與搜尋索引，見 --preload-index），再 fork 多個 worker 共用同一個 socket；
+有安裝 uvloop / httptools 時自動使用。worker 異常結束時由主行程重新啟動。
+"""
+import argparse
+import importlib.util
 import os
+import signal
+import sys
+import time
+
+import uvicorn
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="啟動 Light Note Finance API")
+    parser.add_argument("--prod", action="store_true", help="生產模式：多 worker、不自動重載")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1,
+                        help="生產模式的 worker 數（預設 WEB_CONCURRENCY 或 CPU 核心數）")
+    parser.add_argument("--preload-index", choices=("auto", "on", "off"), default="auto",
+                        help="生產模式 fork 前是否建立搜尋索引（auto：啟用摘要內容分離或二進位快照時不建立）")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    return parser.parse_args()
+
+
+def run_dev(args):
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        reload=True,  # 開發模式下自動重載
+        log_level="info"
+    )
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def run_prod(args):
+    loop = "uvloop" if _installed("uvloop") else "asyncio"
+    http = "httptools" if _installed("httptools") else "h11"
+    print(f"生產模式：{args.workers} 個 worker（loop={loop}, http={http}）")
+
+    if not hasattr(os, "fork"):
+        # Windows 沒有 fork，交由 uvicorn 以 spawn 啟動 worker（各自載入資料）
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                    loop=loop, http=http, log_level="info")
+        return
+
+    # 在 fork 前載入資料（與索引），worker 以寫入時複製的方式共用這些記憶體
+    import main
+    from services.json_storage import storage
+
+    start = time.perf_counter()
+    storage.preload(search_index={"auto": None, "on": True, "off": False}[args.preload_index])
+    print(f"資料預先載入完成（{time.perf_counter() - start:.2f} 秒）")
+
+    config = uvicorn.Config(main.app, host=args.host, port=args.port, loop=loop, http=http,
+                            reload=False, log_level="info")
+    sock = config.bind_socket()
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                storage.after_fork()
+                uvicorn.Server(config).run(sockets=[sock])
+            except BaseException as e:
+                print(f"worker {os.getpid()} 異常結束: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+
+    workers = {spawn() for _ in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"worker {pid} 已結束，重新啟動")
+            time.sleep(1)
+            workers.add(spawn())
+    sock.close()
+    storage.close()
+
 
 if __name__ == "__main__":
     # 確保在正確的目錄中運行
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
+    args = parse_args()
 
     # 運行 FastAPI 應用程式
     try:
         print("啟動 Light Note Finance API...")
-        print("API 文檔: http://localhost:8000/docs")
-        print("API 資訊: http://localhost:8000/api/info")
-        print("健康檢查: http://localhost:8000/api/health")
+        print(f"API 文檔: http://localhost:{args.port}/docs")
+        print(f"API 資訊: http://localhost:{args.port}/api/info")
+        print(f"健康檢查: http://localhost:{args.port}/api/health")
         print("按 Ctrl+C 停止服務器")
 
-        uvicorn.run(
-            "main:app",
-            host="0.0.0.0",
-            port=8000,
-            reload=True,  # 開發模式下自動重載
-            log_level="info"
-        )
+        if args.prod:
+            run_prod(args)
+        else:
+            run_dev(args)
     except KeyboardInterrupt:
         print("\n服務器已停止")
         sys.exit(0)
     except Exception as e:
         print(f"啟動失敗: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,31 @@
+"""原子寫入（暫存檔 + os.replace）不應把資料檔權限改成 mkstemp 的 0600"""
+import os
+import stat
+
+from services import file_modes
+from services.json_storage import JSONStorage
+
+
+def file_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_rewrite_keeps_existing_mode(tmp_path):
+    storage = JSONStorage(str(tmp_path))
+    users_file = os.path.join(str(tmp_path), "users.json")
+    os.chmod(users_file, 0o640)
+    try:
+        storage.create_user({'id': 'u1', 'name': 'A'})
+    finally:
+        storage.close()
+    assert file_mode(users_file) == 0o640
+
+
+def test_new_files_use_umask(tmp_path):
+    storage = JSONStorage(str(tmp_path), summary_blobs=True)
+    try:
+        storage.create_book({'title': 't', 'description': 'd', 'summaries': [{'content': '內容', 'order': 1}]})
+        stub = storage.get_all_books()[0]['summaries'][0]
+    finally:
+        storage.close()
+    assert file_mode(storage._blobs.path(stub['contentHash'])) == 0o644 & ~file_modes._UMASK
@@ -0,0 +1,35 @@
+"""日誌模式：寫入中斷留下的不完整紀錄不應讓之後的寫入在重新啟動後遺失"""
+import os
+
+from services.json_storage import JSONStorage
+
+
+def open_storage(data_dir):
+    # 關閉背景壓縮，確保紀錄留在日誌中
+    return JSONStorage(str(data_dir), journal=True, compact_threshold=10 ** 9, compact_interval=10 ** 9)
+
+
+def test_torn_tail_is_truncated_before_append(tmp_path):
+    storage = open_storage(tmp_path)
+    storage.create_user({'id': 'before', 'name': 'A'})
+    storage.close()
+
+    log_path = os.path.join(str(tmp_path), "users.json.log")
+    complete_size = os.path.getsize(log_path)
+    with open(log_path, 'ab') as f:
+        f.write(b'{"op": "put", "record": {"id": "torn"')
+
+    storage = open_storage(tmp_path)
+    assert os.path.getsize(log_path) == complete_size
+    storage.create_user({'id': 'after', 'name': 'B'})
+    storage.close()
+
+    storage = open_storage(tmp_path)
+    try:
+        assert storage.get_user_by_id('before')['name'] == 'A'
+        assert storage.get_user_by_id('after')['name'] == 'B'
+        assert storage.get_user_by_id('torn') is None
+    finally:
+        storage.close()
+    with open(log_path + ".corrupt", 'rb') as f:
+        assert f.read() == b'{"op": "put", "record": {"id": "torn"'
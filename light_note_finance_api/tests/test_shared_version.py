@@ -0,0 +1,25 @@
+"""多個 worker 共用資料目錄：共享版本變動時即使檔案簽章相同也要重新載入"""
+import os
+
+from services.json_storage import JSONStorage
+
+
+def test_reload_when_version_moves_but_signature_does_not(tmp_path):
+    data_dir = str(tmp_path)
+    first = JSONStorage(data_dir, stat_interval=0)
+    second = JSONStorage(data_dir, stat_interval=0)
+    try:
+        first.create_user({'id': 'u1', 'name': 'aaaa'})
+        assert second.get_user_by_id('u1')['name'] == 'aaaa'
+
+        users_file = os.path.join(data_dir, "users.json")
+        stat = os.stat(users_file)
+        first.update_user('u1', {'name': 'bbbb', 'updatedAt': first.get_user_by_id('u1')['updatedAt']})
+        # 模擬時間戳精度粗的檔案系統：同大小的改寫後 mtime 不變
+        assert os.path.getsize(users_file) == stat.st_size
+        os.utime(users_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        assert second.get_user_by_id('u1')['name'] == 'bbbb'
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,35 @@
+"""增量同步：清除過期的刪除紀錄後，游標早於清除範圍的用戶端改為完整同步"""
+from services.json_storage import JSONStorage
+from services.records import decode_sync_cursor
+
+
+def test_pruned_tombstones_force_full_resync(tmp_path):
+    storage = JSONStorage(str(tmp_path))
+    try:
+        storage.create_book({'id': 'keep', 'title': 'a', 'description': ''})
+        storage.create_book({'id': 'gone', 'title': 'b', 'description': ''})
+        stale_cursor = storage.get_changes()['cursor']
+        storage.delete_book('gone')
+        current = storage.get_changes(stale_cursor)
+        assert current['deleted']['books'] == ['gone'] and not current['resync']
+
+        assert storage.prune_tombstones(max_age_days=1e-9) == 1
+
+        changes = storage.get_changes(stale_cursor)
+        assert changes['resync']
+        assert [book['id'] for book in changes['books']] == ['keep']
+        assert changes['deleted']['books'] == []
+        assert not storage.get_changes(current['cursor'])['resync']
+    finally:
+        storage.close()
+
+    # 重新開啟後新的序號不會重複使用已清除的刪除紀錄的序號
+    storage = JSONStorage(str(tmp_path))
+    try:
+        storage.create_book({'id': 'new', 'title': 'c', 'description': ''})
+        changes = storage.get_changes(current['cursor'])
+        assert not changes['resync']
+        assert [book['id'] for book in changes['books']] == ['new']
+        assert decode_sync_cursor(changes['cursor'])['books'] > decode_sync_cursor(current['cursor'])['books']
+    finally:
+        storage.close()